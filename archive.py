@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Archivo de equipos entregados, particionado por año de ingreso.
+
+Los equipos entregados hace más de ``[Archivo] dias`` (settings.ini, 365
+por defecto) salen de equipos.json y pasan a database/archivo/equipos_AAAA.json
+según el año en que se recibieron. Así el archivo que se lee y reescribe
+en cada operación solo tiene los trabajos activos y recientes.
+
+``DeviceArchive`` lee las particiones solo cuando una consulta las
+necesita: los reportes cargan los años de su periodo y la búsqueda, el
+historial por serie o por cliente y los reingresos construyen sus índices la primera vez
+que se usan. indice.json resume qué años hay y guarda el último ID y el
+último número de factura archivados (también por sucursal), para que la
+numeración nunca retroceda.
+"""
+
+import queries
+import storage
+from indexes import ClientDeviceIndex, FilterIndex, SearchIndex, SerialIndex
+from records import DELIVERED, format_timestamp
+from storage import ARCHIVE_INDEX_FILE
+
+ARCHIVE_AFTER_DAYS = 365
+
+
+def archive_after_days():
+    """Días desde la entrega para archivar un equipo; 0 desactiva el archivo"""
+    return storage.load_settings().getint('Archivo', 'dias', fallback=ARCHIVE_AFTER_DAYS)
+
+
+def partition_year(device):
+    """Año de la partición de un equipo: el de su fecha de ingreso"""
+    date = device.date_received or device.date_delivered
+    return date.year if date else None
+
+
+def split_archivable(devices, cutoff):
+    """Separa (archivables, activos): entregados antes de ``cutoff`` y el resto"""
+    old, keep = [], []
+    for device in devices:
+        if (device.status == "Entregado" and device.date_delivered is not None
+                and device.date_delivered < cutoff):
+            old.append(device)
+        else:
+            keep.append(device)
+    return old, keep
+
+
+class DeviceArchive:
+    """Acceso de solo lectura a las particiones, con caché por firma de archivo.
+
+    Toda escritura del archivo reescribe indice.json después de las
+    particiones, así que su firma basta para saber si la caché sigue vigente.
+    """
+
+    def __init__(self, search_fields=(), compact_fields=()):
+        self.search_fields = search_fields
+        self.compact_fields = compact_fields
+        self.index = storage.load_archive_index()
+        self._index_signature = storage.file_signature(ARCHIVE_INDEX_FILE)
+        self._partitions = {}     # año -> equipos
+        self._search_index = None
+        self._serial_index = None
+        self._client_index = None
+        self._filter_index = None
+
+    def _refresh(self):
+        signature = storage.file_signature(ARCHIVE_INDEX_FILE)
+        if signature != self._index_signature:
+            self.index = storage.load_archive_index()
+            self._index_signature = signature
+            self._partitions = {}
+            self._search_index = None
+            self._serial_index = None
+            self._client_index = None
+            self._filter_index = None
+
+    def years(self):
+        """Años archivados, de menor a mayor"""
+        self._refresh()
+        return sorted(int(year) for year in self.index['years'])
+
+    def __bool__(self):
+        return bool(self.years())
+
+    def partition(self, year):
+        self._refresh()
+        if year not in self._partitions:
+            self._partitions[year] = storage.load_archive_partition(year)
+        return self._partitions[year]
+
+    def devices(self, years=None):
+        """Equipos archivados de los años indicados (todos por defecto)"""
+        result = []
+        for year in self.years() if years is None else years:
+            result.extend(self.partition(year))
+        return result
+
+    def years_between(self, start, end):
+        """Años de las particiones que pueden tener ingresos entre ``start`` y ``end``"""
+        return [y for y in self.years() if start.year <= y <= end.year]
+
+    def devices_between(self, start, end):
+        """Equipos de las particiones que pueden tener ingresos entre ``start`` y ``end``"""
+        return self.devices(self.years_between(start, end))
+
+    def iter_devices(self, filter=None, years=None):
+        """Como ``devices``, pero de a un equipo y sin guardar las particiones en la caché.
+
+        Para recorridos de una sola vez (la línea de comandos, reconstrucciones),
+        que así no necesitan tener todo el archivo en memoria.
+        """
+        for year in self.years() if years is None else years:
+            if year in self._partitions:
+                yield from (d for d in self._partitions[year] if filter is None or filter(d))
+            else:
+                yield from storage.iter_devices(filter, storage.archive_partition_path(year))
+
+    def delivered_between(self, start, end):
+        """Equipos archivados entregados entre ``start`` y ``end``.
+
+        Solo se abren las particiones que pueden tenerlos: recibidos hasta el
+        año de ``end`` y con alguna entrega desde ``start``.
+        """
+        first = format_timestamp(start)
+        years = []
+        for year in self.years():
+            last_delivered = self.index['years'][str(year)].get('last_delivered')
+            # Los índices anteriores no tienen last_delivered: hay que abrir la partición
+            if year <= end.year and (last_delivered is None or last_delivered >= first):
+                years.append(year)
+        return [d for d in self.devices(years)
+                if d.date_delivered is not None and start <= d.date_delivered <= end]
+
+    def get(self, device_id):
+        """Equipo archivado con ese ID o None; solo abre los años cuyo rango lo contiene"""
+        for year in self.years():
+            stats = self.index['years'][str(year)]
+            if stats['min_id'] <= device_id <= stats['max_id']:
+                for device in self.partition(year):
+                    if device.id == device_id:
+                        return device
+        return None
+
+    def _build_indexes(self):
+        self._refresh()
+        if self._search_index is None:
+            devices = self.devices()
+            self._search_index = SearchIndex(self.search_fields, self.compact_fields)
+            self._search_index.rebuild(devices)
+            self._serial_index = SerialIndex()
+            self._serial_index.rebuild(devices)
+            self._client_index = ClientDeviceIndex()
+            self._client_index.rebuild(devices)
+            self._filter_index = FilterIndex()
+            self._filter_index.rebuild(devices)
+
+    def search(self, query, limit=None):
+        if not self:
+            return []
+        self._build_indexes()
+        ids = self._search_index.search(query, limit=limit)
+        return [self._search_index.get(i) for i in ids]
+
+    def by_serial(self, serial):
+        if not self:
+            return []
+        self._build_indexes()
+        return [self._search_index.get(i) for i in self._serial_index.by_serial(serial)]
+
+    def by_model(self, brand, model):
+        if not self:
+            return []
+        self._build_indexes()
+        return [self._search_index.get(i) for i in self._serial_index.by_model(brand, model)]
+
+    def by_client(self, client_id):
+        """Equipos archivados del cliente"""
+        if not self:
+            return []
+        self._build_indexes()
+        return [self._search_index.get(i) for i in self._client_index.by_client(client_id)]
+
+    def invoiced_by_client(self, client_id):
+        """Equipos archivados del cliente que tienen factura"""
+        if not self:
+            return []
+        self._build_indexes()
+        return [self._search_index.get(i) for i in self._client_index.invoiced_by_client(client_id)]
+
+    def has_client_devices(self, client_id):
+        if not self:
+            return False
+        self._build_indexes()
+        return self._client_index.has_devices(client_id)
+
+    def filter(self, device_filter):
+        """Equipos archivados que cumplen el filtro (ver queries).
+
+        Con un rango de fechas solo se abren las particiones que pueden
+        tener equipos en él; sin fechas se usan los índices del archivo.
+        """
+        f = device_filter
+        if not self or (f.status and f.status != DELIVERED):
+            return []
+        if f.received_from is None and f.received_to is None \
+                and f.delivered_from is None and f.delivered_to is None:
+            self._build_indexes()
+            plan = queries.plan(f, self._filter_index, self._client_index)
+            if plan.ids is not None:
+                candidates = (self._search_index.get(i) for i in plan.ids)
+                return [d for d in candidates if f.matches(d)]
+            return [d for d in self.devices() if f.matches(d)]
+
+        # Las particiones son por año de ingreso, y nadie se entrega antes de ingresar
+        first_year = f.received_from.year if f.received_from else None
+        last_year = min((d.year for d in (f.received_to, f.delivered_to) if d is not None),
+                        default=None)
+        first_delivered = format_timestamp(f.delivered_from) if f.delivered_from else None
+        years = []
+        for year in self.years():
+            if (first_year is not None and year < first_year) \
+                    or (last_year is not None and year > last_year):
+                continue
+            last_delivered = self.index['years'][str(year)].get('last_delivered')
+            if first_delivered and last_delivered is not None and last_delivered < first_delivered:
+                continue
+            years.append(year)
+        return [d for d in self.devices(years) if f.matches(d)]
+
+    def serials(self):
+        """Pares (serie, ids) de todos los equipos archivados con serie"""
+        if not self:
+            return {}
+        self._build_indexes()
+        return self._serial_index.serials()
+
+    def store(self, devices, last_device_id, last_factura_num):
+        """Agrega equipos a sus particiones (llamar dentro de ``storage.write_lock()``).
+
+        Si un equipo ya estaba archivado se reemplaza, de modo que repetir un
+        archivado interrumpido no duplica registros.
+        """
+        self._refresh()
+        by_year = {}
+        for device in devices:
+            by_year.setdefault(partition_year(device), []).append(device)
+
+        index = dict(self.index, years=dict(self.index['years']))
+        for year, new_devices in by_year.items():
+            merged = {d.id: d for d in storage.load_archive_partition(year)}
+            merged.update((d.id, d) for d in new_devices)
+            partition = [merged[i] for i in sorted(merged)]
+            storage.save_archive_partition(year, partition)
+            delivered = [d.date_delivered for d in partition if d.date_delivered is not None]
+            index['years'][str(year)] = {'count': len(partition),
+                                         'min_id': partition[0].id,
+                                         'max_id': partition[-1].id,
+                                         'last_delivered': format_timestamp(max(delivered, default=None))}
+        index['last_device_id'] = max(index['last_device_id'], last_device_id)
+        index['last_factura_num'] = max(index['last_factura_num'], last_factura_num)
+        # Con sucursales cada una sigue su numeración desde lo último que archivó
+        branches = {b: dict(last) for b, last in index['branches'].items()}
+        for device in devices:
+            for field, number in (('last_device_id', device.id),
+                                  ('last_factura_num', device.factura_num)):
+                if number:
+                    last = branches.setdefault(str(storage.branch_of(number)),
+                                               {'last_device_id': 0, 'last_factura_num': 0})
+                    last[field] = max(last[field], number)
+        index['branches'] = branches
+        storage.save_archive_index(index)
+        self._refresh()
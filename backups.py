@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Copias de seguridad de la carpeta database.
+
+El bloqueo de escritura se toma solo para enlazar (hard link) los archivos
+de database/ en una carpeta temporal y anotar sus tamaños. Los JSON se
+reemplazan enteros al guardar, así que el enlace conserva esa versión; los
+registros de sucursales (.jsonl) crecen en el mismo archivo, pero lo ya
+escrito no cambia y al zip pasan solo los bytes anotados. Así el zip se
+arma sin frenar a nadie y queda tal como estaban los datos con el bloqueo.
+Cada zip se relee completo al terminar (nombres, tamaños y CRC) antes de
+darlo por bueno, y el resultado queda en backup/catalogo.json con la
+duración y el tamaño.
+
+``BackupScheduler`` hace copias automáticas en un hilo aparte cada
+``[Backup] intervalo_minutos`` o cada ``cada_cambios`` escrituras, con la
+lectura limitada a ``limite_mb_s`` para no competir con el mostrador.
+"""
+
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+import metrics
+import storage
+from records import format_timestamp, parse_timestamp
+from storage import DATABASE_DIR, ARCHIVE_DIR, SYNC_DIR, BACKUP_DIR, write_lock, is_temporary_file
+
+MANUAL = "manual"
+SCHEDULED = "programado"
+
+INTERVAL_MINUTES = 60
+EVERY_WRITES = 200
+LIMIT_MB_S = 10
+KEEP_SCHEDULED = 48
+# Cada cuánto el hilo revisa si toca una copia
+CHECK_SECONDS = 30
+COPY_CHUNK_SIZE = 256 * 1024
+
+
+class BackupError(Exception):
+    """La copia no se pudo crear o no pasó la verificación"""
+
+
+class BackupOptions:
+    """Ajustes de ``[Backup]`` en settings.ini; 0 desactiva cada disparador o el límite"""
+
+    __slots__ = ('interval_minutes', 'every_writes', 'limit_mb_s', 'keep')
+
+    def __init__(self, interval_minutes=INTERVAL_MINUTES, every_writes=EVERY_WRITES,
+                 limit_mb_s=LIMIT_MB_S, keep=KEEP_SCHEDULED):
+        self.interval_minutes = interval_minutes
+        self.every_writes = every_writes
+        self.limit_mb_s = limit_mb_s
+        self.keep = keep
+
+    @classmethod
+    def from_settings(cls):
+        settings = storage.load_settings()
+        return cls(interval_minutes=settings.getfloat('Backup', 'intervalo_minutos',
+                                                      fallback=INTERVAL_MINUTES),
+                   every_writes=settings.getint('Backup', 'cada_cambios', fallback=EVERY_WRITES),
+                   limit_mb_s=settings.getfloat('Backup', 'limite_mb_s', fallback=LIMIT_MB_S),
+                   keep=settings.getint('Backup', 'conservar', fallback=KEEP_SCHEDULED))
+
+    @property
+    def enabled(self):
+        return self.interval_minutes > 0 or self.every_writes > 0
+
+
+class _Throttle:
+    """Espera lo necesario para no pasar de ``limit`` bytes por segundo; con ``cancel``
+    activado interrumpe la copia"""
+
+    def __init__(self, limit=None, cancel=None):
+        self.limit = limit
+        self.cancel = cancel
+        self.start = time.monotonic()
+        self.done = 0
+
+    def __call__(self, size):
+        if self.cancel is not None and self.cancel.is_set():
+            raise BackupError("Copia cancelada")
+        if not self.limit:
+            return
+        self.done += size
+        wait = self.done / self.limit - (time.monotonic() - self.start)
+        if wait > 0:
+            if self.cancel is not None:
+                self.cancel.wait(wait)
+            else:
+                time.sleep(wait)
+
+
+def _stage_files(staging):
+    """Enlaza los archivos de database/ en ``staging``.
+
+    Devuelve [(nombre en el zip, ruta, tamaño)]. Llamar dentro de
+    ``write_lock()``: el tamaño es el de ese momento, y para los archivos
+    que se agregan al final (los .jsonl) es lo único que entra en el zip.
+    Si el sistema de archivos no admite enlaces se copian (más lento, con
+    el bloqueo tomado).
+    """
+    files = []
+    for root, dirs, names in os.walk(DATABASE_DIR):
+        for name in names:
+            if is_temporary_file(name):
+                continue
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, DATABASE_DIR)
+            target = os.path.join(staging, relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+            # Dentro del zip las carpetas se separan siempre con "/"
+            files.append((relative.replace(os.sep, '/'), target, os.path.getsize(target)))
+    return files
+
+
+def _write_zip(path, files, throttle):
+    with zipfile.ZipFile(path, 'w') as zipf:
+        for arcname, source, size in files:
+            with open(source, 'rb') as src, \
+                    zipf.open(zipfile.ZipInfo.from_file(source, arcname), 'w') as dst:
+                remaining = size
+                while remaining:
+                    chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    throttle(len(chunk))
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+
+
+def verify_backup(path, expected=None, throttle=None):
+    """Relee todo el zip y comprueba el CRC de cada archivo; BackupError si algo no coincide.
+
+    ``expected`` es {nombre: tamaño} de lo que debería contener.
+    """
+    throttle = throttle or _Throttle()
+    try:
+        with zipfile.ZipFile(path) as zipf:
+            infos = zipf.infolist()
+            if expected is not None:
+                names = {info.filename for info in infos}
+                if names != set(expected):
+                    raise BackupError(f"Faltan o sobran archivos: "
+                                      f"{', '.join(sorted(names ^ set(expected))[:5])}")
+            for info in infos:
+                if expected is not None and info.file_size != expected[info.filename]:
+                    raise BackupError(f"Tamaño distinto en {info.filename}")
+                # ZipExtFile compara el CRC al llegar al final del archivo
+                with zipf.open(info) as member:
+                    for chunk in iter(lambda: member.read(COPY_CHUNK_SIZE), b''):
+                        throttle(len(chunk))
+    except (zipfile.BadZipFile, OSError) as e:
+        raise BackupError(f"El backup {os.path.basename(path)} está dañado: {e}")
+
+
+@metrics.timed('backup.create')
+def create_backup(reason=MANUAL, limit_mb_s=None, cancel=None):
+    """Crea una copia de seguridad verificada de los datos y devuelve la ruta del zip.
+
+    ``limit_mb_s`` limita la lectura y la verificación; ``cancel`` (un
+    ``threading.Event``) la interrumpe con BackupError.
+    """
+    started = time.perf_counter()
+    timestamp = datetime.now()
+    name = f"backup_{timestamp.strftime('%Y%m%d_%H%M%S')}"
+    backup_file = os.path.join(BACKUP_DIR, f"{name}.zip")
+    # Una manual y una automática en el mismo segundo no se pisan
+    suffix = 1
+    while os.path.exists(backup_file) or os.path.exists(backup_file + '.tmp'):
+        suffix += 1
+        backup_file = os.path.join(BACKUP_DIR, f"{name}_{suffix}.zip")
+    throttle = _Throttle(limit_mb_s * 1024 * 1024 if limit_mb_s else None, cancel)
+    entry = {'archivo': os.path.basename(backup_file), 'fecha': format_timestamp(timestamp),
+             'motivo': reason}
+    staging = tempfile.mkdtemp(prefix='.backup_', dir=BACKUP_DIR)
+    tmp_path = backup_file + '.tmp'
+    try:
+        # Con el bloqueo tomado clientes y equipos quedan en el mismo estado
+        with write_lock():
+            files = _stage_files(staging)
+        expected = {arcname: size for arcname, _, size in files}
+        _write_zip(tmp_path, files, throttle)
+        verify_backup(tmp_path, expected, throttle)
+        os.replace(tmp_path, backup_file)
+    except (BackupError, OSError) as e:
+        if cancel is None or not cancel.is_set():
+            # Las fallidas también quedan en el catálogo, para que se note
+            entry.update(segundos=round(time.perf_counter() - started, 3), verificado=False,
+                         error=str(e))
+            _add_to_catalog(entry)
+        raise
+    finally:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        shutil.rmtree(staging, ignore_errors=True)
+
+    entry.update(segundos=round(time.perf_counter() - started, 3),
+                 bytes=os.path.getsize(backup_file), archivos=len(files),
+                 datos_bytes=sum(expected.values()), verificado=True)
+    _add_to_catalog(entry)
+    return backup_file
+
+
+def _add_to_catalog(entry):
+    with write_lock():
+        storage.save_backup_catalog(storage.load_backup_catalog() + [entry])
+
+
+def prune_scheduled(keep):
+    """Borra las copias automáticas más viejas y deja las últimas ``keep``; las manuales quedan"""
+    if keep <= 0:
+        return []
+    with write_lock():
+        catalog = storage.load_backup_catalog()
+        scheduled = [e for e in catalog if e.get('motivo') == SCHEDULED and e.get('verificado')]
+        removed = {e['archivo'] for e in scheduled[:-keep]}
+        for name in removed:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(BACKUP_DIR, name))
+        if removed:
+            storage.save_backup_catalog([e for e in catalog if e.get('archivo') not in removed])
+    return sorted(removed)
+
+
+def last_backup_time():
+    """Fecha de la última copia intentada (manual o automática), o None"""
+    for entry in reversed(storage.load_backup_catalog()):
+        date = parse_timestamp(entry.get('fecha'))
+        if date is not None:
+            return date
+    return None
+
+
+def catalog_line(entry):
+    """Una línea legible de una entrada del catálogo"""
+    line = f"{entry.get('fecha', '')}  {entry.get('motivo', ''):<10} {entry.get('archivo', '')}"
+    if not entry.get('verificado'):
+        return f"{line}  ERROR: {entry.get('error', 'sin verificar')}"
+    return (f"{line}  {entry.get('bytes', 0) / 1024 / 1024:.1f} MB  "
+            f"{entry.get('archivos', 0)} archivos  {entry.get('segundos', 0):.1f} s")
+
+
+def _lower_priority():
+    """Baja la prioridad del hilo actual; en Linux la prioridad de E/S sigue a la de CPU"""
+    if sys.platform.startswith('linux'):
+        with contextlib.suppress(OSError, AttributeError):
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+
+
+class BackupScheduler:
+    """Copias de seguridad en un hilo aparte: las automáticas y las pedidas con ``request``.
+
+    ``writes`` devuelve cuántas escrituras hizo el servicio (``DataService.writes``).
+    El plazo se cuenta desde la última copia del catálogo, así que cerrar y
+    abrir el programa (u otra instancia que ya hizo una copia) no lo reinicia.
+    """
+
+    def __init__(self, writes=lambda: 0, options=None):
+        self.options = options or BackupOptions.from_settings()
+        self._writes = writes
+        self._writes_at_last = writes()
+        self._wake = threading.Event()
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._requests = []
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="backups", daemon=True)
+            self._thread.start()
+        return self
+
+    def request(self, on_done=None):
+        """Pide una copia manual sin límite de velocidad.
+
+        ``on_done(ruta, error)`` se llama desde el hilo de las copias al terminar.
+        """
+        with self._lock:
+            self._requests.append(on_done)
+        self._wake.set()
+
+    def stop(self, wait=True):
+        """Detiene el hilo; una copia a medio hacer se cancela y no queda en el catálogo"""
+        self._cancel.set()
+        self._wake.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def due(self, now=None):
+        """True si toca una copia automática"""
+        options = self.options
+        if options.every_writes > 0 and self._writes() - self._writes_at_last >= options.every_writes:
+            return True
+        if options.interval_minutes > 0:
+            last = last_backup_time()
+            return last is None or (now or datetime.now()) - last >= timedelta(
+                minutes=options.interval_minutes)
+        return False
+
+    def _run(self):
+        _lower_priority()
+        while not self._cancel.is_set():
+            self._wake.wait(CHECK_SECONDS)
+            self._wake.clear()
+            if self._cancel.is_set():
+                break
+            with self._lock:
+                requests, self._requests = self._requests, []
+            try:
+                for on_done in requests:
+                    self._backup(MANUAL, None, on_done)
+                if self.options.enabled and self.due():
+                    self._backup(SCHEDULED, self.options.limit_mb_s)
+                    prune_scheduled(self.options.keep)
+            except Exception as e:
+                # Un error al leer el catálogo no debe terminar el hilo
+                print(f"Error en las copias automáticas: {e}", file=sys.stderr)
+
+    def _backup(self, reason, limit_mb_s, on_done=None):
+        self._writes_at_last = self._writes()
+        path = error = None
+        try:
+            path = create_backup(reason, limit_mb_s, self._cancel)
+        except (BackupError, OSError) as e:
+            error = str(e)
+        if on_done is not None:
+            on_done(path, error)
+        return path
+
+
+@metrics.timed('backup.restore')
+def restore_backup(backup_file):
+    """Restaura los datos desde una copia de seguridad"""
+    with write_lock(), zipfile.ZipFile(backup_file, 'r') as zipf:
+        # Eliminar archivos actuales, también los del archivo por años y los
+        # registros de sucursales (el archivo de bloqueo queda en su lugar)
+        with metrics.timed('backup.restore_delete'):
+            for directory in (DATABASE_DIR, ARCHIVE_DIR, SYNC_DIR):
+                for filename in os.listdir(directory):
+                    file_path = os.path.join(directory, filename)
+                    if is_temporary_file(filename):
+                        continue
+                    try:
+                        if os.path.isfile(file_path):
+                            os.unlink(file_path)
+                    except Exception as e:
+                        print(f"No se pudo eliminar {file_path}: {e}")
+
+        # Extraer backup
+        with metrics.timed('backup.restore_extract'):
+            zipf.extractall(DATABASE_DIR, [m for m in zipf.namelist()
+                                           if not is_temporary_file(os.path.basename(m))])
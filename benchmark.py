@@ -0,0 +1,692 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Mediciones de rendimiento con datos sintéticos.
+
+    python benchmark.py generate --equipos 100000 --destino /tmp/datos
+    python benchmark.py run --equipos 100000 --output resultados.json
+    python benchmark.py compare base.json resultados.json
+    python benchmark.py gui --tamaños 1000 10000 100000 --output gui.json
+
+``generate`` escribe clientes.json y equipos.json realistas en una carpeta;
+con la misma semilla y la misma fecha final el resultado es idéntico.
+
+``run`` copia los módulos del programa a una carpeta temporal, genera ahí
+la base de datos y mide cada operación: la carpeta database/ real nunca se
+toca. Los resultados (segundos por operación: mínimo, mediana, media y
+máximo) se guardan en JSON para comparar corridas; ``compare`` marca las
+operaciones cuya mediana empeoró más allá del umbral y termina con código 1.
+
+``gui`` abre la ventana principal sin pantalla (``QT_QPA_PLATFORM=offscreen``)
+con bases de varios tamaños y mide cuánto queda congelada en cada acción:
+del clic hasta que la cola de eventos de Qt vuelve a estar vacía. Cada
+tamaño corre en su propio proceso, porque Qt admite una sola QApplication
+por proceso y las rutas de storage dependen de la carpeta.
+
+Este archivo no importa los módulos del programa al cargarse: ``run`` los
+importa desde la copia, porque las rutas de storage dependen de dónde está
+storage.py.
+"""
+
+import argparse
+import glob
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+FIRST_FACTURA_NUMBER = 1001
+# Etapas de los equipos generados que todavía no se entregaron
+ACTIVE_STATUSES = ("Recibido", "Diagnóstico", "Esperando repuesto", "Listo")
+
+DEFAULT_DEVICES = 10000
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 1.25
+DEFAULT_GUI_SIZES = (1000, 10000, 50000)
+
+FIRST_NAMES = ("José", "María", "Juan", "Ana", "Carlos", "Rosa", "Luis", "Carmen", "Jorge", "Marta",
+               "Miguel", "Sofía", "Francisco", "Gloria", "Óscar", "Patricia", "Ricardo", "Elena",
+               "Mario", "Claudia", "Roberto", "Lucía", "Fernando", "Beatriz", "Raúl", "Julia")
+LAST_NAMES = ("Hernández", "García", "Martínez", "López", "Rodríguez", "Pérez", "Ramírez", "Flores",
+              "Cruz", "Rivera", "Gómez", "Díaz", "Reyes", "Morales", "Castillo", "Ortiz", "Guzmán",
+              "Mejía", "Alvarado", "Romero", "Chávez", "Aguilar", "Menjívar", "Portillo")
+STREETS = ("Calle Arce", "Av. Roosevelt", "Calle Delgado", "Blvd. de los Héroes", "Av. España",
+           "Calle Rubén Darío", "Av. Masferrer", "Calle El Mirador", "Col. Escalón", "Col. Médica")
+CITIES = ("San Salvador", "Santa Tecla", "Soyapango", "San Miguel", "Santa Ana", "Mejicanos")
+EMAIL_DOMAINS = ("gmail.com", "hotmail.com", "yahoo.com", "outlook.com")
+
+# Tipo -> [(marca, modelos)]
+DEVICE_CATALOG = {
+    'Laptop': [("HP", ("Pavilion 15", "EliteBook 840", "ProBook 450", "Victus 16")),
+               ("Dell", ("Inspiron 3520", "Latitude 5420", "Vostro 3400", "XPS 13")),
+               ("Lenovo", ("IdeaPad 3", "ThinkPad T14", "Legion 5", "V15")),
+               ("Asus", ("VivoBook 15", "TUF F15", "ZenBook 14")),
+               ("Acer", ("Aspire 5", "Nitro 5", "Swift 3"))],
+    'Celular': [("Samsung", ("Galaxy A14", "Galaxy A54", "Galaxy S21", "Galaxy S23")),
+                ("Apple", ("iPhone 11", "iPhone 12", "iPhone 13", "iPhone 14")),
+                ("Xiaomi", ("Redmi Note 12", "Redmi 10", "Poco X5")),
+                ("Motorola", ("Moto G32", "Moto E22", "Edge 30"))],
+    'Tablet': [("Samsung", ("Galaxy Tab A8", "Galaxy Tab S7")),
+               ("Apple", ("iPad 9", "iPad Air 4")),
+               ("Lenovo", ("Tab M10",))],
+    'Impresora': [("Epson", ("L3150", "L3250", "L4260")),
+                  ("Canon", ("G3110", "MG2510")),
+                  ("HP", ("Ink Tank 415", "LaserJet M111w"))],
+    'Consola': [("Sony", ("PS4 Slim", "PS5")),
+                ("Microsoft", ("Xbox One S", "Xbox Series S")),
+                ("Nintendo", ("Switch", "Switch OLED"))],
+    'PC de escritorio': [("Dell", ("OptiPlex 3080", "Vostro 3910")),
+                         ("HP", ("ProDesk 400", "All-in-One 24")),
+                         ("Genérica", ("Clon Ryzen 5", "Clon Core i5"))],
+}
+# Proporción de cada tipo entre los equipos que llegan al taller
+DEVICE_TYPE_WEIGHTS = {'Laptop': 40, 'Celular': 30, 'Tablet': 8, 'Impresora': 10, 'Consola': 6,
+                       'PC de escritorio': 6}
+ISSUES = ("No enciende", "Pantalla rota", "No carga", "Se reinicia solo", "Teclado no responde",
+          "Mantenimiento preventivo", "Cambio de batería", "Formateo e instalación de sistema",
+          "No da video", "Se calienta mucho", "Puerto de carga dañado", "No imprime",
+          "Atasco de papel", "Virus", "Bisagra quebrada", "No lee discos", "Sin señal")
+PRICES = (10, 15, 20, 25, 30, 35, 40, 45, 50, 60, 65, 75, 80, 90, 100, 120, 150, 180, 250)
+
+# Equipos que vuelven con la misma serie (garantías, clientes frecuentes),
+# elegidos entre los últimos RETURN_POOL que se recibieron con serie
+RETURN_RATE = 0.08
+RETURN_POOL = 5000
+# Días que suele tardar una reparación; los ingresos más recientes siguen en el taller
+MAX_REPAIR_DAYS = 12
+
+APP_FILES = ('*.py', 'settings.ini', 'logo.png')
+
+
+def _placeholder_png(seed):
+    """PNG de 16x16 de un color; suficiente para que las fotos ocupen disco"""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+
+    color = bytes(((seed * 67) % 256, (seed * 131) % 256, (seed * 29) % 256))
+    raw = b''.join(b'\x00' + color * 16 for _ in range(16))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 16, 16, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def _write_records(path, records):
+    """Escribe un registro por línea, como storage.write_json_atomic"""
+    with open(path, 'w') as f:
+        f.write('[')
+        separator = '\n'
+        for record in records:
+            f.write(separator)
+            f.write(json.dumps(record))
+            separator = ',\n'
+        f.write('\n]\n')
+
+
+def _random_client(rng, client_id):
+    first, last, second = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(LAST_NAMES)
+    user = f"{first}.{last}{client_id}".lower()
+    return {
+        'id': client_id,
+        'name': f"{first} {last} {second}",
+        'phone': f"{rng.choice('67')}{rng.randint(0, 999):03d}-{rng.randint(0, 9999):04d}",
+        'email': user.translate(str.maketrans('áéíóúñ', 'aeioun')) + '@' + rng.choice(EMAIL_DOMAINS)
+                 if rng.random() < 0.6 else '',
+        'address': f"{rng.choice(STREETS)} #{rng.randint(1, 400)}, {rng.choice(CITIES)}"
+                   if rng.random() < 0.7 else '',
+        'nit': f"0614-{rng.randint(10101, 311299):06d}-{rng.randint(100, 199)}-{rng.randint(0, 9)}"
+               if rng.random() < 0.4 else '',
+        'balance': 0.0,
+    }
+
+
+def generate_dataset(database_dir, devices, clients=None, seed=1, images=False, end=None, years=3):
+    """Genera clientes.json y equipos.json en ``database_dir`` y devuelve un resumen.
+
+    Los ingresos se reparten en los ``years`` años anteriores a ``end`` (hoy
+    por defecto), con más movimiento en los últimos meses; los equipos que
+    ya debían estar listos figuran entregados y facturados en orden de entrega.
+    """
+    clients = clients or max(1, devices // 4)
+    end = (end or datetime.now()).replace(microsecond=0)
+    span = int(timedelta(days=365 * years).total_seconds())
+    start = end - timedelta(seconds=span)
+    images_dir = os.path.join(database_dir, 'images')
+    os.makedirs(images_dir, exist_ok=True)
+
+    # Primera pasada: solo fechas, para numerar las facturas en orden de entrega
+    # sin tener todos los equipos en memoria. La distribución triangular carga
+    # los meses recientes.
+    rng = random.Random(seed)
+    received = sorted(int(rng.triangular(0, span, span)) for _ in range(devices))
+    delivered = []
+    for offset in received:
+        seconds = offset + rng.randint(1, MAX_REPAIR_DAYS) * 86400 + rng.randint(0, 8 * 3600)
+        delivered.append(seconds if seconds < span and rng.random() < 0.97 else None)
+    factura = [0] * devices
+    order = sorted((s, i) for i, s in enumerate(delivered) if s is not None)
+    for number, (_, i) in enumerate(order, start=FIRST_FACTURA_NUMBER):
+        factura[i] = number
+
+    rng = random.Random(seed * 2 + 1)
+    # Generador aparte para las etapas: el resto de los datos no cambia con la misma semilla
+    status_rng = random.Random(seed * 3 + 2)
+    client_records = [_random_client(rng, i) for i in range(1, clients + 1)]
+    balances = [0.0] * (clients + 1)
+    types = list(DEVICE_TYPE_WEIGHTS)
+    weights = list(DEVICE_TYPE_WEIGHTS.values())
+    # (cliente, tipo, marca, modelo, serie) de equipos recientes que pueden reingresar
+    previous = []
+
+    def device_records():
+        for i, offset in enumerate(received):
+            device_id = i + 1
+            if previous and rng.random() < RETURN_RATE:
+                client_id, device_type, brand, model, serial = rng.choice(previous)
+            else:
+                client_id = rng.randint(1, clients)
+                device_type = rng.choices(types, weights)[0]
+                brand, models = rng.choice(DEVICE_CATALOG[device_type])
+                model = rng.choice(models)
+                serial = f"{brand[:2].upper()}{rng.getrandbits(40):010X}" if rng.random() < 0.85 else ''
+                if serial:
+                    entry = (client_id, device_type, brand, model, serial)
+                    if len(previous) < RETURN_POOL:
+                        previous.append(entry)
+                    else:
+                        previous[device_id % RETURN_POOL] = entry
+
+            cost = float(rng.choice(PRICES))
+            advance = float(rng.choice((0, 0, 5, 10, 20, int(cost // 2))))
+            balances[client_id] += cost - advance
+
+            paths = []
+            if images and rng.random() < 0.3:
+                for n in range(rng.randint(1, 3)):
+                    path = os.path.join(images_dir, f"device_{device_id}_{n}.png")
+                    with open(path, 'wb') as f:
+                        f.write(_placeholder_png(device_id + n))
+                    paths.append(path)
+
+            date_delivered = delivered[i]
+            yield {
+                'id': device_id,
+                'client_id': client_id,
+                'client_name': client_records[client_id - 1]['name'],
+                'type': device_type,
+                'brand': brand,
+                'model': model,
+                'serial': serial,
+                'issues': rng.choice(ISSUES),
+                'cost': cost,
+                'advance': advance,
+                'status': "Entregado" if date_delivered is not None else status_rng.choice(ACTIVE_STATUSES),
+                'date_received': (start + timedelta(seconds=offset)).strftime(DATE_FORMAT),
+                'date_delivered': (start + timedelta(seconds=date_delivered)).strftime(DATE_FORMAT)
+                                  if date_delivered is not None else '',
+                'images': paths,
+                'factura_num': factura[i],
+            }
+
+    _write_records(os.path.join(database_dir, 'equipos.json'), device_records())
+    for client in client_records:
+        client['balance'] = round(balances[client['id']], 2)
+    _write_records(os.path.join(database_dir, 'clientes.json'), client_records)
+    return {'devices': devices, 'clients': clients, 'delivered': len(order), 'seed': seed,
+            'images': bool(images), 'years': years, 'end': end.strftime(DATE_FORMAT)}
+
+
+def prepare_workspace(path):
+    """Copia el programa a ``path`` para que sus rutas apunten a una base de datos de prueba"""
+    for pattern in APP_FILES:
+        for source in glob.glob(os.path.join(BASE_DIR, pattern)):
+            shutil.copy2(source, path)
+    os.makedirs(os.path.join(path, 'database'), exist_ok=True)
+    return os.path.join(path, 'database')
+
+
+def summarize(times):
+    """Segundos mínimo, mediano, medio y máximo de varias mediciones"""
+    return {'runs': len(times), 'min': round(min(times), 6), 'median': round(statistics.median(times), 6),
+            'mean': round(statistics.fmean(times), 6), 'max': round(max(times), 6)}
+
+
+def measure(function, repeat):
+    """Ejecuta ``function`` ``repeat`` veces; segundos mínimo, mediano, medio y máximo"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+def run_benchmarks(workspace, repeat=DEFAULT_REPEAT, progress=print):
+    """Mide las operaciones sobre la base de datos de ``workspace`` (ya generada)"""
+    sys.path.insert(0, workspace)
+    storage = importlib.import_module('storage')
+    service_module = importlib.import_module('service')
+    backups = importlib.import_module('backups')
+    if os.path.dirname(storage.__file__) != workspace:
+        raise RuntimeError("Los módulos del programa ya estaban importados desde otra carpeta")
+
+    results = {}
+
+    def record(name, function, times=repeat):
+        progress(f"  {name}...")
+        results[name] = measure(function, times)
+
+    record('load_clients', storage.load_clients)
+    record('load_devices', storage.load_devices)
+    # Sin archivado automático: mover los entregados viejos no es parte de lo que se mide
+    record('service_start', lambda: service_module.DataService(auto_archive=False, warm_start=False))
+
+    service = service_module.DataService(auto_archive=False, warm_start=False)
+    snapshot = importlib.import_module('snapshot')
+    # Se borra antes de cada medición: sin cambios save_snapshot no vuelve a escribir
+    record('save_snapshot', lambda: (snapshot.discard(), service.save_snapshot()),
+           max(1, min(repeat, 3)))
+    record('service_warm_start', lambda: service_module.DataService(auto_archive=False))
+    devices = service.list_devices()
+    record('get_next_factura_number', lambda: storage.get_next_factura_number(devices))
+
+    rng = random.Random(0)
+    client_ids = [c.id for c in service.list_clients()]
+    added = []
+
+    def add_device():
+        added.append(service.add_device({
+            'client_id': rng.choice(client_ids), 'type': 'Laptop', 'brand': 'HP',
+            'model': 'Pavilion 15', 'serial': f"BENCH{len(added):06d}",
+            'issues': 'No enciende', 'cost': 45, 'advance': 10}))
+
+    # Sin esto la primera entrega pagaría el cálculo inicial de tiempos.json
+    record('rebuild_turnaround', service.rebuild_turnaround, max(1, min(repeat, 3)))
+    record('add_device', add_device)
+    pending = list(added)
+    # Solo los equipos listos se pueden entregar
+    waiting = list(added)
+    record('change_status', lambda: service.change_status(waiting.pop().id, "Listo"))
+    for device in waiting:
+        service.change_status(device.id, "Listo")
+    delivered = []
+    record('deliver_device', lambda: delivered.append(service.deliver_device(pending.pop().id)))
+
+    end = max((d.date_received for d in devices if d.date_received), default=datetime.now())
+    for report_type in ('diario', 'semanal', 'mensual', 'personalizado'):
+        record(f"report_{report_type}",
+               lambda t=report_type: service.report(t, end - timedelta(days=365), end))
+    record('report_tiempos', lambda: service.turnaround_report(end - timedelta(days=365), end))
+    queries = importlib.import_module('queries')
+    recent_ready = queries.DeviceFilter(status="Listo", cost_min=50,
+                                        received_from=end - timedelta(days=90), received_to=end)
+    record('filter_report', lambda: service.filter_report(recent_ready))
+
+    try:
+        documents = importlib.import_module('documents')
+    except ImportError as e:
+        results['render_receipt'] = results['render_invoice'] = {'skipped': str(e)}
+    else:
+        device, client = delivered[0]
+        record('render_receipt', lambda: documents.render_receipt(device, client))
+        record('render_invoice', lambda: documents.render_invoice(device, client))
+
+    record('create_backup', backups.create_backup, max(1, min(repeat, 3)))
+    return results
+
+
+def run_gui_benchmarks(workspace, repeat=DEFAULT_REPEAT, progress=print):
+    """Mide cuánto se congela ``MainWindow`` en cada acción con la base de ``workspace``.
+
+    Hay que llamarla en un proceso propio (ver ``cmd_gui``). Los mensajes de
+    QMessageBox se responden solos y el navegador no se abre; las advertencias
+    y errores que la ventana quiso mostrar se devuelven en ``errors``.
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    sys.path.insert(0, workspace)
+    from PyQt5.QtWidgets import QApplication, QMessageBox
+
+    app = QApplication.instance() or QApplication([])
+    storage = importlib.import_module('storage')
+    if os.path.dirname(storage.__file__) != workspace:
+        raise RuntimeError("Los módulos del programa ya estaban importados desde otra carpeta")
+    taller3 = importlib.import_module('taller3')
+    service_module = importlib.import_module('service')
+
+    errors = []
+
+    def answer(kind):
+        def show(parent, title, text, *args, **kwargs):
+            if kind != 'information':
+                errors.append(f"{title}: {text}")
+            return QMessageBox.Ok
+        return staticmethod(show)
+
+    # Sin pantalla nadie cierra los mensajes
+    for kind in ('information', 'warning', 'critical'):
+        setattr(QMessageBox, kind, answer(kind))
+    taller3.webbrowser.open = lambda *args, **kwargs: True
+
+    # El primer arranque archiva los entregados viejos; eso no es parte de lo que se mide
+    service_module.DataService()
+
+    results = {}
+    timings = {}
+
+    def frozen(action):
+        """Segundos desde la acción hasta que Qt terminó de procesar lo que provocó"""
+        start = time.perf_counter()
+        action()
+        app.processEvents()
+        return time.perf_counter() - start
+
+    def record(name, action, times=repeat):
+        progress(f"  {name}...")
+        results[name] = summarize([frozen(action) for _ in range(times)])
+
+    windows = []
+    record('window_start', lambda: (windows.append(taller3.MainWindow()), windows[-1].show()),
+           max(1, min(repeat, 3)))
+    for extra in windows[:-1]:
+        extra.photo_ingest.shutdown()
+        extra.deleteLater()
+    window = windows[-1]
+    app.processEvents()
+
+    for index in range(window.tabs.count()):
+        name = f"tab_{window.tabs.tabText(index).lower()}"
+        record(name, lambda i=index: (window.tabs.setCurrentIndex(i),
+                                      window.tabs.setCurrentIndex(0 if i else 1)))
+
+    window.tabs.setCurrentIndex(0)
+    for method in ('update_client_table', 'update_device_table', 'update_client_combo',
+                   'update_receipt_combo', 'update_delivery_combo', 'update_board'):
+        record(method, getattr(window, method))
+
+    def search(line_edit, text):
+        line_edit.setText(text)
+        line_edit.clear()
+
+    record('search_clients', lambda: search(window.client_search, "maria"))
+    record('search_devices', lambda: search(window.device_search, "samsung"))
+
+    rng = random.Random(0)
+    client_ids = [c.id for c in window.service.list_clients()]
+    added = []
+
+    def add_client():
+        window.client_name.setText(f"Cliente de prueba {len(added)}")
+        window.client_phone.setText(f"7{rng.randint(0, 9999999):07d}")
+        timings.setdefault('add_client', []).append(frozen(window.add_client))
+
+    def add_device():
+        window.device_client.select_client(rng.choice(client_ids))
+        window.device_brand.setText("HP")
+        window.device_model.setText("Pavilion 15")
+        window.device_serial.setText(f"GUI{len(added):06d}")
+        window.device_issues.setPlainText("No enciende")
+        window.device_cost.setValue(45)
+        window.device_advance.setValue(10)
+        timings.setdefault('add_device', []).append(frozen(window.add_device))
+        device_id = max(d.id for d in window.service.devices_by_status("Recibido", 1))
+        window.service.change_status(device_id, "Listo")
+        # El cambio de estado no pasa por la ventana: hay que refrescar el combo de entregas
+        window.update_delivery_combo()
+        added.append(device_id)
+
+    def deliver_device():
+        device_id = added.pop()
+        index = window.delivery_device.findData(device_id)
+        if index < 0:
+            # Sin el equipo en el combo se mediría solo el aviso de "seleccione un equipo"
+            raise RuntimeError(f"El equipo {device_id} no está en el combo de entregas")
+        window.delivery_device.setCurrentIndex(index)
+        timings.setdefault('deliver_device', []).append(frozen(window.deliver_device))
+
+    for action in (add_client, add_device, deliver_device):
+        progress(f"  {action.__name__}...")
+        for _ in range(repeat):
+            action()
+    for name in ('add_client', 'add_device', 'deliver_device'):
+        results[name] = summarize(timings[name])
+
+    window.tabs.setCurrentIndex(3)
+    for report_type in ('diario', 'mensual', 'personalizado'):
+        record(f"report_{report_type}", lambda t=report_type: window.generate_report(t))
+    record('report_reingresos', window.generate_returns_report)
+    record('report_tiempos', window.generate_turnaround_report)
+
+    window.photo_ingest.shutdown()
+    return {'results': results, 'errors': errors, 'max_rss_mb': _memory_peak_mb()}
+
+
+def _memory_peak_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KiB y macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def cmd_generate(args):
+    os.makedirs(args.destino, exist_ok=True)
+    summary = generate_dataset(args.destino, args.equipos, args.clientes, args.semilla,
+                               args.imagenes, args.hasta, args.años)
+    print(f"{summary['devices']} equipos y {summary['clients']} clientes en {args.destino}")
+    return 0
+
+
+def cmd_run(args):
+    workspace = tempfile.mkdtemp(prefix='taller_benchmark_')
+    try:
+        database_dir = prepare_workspace(workspace)
+        print(f"Generando {args.equipos} equipos en {workspace}...")
+        start = time.perf_counter()
+        dataset = generate_dataset(database_dir, args.equipos, args.clientes, args.semilla,
+                                   args.imagenes, args.hasta, args.años)
+        dataset['generate_seconds'] = round(time.perf_counter() - start, 3)
+        dataset['equipos_json_bytes'] = os.path.getsize(os.path.join(database_dir, 'equipos.json'))
+
+        print("Midiendo:")
+        results = run_benchmarks(workspace, args.repeticiones)
+    finally:
+        if args.conservar:
+            print(f"Carpeta de prueba conservada en {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'date': datetime.now().strftime(DATE_FORMAT),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeticiones,
+            'max_rss_mb': _memory_peak_mb(),
+            'dataset': dataset,
+        },
+        'results': results,
+    }
+
+    _print_results(results)
+    _save_report(report, args.output)
+    return 0
+
+
+def _print_results(results):
+    print()
+    for name, stats in results.items():
+        if 'skipped' in stats:
+            print(f"{name:<26} omitido: {stats['skipped']}")
+        else:
+            print(f"{name:<26} mediana {stats['median'] * 1000:10.2f} ms   "
+                  f"mín {stats['min'] * 1000:10.2f} ms")
+
+
+def _save_report(report, path):
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en: {path}")
+
+
+# Se ejecuta con python -c dentro de la carpeta de prueba: importa su copia de benchmark.py
+GUI_WORKER = ("import json, sys, benchmark; "
+              "json.dump(benchmark.run_gui_benchmarks(sys.argv[1], int(sys.argv[2]), "
+              "lambda text: print(text, file=sys.stderr, flush=True)), sys.stdout)")
+
+
+def cmd_gui(args):
+    results = {}
+    datasets = {}
+    status = 0
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    for size in args.tamaños:
+        workspace = tempfile.mkdtemp(prefix='taller_benchmark_gui_')
+        try:
+            database_dir = prepare_workspace(workspace)
+            print(f"Generando {size} equipos en {workspace}...")
+            datasets[size] = generate_dataset(database_dir, size, None, args.semilla,
+                                              False, args.hasta, args.años)
+            print(f"Midiendo la ventana con {size} equipos:")
+            worker = subprocess.run([sys.executable, '-c', GUI_WORKER, workspace, str(args.repeticiones)],
+                                    cwd=workspace, env=env, stdout=subprocess.PIPE, text=True)
+            if worker.returncode != 0:
+                print(f"La medición con {size} equipos terminó con error", file=sys.stderr)
+                status = 1
+                continue
+            measured = json.loads(worker.stdout)
+        finally:
+            if args.conservar:
+                print(f"Carpeta de prueba conservada en {workspace}")
+            else:
+                shutil.rmtree(workspace, ignore_errors=True)
+        datasets[size]['max_rss_mb'] = measured['max_rss_mb']
+        for message in measured['errors']:
+            print(f"  la ventana mostró: {message}", file=sys.stderr)
+        # El tamaño va en el nombre: compare empareja cada acción con su mismo tamaño
+        for name, stats in measured['results'].items():
+            results[f"gui.{name}[{size}]"] = stats
+
+    report = {
+        'meta': {
+            'date': datetime.now().strftime(DATE_FORMAT),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeticiones,
+            'dataset': {'devices': list(args.tamaños), 'sizes': datasets},
+        },
+        'results': results,
+    }
+    _print_results(results)
+    _save_report(report, args.output)
+    return status
+
+
+def compare_results(base, new, threshold=DEFAULT_THRESHOLD):
+    """Filas (operación, mediana base, mediana nueva, cociente) y las que empeoraron"""
+    rows, regressions = [], []
+    for name, stats in new['results'].items():
+        before = base['results'].get(name)
+        if not before or 'median' not in before or 'median' not in stats:
+            continue
+        ratio = stats['median'] / before['median'] if before['median'] else float('inf')
+        rows.append((name, before['median'], stats['median'], ratio))
+        if ratio > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def cmd_compare(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.nuevo, encoding='utf-8') as f:
+        new = json.load(f)
+
+    base_size = base['meta']['dataset']['devices']
+    new_size = new['meta']['dataset']['devices']
+    if base_size != new_size:
+        print(f"Aviso: los datos no son del mismo tamaño ({base_size} y {new_size} equipos)")
+
+    rows, regressions = compare_results(base, new, args.umbral)
+    for name, before, after, ratio in rows:
+        mark = "  <-- más lento" if name in regressions else ""
+        print(f"{name:<26} {before * 1000:10.2f} ms -> {after * 1000:10.2f} ms  x{ratio:5.2f}{mark}")
+    if regressions:
+        print(f"\n{len(regressions)} operaciones empeoraron más de x{args.umbral}")
+        return 1
+    return 0
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha inválida (use AAAA-MM-DD): {value}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mediciones de rendimiento con datos sintéticos.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    dataset = argparse.ArgumentParser(add_help=False)
+    dataset.add_argument('--equipos', type=int, default=DEFAULT_DEVICES, help="Cantidad de equipos")
+    dataset.add_argument('--clientes', type=int, help="Cantidad de clientes (por defecto equipos/4)")
+    dataset.add_argument('--semilla', type=int, default=1, help="Semilla de los datos")
+    dataset.add_argument('--imagenes', action='store_true', help="Agregar fotos a parte de los equipos")
+    dataset.add_argument('--años', type=int, default=3, help="Años de historial")
+    dataset.add_argument('--hasta', type=parse_date, help="Fecha del último ingreso (AAAA-MM-DD, hoy por defecto)")
+
+    generate = subparsers.add_parser('generate', parents=[dataset], help="Genera una base de datos de prueba")
+    generate.add_argument('--destino', required=True, help="Carpeta donde escribir los JSON")
+    generate.set_defaults(func=cmd_generate)
+
+    run = subparsers.add_parser('run', parents=[dataset], help="Genera datos y mide las operaciones")
+    run.add_argument('--repeticiones', type=int, default=DEFAULT_REPEAT, help="Veces que se mide cada operación")
+    run.add_argument('--output', help="Archivo JSON de resultados")
+    run.add_argument('--conservar', action='store_true', help="No borrar la carpeta temporal")
+    run.set_defaults(func=cmd_run)
+
+    gui = subparsers.add_parser('gui', help="Mide cuánto se congela la ventana (sin pantalla)")
+    gui.add_argument('--tamaños', type=int, nargs='+', default=list(DEFAULT_GUI_SIZES),
+                     help="Cantidades de equipos a probar")
+    gui.add_argument('--semilla', type=int, default=1, help="Semilla de los datos")
+    gui.add_argument('--años', type=int, default=3, help="Años de historial")
+    gui.add_argument('--hasta', type=parse_date, help="Fecha del último ingreso (AAAA-MM-DD, hoy por defecto)")
+    gui.add_argument('--repeticiones', type=int, default=DEFAULT_REPEAT, help="Veces que se mide cada acción")
+    gui.add_argument('--output', help="Archivo JSON de resultados")
+    gui.add_argument('--conservar', action='store_true', help="No borrar las carpetas temporales")
+    gui.set_defaults(func=cmd_gui)
+
+    compare = subparsers.add_parser('compare', help="Compara dos archivos de resultados")
+    compare.add_argument('base')
+    compare.add_argument('nuevo')
+    compare.add_argument('--umbral', type=float, default=DEFAULT_THRESHOLD,
+                         help="Cociente de medianas a partir del cual se avisa (1.25 = 25%% más lento)")
+    compare.set_defaults(func=cmd_compare)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Registro de cambios de database/ para que otras instancias se pongan al día.
+
+Cada vez que ``DataService`` guarda clientes.json o equipos.json agrega una
+línea a database/cambios.jsonl con los registros que cambiaron y la firma
+del archivo antes y después de escribirlo. Otra instancia con el mismo
+archivo en memoria (su firma coincide con "antes") aplica solo esos
+registros en lugar de releer y reindexar todo; si no coincide, porque se
+perdió alguna entrada, vuelve a leer el archivo como siempre.
+
+La primera línea identifica la generación del registro. Al pasar de
+JOURNAL_MAX_BYTES se empieza uno nuevo; quien venía leyendo el anterior lo
+nota por la generación y recurre a las firmas de los archivos.
+"""
+
+import contextlib
+import json
+import os
+import tempfile
+import uuid
+
+from storage import JOURNAL_FILE
+
+JOURNAL_MAX_BYTES = 2 * 1024 * 1024
+
+# Con más registros que esto la entrada solo avisa que hay que releer el archivo
+JOURNAL_MAX_RECORDS = 1000
+
+
+class ChangeSet:
+    """IDs de clientes y equipos que otra instancia agregó, modificó o quitó.
+
+    ``all_clients``/``all_devices`` indican que el archivo se releyó entero y
+    no se sabe qué registros cambiaron.
+    """
+
+    __slots__ = ('clients', 'devices', 'deleted_clients', 'deleted_devices',
+                 'all_clients', 'all_devices')
+
+    def __init__(self):
+        self.clients = set()
+        self.devices = set()
+        self.deleted_clients = set()
+        self.deleted_devices = set()
+        self.all_clients = False
+        self.all_devices = False
+
+    def __bool__(self):
+        return bool(self.clients or self.devices or self.deleted_clients or self.deleted_devices
+                    or self.all_clients or self.all_devices)
+
+    def __repr__(self):
+        return (f"ChangeSet(clients={sorted(self.clients)}, devices={sorted(self.devices)}, "
+                f"deleted_clients={sorted(self.deleted_clients)}, "
+                f"deleted_devices={sorted(self.deleted_devices)}, "
+                f"all_clients={self.all_clients}, all_devices={self.all_devices})")
+
+
+def make_entry(file, before, after, upserts=(), deleted=()):
+    """Entrada del registro para un archivo guardado; ``upserts`` son registros con ``to_dict``"""
+    upserts = list(upserts)
+    entry = {'file': file, 'before': before, 'after': after}
+    if len(upserts) + len(deleted) > JOURNAL_MAX_RECORDS:
+        entry['reload'] = True
+    else:
+        entry['upsert'] = [record.to_dict() for record in upserts]
+        entry['delete'] = list(deleted)
+    return entry
+
+
+class Journal:
+    """Lectura y escritura de cambios.jsonl desde una instancia.
+
+    Las entradas propias llevan ``writer`` y se omiten al leer: la instancia
+    que escribió ya tiene esos cambios en memoria.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.writer = uuid.uuid4().hex
+        self._generation = None
+        self._offset = 0
+        self.seek_end()
+
+    @staticmethod
+    def _read_generation(f):
+        try:
+            return json.loads(f.readline())['generation']
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def seek_end(self):
+        """Da por leído todo lo escrito hasta ahora"""
+        try:
+            with open(self.path, 'rb') as f:
+                self._generation = self._read_generation(f)
+                f.seek(0, os.SEEK_END)
+                self._offset = f.tell()
+        except FileNotFoundError:
+            self._generation = None
+            self._offset = 0
+
+    def read(self):
+        """Entradas nuevas de otras instancias.
+
+        Devuelve None si el registro se reinició desde la última lectura: lo
+        que no se alcanzó a leer se perdió y hay que confiar en las firmas.
+        """
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return []
+        with f:
+            generation = self._read_generation(f)
+            if generation != self._generation:
+                lost = self._generation is not None
+                self._generation = generation
+                if lost:
+                    f.seek(0, os.SEEK_END)
+                    self._offset = f.tell()
+                    return None
+                # El registro no existía en la lectura anterior: todo lo que tiene es nuevo
+                self._offset = f.tell()
+            f.seek(self._offset)
+            data = f.read()
+
+        # Una línea sin su salto todavía se está escribiendo; queda para la próxima
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        entries = []
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and entry.get('writer') != self.writer:
+                entries.append(entry)
+        return entries
+
+    def append(self, entry):
+        """Agrega una entrada (llamar dentro de ``storage.write_lock()``)"""
+        line = (json.dumps(dict(entry, writer=self.writer)) + '\n').encode('utf-8')
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = None
+        if size is None or size + len(line) > JOURNAL_MAX_BYTES:
+            self._new_generation()
+        with open(self.path, 'ab') as f:
+            f.write(line)
+
+    def _new_generation(self):
+        header = json.dumps({'generation': uuid.uuid4().hex}) + '\n'
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', suffix='.tmp',
+                                        dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(header)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Modo de línea de comandos: reportes, documentos y backups sin interfaz gráfica.
+
+No importa PyQt5, así que funciona en servidores sin pantalla y desde cron:
+
+    python taller3.py report --range mensual --format pdf
+    python taller3.py tiempos --desde 2025-01-01 --hasta 2025-12-31
+    python taller3.py invoice --all
+    python taller3.py estado 15 Listo
+    python taller3.py ticket 15 --destino tcp://192.168.1.50:9100
+    python taller3.py cuenta 42 --format pdf
+    python taller3.py libro --desde 2025-04-01 --hasta 2025-04-30
+    python taller3.py backup
+    python taller3.py archive --dias 180
+    python taller3.py import equipos planilla.xlsx --map cost=Total
+    python taller3.py serve --host 0.0.0.0
+    python taller3.py sync conectar http://192.168.1.20:8765
+
+Los módulos de PDF (fpdf, qrcode) solo se importan en los comandos que
+generan documentos.
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+import archive
+import reports
+import storage
+from indexes import normalize_text
+from records import format_timestamp
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha inválida (use AAAA-MM-DD): {value}")
+
+
+def cmd_report(args):
+    if args.range == "personalizado" and (args.desde is None or args.hasta is None):
+        print("El reporte personalizado requiere --desde y --hasta", file=sys.stderr)
+        return 2
+
+    start_date, end_date = reports.report_range(args.range, args.desde, args.hasta)
+
+    # Solo se guardan en memoria los equipos del periodo
+    def in_range(device):
+        return device.date_received is not None and start_date <= device.date_received <= end_date
+
+    years = archive.DeviceArchive().years_between(start_date, end_date)
+    devices = list(all_devices(in_range, years))
+    report = reports.build_report(devices, args.range, start_date, end_date)
+
+    if args.format == "pdf":
+        import documents
+
+        path = documents.export_report_pdf(report, args.output)
+        print(f"Reporte exportado a: {path}")
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Reporte guardado en: {args.output}")
+    else:
+        print(report)
+    return 0
+
+
+def cmd_turnaround(args):
+    from service import DataService
+
+    service = DataService(auto_archive=False)
+    if args.reconstruir:
+        print(f"Tiempos recalculados con {service.rebuild_turnaround()} equipos entregados")
+    end_date = args.hasta or datetime.now()
+    start_date = args.desde or end_date.replace(month=1, day=1)
+    report = service.turnaround_report(start_date, end_date)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Reporte guardado en: {args.output}")
+    else:
+        print(report)
+    return 0
+
+
+def cmd_statement(args):
+    from service import DataService, NotFoundError
+
+    try:
+        report = DataService(auto_archive=False).client_statement(args.cliente)
+    except NotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.format == "pdf":
+        import documents
+
+        path = documents.export_report_pdf(report, args.output or documents.statement_path(args.cliente))
+        print(f"Estado de cuenta exportado a: {path}")
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Estado de cuenta guardado en: {args.output}")
+    else:
+        print(report)
+    return 0
+
+
+def cmd_filter(args):
+    from queries import DeviceFilter
+    from service import DataService
+
+    try:
+        device_filter = DeviceFilter.from_params(vars(args))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    service = DataService(auto_archive=False)
+    if args.plan:
+        for step in service.explain_filter(device_filter):
+            print(f"Plan: {step}", file=sys.stderr)
+    report = service.filter_report(device_filter)
+
+    if args.format == "pdf":
+        import documents
+
+        path = documents.export_report_pdf(report, args.output)
+        print(f"Reporte exportado a: {path}")
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"Reporte guardado en: {args.output}")
+    else:
+        print(report)
+    return 0
+
+
+def cmd_status(args):
+    from records import STATUSES
+    from service import DataService, ServiceError
+
+    service = DataService(auto_archive=False)
+    if args.equipo is None:
+        for status, count in service.status_counts().items():
+            print(f"{status}: {count}")
+        return 0
+    if args.nuevo is None:
+        device = service.get_device(args.equipo)
+        if device is None:
+            print("Equipo no encontrado", file=sys.stderr)
+            return 1
+        print(f"Equipo {device.id}: {device.status}")
+        for status, date in device.history:
+            print(f"  {format_timestamp(date)} {status}")
+        return 0
+    # Se acepta sin acentos ni mayúsculas: "diagnostico", "listo"...
+    status = {normalize_text(s): s for s in STATUSES}.get(normalize_text(args.nuevo).strip(), args.nuevo)
+    try:
+        device = service.change_status(args.equipo, status)
+    except ServiceError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Equipo {device.id}: {device.status}")
+    return 0
+
+
+def render_documents(devices, render, label):
+    """Genera un documento por equipo y devuelve el código de salida"""
+    clients = {c.id: c for c in storage.load_clients()}
+    errors = 0
+    for device in devices:
+        client = clients.get(device.client_id)
+        if client is None:
+            print(f"{label} del equipo {device.id}: cliente no encontrado", file=sys.stderr)
+            errors += 1
+            continue
+        try:
+            print(render(device, client))
+        except Exception as e:
+            print(f"{label} del equipo {device.id}: {e}", file=sys.stderr)
+            errors += 1
+    return 1 if errors else 0
+
+
+def all_devices(filter=None, years=None):
+    """Equipos activos y archivados para los que ``filter`` devuelve True (todos sin filtro).
+
+    Se leen de a uno a medida que se recorren, así ``--all`` no carga todo el
+    historial. ``years`` limita los años del archivo que se abren. Si se cortó
+    un archivado entre escribir la partición y equipos.json, el equipo está en
+    los dos: cuenta la copia activa, como en ``DataService``.
+    """
+    active_ids = set()
+    for device in storage.iter_devices():
+        active_ids.add(device.id)
+        if filter is None or filter(device):
+            yield device
+    yield from archive.DeviceArchive().iter_devices(
+        lambda d: d.id not in active_ids and (filter is None or filter(d)), years)
+
+
+def cmd_receipt(args):
+    import documents
+
+    wanted = set(args.ids)
+    if args.all:
+        selected, missing = all_devices(), []
+    else:
+        selected = list(all_devices(lambda d: d.id in wanted))
+        missing = sorted(wanted - {d.id for d in selected})
+    for device_id in missing:
+        print(f"Equipo no encontrado: {device_id}", file=sys.stderr)
+    render = documents.render_receipt if args.forzar else documents.cached_receipt
+    status = render_documents(selected, render, "Recibo")
+    return 1 if missing else status
+
+
+def cmd_ticket(args):
+    import thermal
+
+    options = thermal.PrinterOptions.from_settings()
+    if args.destino is not None:
+        options.destination = args.destino
+    if args.ancho is not None:
+        options.width = args.ancho
+    wanted = set(args.ids)
+    selected = list(all_devices(lambda d: d.id in wanted))
+    missing = sorted(wanted - {d.id for d in selected})
+    for device_id in missing:
+        print(f"Equipo no encontrado: {device_id}", file=sys.stderr)
+
+    def render(device, client):
+        return f"Ticket del equipo {device.id} enviado a {thermal.print_receipt(device, client, options)}"
+
+    status = render_documents(selected, render, "Ticket")
+    return 1 if missing else status
+
+
+def cmd_invoice(args):
+    import documents
+
+    wanted = set(args.facturas)
+    if args.all:
+        selected, missing = all_devices(lambda d: d.factura_num), []
+    else:
+        selected = list(all_devices(lambda d: d.factura_num in wanted))
+        missing = sorted(wanted - {d.factura_num for d in selected})
+    for factura_num in missing:
+        print(f"Factura no encontrada: {factura_num}", file=sys.stderr)
+    render = documents.render_invoice if args.forzar else documents.cached_invoice
+    status = render_documents(selected, render, "Factura")
+    return 1 if missing else status
+
+
+def cmd_invoice_book(args):
+    import documents
+    from service import DataService
+
+    end_date = args.hasta or datetime.now()
+    start_date = args.desde or end_date
+    invoices = DataService(auto_archive=False).invoices_between(start_date, end_date)
+    if not invoices:
+        print("No hay facturas en el periodo", file=sys.stderr)
+        return 1
+    path = documents.render_invoice_book(invoices, start_date, end_date, args.output)
+    print(f"Libro con {len(invoices)} facturas guardado en: {path}")
+    return 0
+
+
+def cmd_backup(args):
+    import backups
+
+    if args.historial:
+        for entry in storage.load_backup_catalog():
+            print(backups.catalog_line(entry))
+        return 0
+    try:
+        path = backups.create_backup()
+    except backups.BackupError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Backup creado y verificado en: {path}")
+    return 0
+
+
+def cmd_restore(args):
+    import zipfile
+
+    import backups
+
+    try:
+        backups.restore_backup(args.file)
+    except (OSError, zipfile.BadZipFile, backups.BackupError) as e:
+        print(f"No se pudo restaurar el backup: {e}", file=sys.stderr)
+        return 1
+    print("Backup restaurado correctamente")
+    return 0
+
+
+def cmd_archive(args):
+    from service import DataService
+
+    service = DataService(auto_archive=False)
+    archived = service.archive_delivered(args.dias)
+    print(f"Equipos archivados ahora: {archived}")
+    if archived:
+        # equipos.json cambió: la instantánea de arranque vieja ya no sirve
+        service.save_snapshot()
+    years = service.archive.years()
+    print(f"Equipos activos: {len(service.list_devices())}")
+    for year in years:
+        print(f"Archivo {year}: {service.archive.index['years'][str(year)]['count']} equipos")
+    return 0
+
+
+def cmd_import(args):
+    import importer
+    from service import DataService, ServiceError
+
+    mapping = {}
+    for item in args.map:
+        field, sep, header = item.partition('=')
+        if not sep:
+            print(f"Mapeo inválido (use campo=Columna): {item}", file=sys.stderr)
+            return 2
+        mapping[field.strip()] = header.strip()
+
+    try:
+        result = importer.import_file(DataService(), args.file, args.kind, mapping, args.batch_size,
+                                      progress=lambda rows: print(f"{rows} filas...", file=sys.stderr))
+    except ServiceError as e:
+        print(e, file=sys.stderr)
+        return 1
+    for line, message in result.errors:
+        print(f"Fila {line}: {message}", file=sys.stderr)
+    print(result.summary())
+    return 1 if result.errors else 0
+
+
+def cmd_serve(args):
+    import server
+
+    server.serve(args.host, args.port)
+    return 0
+
+
+def cmd_sync(args):
+    import sync
+    from service import DataService
+
+    try:
+        synchronizer = sync.Synchronizer(DataService(auto_archive=False))
+        if args.accion == "estado":
+            status = synchronizer.status()
+            state = sync.load_state()
+            print(f"Sucursal {status['sucursal']}")
+            for origin, seq in sorted(status['tiene'].items()):
+                print(f"Registro de la sucursal {origin}: {seq} cambios")
+            for peer, known in sorted(state['peers'].items(), key=lambda p: int(p[0])):
+                pending = sum(max(seq - known.get(str(origin), 0), 0)
+                              for origin, seq in status['tiene'].items())
+                print(f"Pendientes para la sucursal {peer}: {pending}")
+        elif args.accion == "exportar":
+            if args.para is None:
+                bundle = synchronizer.bundle()
+            else:
+                bundle = synchronizer.bundle_for(args.para)
+            sync.write_bundle(bundle, args.destino)
+            print(f"Paquete con {len(bundle['cambios'])} cambios guardado en: {args.destino}")
+        elif args.accion == "importar":
+            result = synchronizer.apply(sync.read_bundle(args.destino))
+            print(result.summary())
+        else:
+            result, remote = sync.exchange(synchronizer, args.destino)
+            print(f"Aquí: {result.summary()}")
+            print(f"Allá: {remote}")
+    except (sync.SyncError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="taller3.py",
+        description="Control de Reparaciones. Sin argumentos abre la interfaz gráfica.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="Genera un reporte de equipos recibidos")
+    report.add_argument("--range", choices=("diario", "semanal", "mensual", "personalizado"),
+                        default="diario", help="Periodo del reporte")
+    report.add_argument("--desde", type=parse_date, help="Inicio (AAAA-MM-DD) para personalizado")
+    report.add_argument("--hasta", type=parse_date, help="Fin (AAAA-MM-DD) para personalizado")
+    report.add_argument("--format", choices=("txt", "pdf"), default="txt")
+    report.add_argument("--output", help="Ruta de salida (por defecto stdout o recibos/)")
+    report.set_defaults(func=cmd_report)
+
+    filter_ = commands.add_parser("filtro", help="Reporte de los equipos que cumplen varias condiciones")
+    filter_.add_argument("--tipo", help="Tipo de equipo (Smartphone, Tablet...)")
+    filter_.add_argument("--marca", help="Marca")
+    filter_.add_argument("--modelo", help="Texto contenido en el modelo (\"iphone 13\")")
+    filter_.add_argument("--estado", help="Recibido, Diagnóstico, \"Esperando repuesto\", Listo o Entregado")
+    filter_.add_argument("--cliente", help="ID del cliente")
+    filter_.add_argument("--costo-min", help="Costo mínimo")
+    filter_.add_argument("--costo-max", help="Costo máximo")
+    filter_.add_argument("--recibido-desde", metavar="AAAA-MM-DD")
+    filter_.add_argument("--recibido-hasta", metavar="AAAA-MM-DD")
+    filter_.add_argument("--entregado-desde", metavar="AAAA-MM-DD")
+    filter_.add_argument("--entregado-hasta", metavar="AAAA-MM-DD")
+    filter_.add_argument("--format", choices=("txt", "pdf"), default="txt")
+    filter_.add_argument("--output", help="Ruta de salida (por defecto stdout o recibos/)")
+    filter_.add_argument("--plan", action="store_true",
+                         help="Muestra qué índices usa la consulta (en stderr)")
+    filter_.set_defaults(func=cmd_filter)
+
+    tiempos = commands.add_parser("tiempos", help="Reporte de tiempos de reparación por tipo, marca y mes")
+    tiempos.add_argument("--desde", type=parse_date, help="Primer mes (AAAA-MM-DD, por defecto enero)")
+    tiempos.add_argument("--hasta", type=parse_date, help="Último mes (AAAA-MM-DD, por defecto hoy)")
+    tiempos.add_argument("--output", help="Archivo de texto de salida (por defecto stdout)")
+    tiempos.add_argument("--reconstruir", action="store_true",
+                         help="Recalcula database/tiempos.json con todos los equipos")
+    tiempos.set_defaults(func=cmd_turnaround)
+
+    statement = commands.add_parser("cuenta", help="Estado de cuenta de un cliente: equipos, facturas y saldo")
+    statement.add_argument("cliente", type=int, help="ID del cliente")
+    statement.add_argument("--format", choices=("txt", "pdf"), default="txt")
+    statement.add_argument("--output", help="Ruta de salida (por defecto stdout o recibos/Estado_Cuenta_ID.pdf)")
+    statement.set_defaults(func=cmd_statement)
+
+    status = commands.add_parser("estado", help="Equipos por etapa, historial de un equipo o cambio de etapa")
+    status.add_argument("equipo", nargs="?", type=int, help="ID del equipo (sin él: cantidad por etapa)")
+    status.add_argument("nuevo", nargs="?",
+                        help="Etapa nueva: Recibido, Diagnóstico, \"Esperando repuesto\" o Listo")
+    status.set_defaults(func=cmd_status)
+
+    receipt = commands.add_parser("receipt", help="Genera recibos PDF")
+    receipt.add_argument("ids", nargs="*", type=int, help="IDs de equipo")
+    receipt.add_argument("--all", action="store_true", help="Todos los equipos")
+    receipt.add_argument("--forzar", action="store_true",
+                         help="Genera de nuevo aunque el PDF guardado esté al día")
+    receipt.set_defaults(func=cmd_receipt)
+
+    ticket = commands.add_parser("ticket", help="Imprime tickets de recepción en una impresora térmica")
+    ticket.add_argument("ids", nargs="+", type=int, help="IDs de equipo")
+    ticket.add_argument("--destino",
+                        help="Impresora (tcp://IP:9100, /dev/usb/lp0...) o archivo; por defecto [Impresora] destino")
+    ticket.add_argument("--ancho", type=int, choices=(58, 80),
+                        help="Ancho del papel en mm (por defecto [Impresora] ancho)")
+    ticket.set_defaults(func=cmd_ticket)
+
+    invoice = commands.add_parser("invoice", help="Regenera facturas PDF de equipos entregados")
+    invoice.add_argument("facturas", nargs="*", type=int, help="Números de factura")
+    invoice.add_argument("--all", action="store_true", help="Todas las facturas")
+    invoice.add_argument("--forzar", action="store_true",
+                         help="Genera de nuevo aunque el PDF guardado esté al día")
+    invoice.set_defaults(func=cmd_invoice)
+
+    book = commands.add_parser("libro", help="Libro de facturas: todas las del periodo en un PDF")
+    book.add_argument("--desde", type=parse_date, help="Primer día (AAAA-MM-DD, por defecto hoy)")
+    book.add_argument("--hasta", type=parse_date, help="Último día (AAAA-MM-DD, por defecto hoy)")
+    book.add_argument("--output", help="Ruta del PDF (por defecto facturas/Libro_Facturas_*.pdf)")
+    book.set_defaults(func=cmd_invoice_book)
+
+    backup = commands.add_parser("backup", help="Crea una copia de seguridad verificada de database/")
+    backup.add_argument("--historial", action="store_true",
+                        help="Muestra los backups hechos (backup/catalogo.json) en vez de crear uno")
+    backup.set_defaults(func=cmd_backup)
+
+    restore = commands.add_parser("restore", help="Restaura database/ desde un zip")
+    restore.add_argument("file", help="Archivo de backup (.zip)")
+    restore.set_defaults(func=cmd_restore)
+
+    archive_ = commands.add_parser("archive", help="Archiva por año los equipos entregados hace tiempo")
+    archive_.add_argument("--dias", type=int,
+                          help="Días desde la entrega (por defecto [Archivo] dias de settings.ini)")
+    archive_.set_defaults(func=cmd_archive)
+
+    import_ = commands.add_parser("import", help="Importa clientes o equipos desde CSV/XLSX")
+    import_.add_argument("kind", choices=("clientes", "equipos"))
+    import_.add_argument("file", help="Archivo .csv o .xlsx con encabezados en la primera fila")
+    import_.add_argument("--map", action="append", default=[], metavar="CAMPO=COLUMNA",
+                         help="Columna del archivo para un campo (name, phone, brand, cost...)")
+    import_.add_argument("--batch-size", type=int, default=20000,
+                         help="Filas por escritura (por defecto 20000)")
+    import_.set_defaults(func=cmd_import)
+
+    serve = commands.add_parser("serve", help="Atiende a otras terminales por HTTP/JSON")
+    serve.add_argument("--host", default="127.0.0.1",
+                       help="Dirección de escucha (0.0.0.0 para toda la red local)")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.set_defaults(func=cmd_serve)
+
+    sync_ = commands.add_parser("sync", help="Sincroniza con otras sucursales ([Sucursal] numero)")
+    sync_.add_argument("accion", choices=("estado", "exportar", "importar", "conectar"),
+                       help="exportar/importar un paquete, o conectar con el servidor de otra sucursal")
+    sync_.add_argument("destino", nargs="?",
+                       help="Archivo del paquete, o URL del servidor para conectar")
+    sync_.add_argument("--para", type=int,
+                       help="Al exportar: sucursal destino (solo lo que todavía no recibió)")
+    sync_.set_defaults(func=cmd_sync)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "receipt" and not (args.ids or args.all):
+        parser.error("indique IDs de equipo o --all")
+    if args.command == "invoice" and not (args.facturas or args.all):
+        parser.error("indique números de factura o --all")
+    if args.command == "sync" and args.accion != "estado" and not args.destino:
+        parser.error("indique el archivo del paquete o la URL del servidor")
+    storage.initialize_json_files()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Generación de recibos, facturas y reportes en PDF.
+
+Las funciones reciben los registros ya cargados y devuelven la ruta del PDF
+o el texto generado; no muestran diálogos ni abren el navegador, eso queda
+a cargo de quien las llama (la ventana principal o la línea de comandos).
+
+``cached_receipt``/``cached_invoice`` solo vuelven a generar el PDF si
+cambió algo de lo que muestra: junto a cada archivo se guarda, en la
+carpeta ``.claves``, un hash de los datos impresos, la versión del diseño y
+el logo. Así reenviar un recibo es instantáneo y nunca se manda uno viejo.
+"""
+
+import functools
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+from fpdf import FPDF
+import qrcode
+
+import metrics
+from records import PAYMENT_URL, Invoice, format_timestamp
+from storage import OUTPUT_DIR, FACTURAS_DIR, LOGO_PATH
+
+# Subir al cambiar el diseño de un documento: los PDF guardados se regeneran
+RECEIPT_TEMPLATE_VERSION = 1
+INVOICE_TEMPLATE_VERSION = 1
+CACHE_KEYS_DIR = ".claves"
+
+
+class PDF(FPDF):
+    def header(self):
+        self.set_font('Arial', 'B', 12)
+        self.cell(0, 10, 'CONTROL DE REPARACIONES', 0, 1, 'C')
+        self.ln(5)
+    
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
+
+
+def add_logo(pdf):
+    """Dibuja el logo en la esquina superior izquierda"""
+    if os.path.exists(LOGO_PATH):
+        try:
+            pdf.image(LOGO_PATH, x=10, y=8, w=30)
+        except Exception as e:
+            print(f"Error al cargar logo: {str(e)}")
+
+
+@functools.lru_cache(maxsize=256)
+def payment_qr_png(amount):
+    """PNG del QR de pago de un monto; los saldos se repiten mucho (0.00 sobre todo)"""
+    buffer = io.BytesIO()
+    qrcode.make(PAYMENT_URL.format(amount)).save(buffer)
+    return buffer.getvalue()
+
+
+def add_payment_qr(pdf, device):
+    """Dibuja el QR de pago con el saldo pendiente en la esquina superior derecha"""
+    try:
+        # fpdf identifica las imágenes en memoria por su contenido: dentro de un
+        # mismo PDF cada QR distinto se incrusta una sola vez
+        pdf.image(io.BytesIO(payment_qr_png(str(device.balance))), x=160, y=10, w=30)
+    except Exception as e:
+        print(f"Error generando QR: {str(e)}")
+
+
+def receipt_path(device_id):
+    return os.path.join(OUTPUT_DIR, f"Recibo_{device_id}.pdf")
+
+
+def factura_path(factura_num):
+    return os.path.join(FACTURAS_DIR, f"Factura_{factura_num}.pdf")
+
+
+def statement_path(client_id):
+    return os.path.join(OUTPUT_DIR, f"Estado_Cuenta_{client_id}.pdf")
+
+
+def invoice_book_path(start_date, end_date):
+    name = start_date.strftime('%Y%m%d')
+    if end_date.date() != start_date.date():
+        name += '_' + end_date.strftime('%Y%m%d')
+    return os.path.join(FACTURAS_DIR, f"Libro_Facturas_{name}.pdf")
+
+
+@metrics.timed('pdf.receipt')
+def render_receipt(device, client, output_path=None):
+    """Genera el recibo PDF de un equipo y devuelve su ruta"""
+    # Crear PDF con mejor formato
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    
+    # Encabezado con logo y datos
+    pdf.set_font('Arial', 'B', 16)
+    
+    # Logo a la izquierda
+    add_logo(pdf)
+    
+    # Título centrado
+    pdf.cell(0, 10, "RECIBO DE REPARACIÓN", 0, 1, 'C')
+    
+    # QR a la derecha
+    add_payment_qr(pdf, device)
+    
+    pdf.ln(20)  # Espacio después del encabezado
+    
+    # Información del cliente
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Cliente:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, client.name, 0, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Teléfono:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, client.phone, 0, 1)
+    
+    # La fecha de ingreso, no la de hoy: un recibo regenerado es idéntico al original
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Fecha:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, (device.date_received or datetime.now()).strftime("%d/%m/%Y %H:%M"), 0, 1)
+    
+    pdf.ln(10)
+    
+    # Detalles del equipo
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, "Detalles del Equipo", 0, 1)
+    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+    pdf.ln(5)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Tipo:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, device.type, 0, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Marca:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, device.brand, 0, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Modelo:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, device.model, 0, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "N° Serie:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, device.serial, 0, 1)
+    
+    pdf.ln(5)
+    
+    # Problemas reportados
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(0, 10, "Problemas reportados:", 0, 1)
+    pdf.set_font('Arial', '', 12)
+    pdf.multi_cell(0, 10, device.issues)
+    
+    pdf.ln(10)
+    
+    # Resumen financiero
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, "Resumen Financiero", 0, 1)
+    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+    pdf.ln(5)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(100, 10, "Concepto", 1)
+    pdf.cell(0, 10, "Monto", 1, 1)
+    
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(100, 10, "Costo total de reparación", 1)
+    pdf.cell(0, 10, f"${device.cost:.2f}", 1, 1)
+    
+    pdf.cell(100, 10, "Anticipo recibido", 1)
+    pdf.cell(0, 10, f"${device.advance:.2f}", 1, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(100, 10, "Saldo pendiente", 1)
+    pdf.cell(0, 10, f"${device.balance:.2f}", 1, 1)
+    
+    pdf.ln(15)
+    
+    # Notas
+    pdf.set_font('Arial', 'I', 10)
+    pdf.multi_cell(0, 10, "Nota: Este recibo es válido como comprobante de entrega del equipo. "
+                        "El pago pendiente debe ser cancelado al retirar el equipo.")
+    
+    # Guardar PDF
+    output_path = output_path or receipt_path(device.id)
+    pdf.output(output_path)
+    return output_path
+
+
+@metrics.timed('pdf.invoice')
+def render_invoice(device, client, output_path=None):
+    """Genera la factura PDF de un equipo entregado y devuelve su ruta.
+
+    El número y la fecha salen del propio equipo (``factura_num`` y
+    ``date_delivered``), así una factura regenerada es idéntica a la original.
+    """
+    invoice = Invoice.for_device(device, client)
+    pdf = PDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    draw_invoice(pdf, invoice)
+    
+    # Guardar factura
+    output_path = output_path or factura_path(invoice.number)
+    pdf.output(output_path)
+    return output_path
+
+
+def _logo_signature():
+    try:
+        stat = os.stat(LOGO_PATH)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def document_key(template, version, values):
+    """Hash de lo que muestra un documento: si no cambia, el PDF guardado sigue al día"""
+    data = json.dumps([template, version, _logo_signature(), values], default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def receipt_key(device, client):
+    return document_key('recibo', RECEIPT_TEMPLATE_VERSION, [
+        device.id, client.name, client.phone, device.type, device.brand, device.model,
+        device.serial, device.issues, device.cost, device.advance,
+        format_timestamp(device.date_received)])
+
+
+def invoice_key(device, client):
+    return document_key('factura', INVOICE_TEMPLATE_VERSION, [
+        device.factura_num, format_timestamp(device.date_delivered), client.name, client.nit,
+        client.address, device.type, device.brand, device.model, device.serial, device.issues,
+        device.cost, device.advance])
+
+
+def _key_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, CACHE_KEYS_DIR, name + '.sha256')
+
+
+def _render_cached(path, key, render):
+    """Devuelve ``path`` si ya se generó con ``key``; si no, llama a ``render(path)``"""
+    key_path = _key_path(path)
+    try:
+        with open(key_path, 'r') as f:
+            current = f.read().strip() == key
+    except FileNotFoundError:
+        current = False
+    if current and os.path.exists(path):
+        return path
+    render(path)
+    os.makedirs(os.path.dirname(key_path), exist_ok=True)
+    with open(key_path, 'w') as f:
+        f.write(key)
+    return path
+
+
+@metrics.timed('pdf.receipt_cached')
+def cached_receipt(device, client):
+    """Ruta del recibo al día; solo se genera si falta o cambió algún dato que muestra"""
+    return _render_cached(receipt_path(device.id), receipt_key(device, client),
+                          lambda path: render_receipt(device, client, path))
+
+
+@metrics.timed('pdf.invoice_cached')
+def cached_invoice(device, client):
+    """Ruta de la factura al día; solo se genera si falta o cambió algún dato que muestra"""
+    return _render_cached(factura_path(device.factura_num), invoice_key(device, client),
+                          lambda path: render_invoice(device, client, path))
+
+
+def draw_invoice(pdf, invoice):
+    """Dibuja una factura desde una página nueva de ``pdf``"""
+    device = invoice.device
+    client = invoice.client
+    factura_num = invoice.number
+    invoice_date = invoice.date
+    
+    pdf.add_page()
+    
+    # Encabezado con logo y número de factura
+    add_logo(pdf)
+    
+    pdf.set_font('Arial', 'B', 16)
+    pdf.cell(0, 10, f"FACTURA N° {factura_num}", 0, 1, 'C')
+    
+    # QR de pago
+    add_payment_qr(pdf, device)
+    
+    pdf.ln(20)
+    
+    # Información de la factura
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(40, 10, "Fecha:", 0, 0)
+    pdf.cell(0, 10, invoice_date.strftime("%d/%m/%Y %H:%M"), 0, 1)
+    
+    pdf.ln(10)
+    
+    # Datos del cliente
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, "Datos del Cliente", 0, 1)
+    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+    pdf.ln(5)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Nombre:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, client.name, 0, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "NIT/CI:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, client.nit, 0, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Dirección:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, client.address, 0, 1)
+    
+    pdf.ln(10)
+    
+    # Detalles del servicio
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, "Detalles del Servicio", 0, 1)
+    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+    pdf.ln(5)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Equipo:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, f"{device.type} {device.brand}", 0, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Modelo:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, device.model, 0, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(40, 10, "Serie:", 0, 0)
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, device.serial, 0, 1)
+    
+    pdf.ln(5)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(0, 10, "Descripción del servicio:", 0, 1)
+    pdf.set_font('Arial', '', 12)
+    pdf.multi_cell(0, 10, device.issues)
+    
+    pdf.ln(10)
+    
+    # Resumen financiero
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, "Resumen Financiero", 0, 1)
+    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+    pdf.ln(5)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(120, 10, "Concepto", 1)
+    pdf.cell(0, 10, "Monto", 1, 1)
+    
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(120, 10, "Reparación de equipo electrónico", 1)
+    pdf.cell(0, 10, f"${device.cost:.2f}", 1, 1)
+    
+    pdf.cell(120, 10, "Anticipo recibido", 1)
+    pdf.cell(0, 10, f"${device.advance:.2f}", 1, 1)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(120, 10, "Total a pagar", 1)
+    pdf.cell(0, 10, f"${device.balance:.2f}", 1, 1)
+    
+    pdf.ln(15)
+    
+    # Firmas
+    pdf.set_font('Arial', '', 10)
+    pdf.cell(90, 10, "_________________________", 0, 0, 'C')
+    pdf.cell(20, 10, "", 0, 0)
+    pdf.cell(90, 10, "_________________________", 0, 1, 'C')
+    pdf.cell(90, 5, "Firma del Cliente", 0, 0, 'C')
+    pdf.cell(20, 5, "", 0, 0)
+    pdf.cell(90, 5, "Firma del Técnico", 0, 1, 'C')
+
+
+@metrics.timed('pdf.invoice_book')
+def render_invoice_book(invoices, start_date, end_date, output_path=None):
+    """Genera el libro de facturas del periodo: una factura por página y un resumen al final.
+
+    ``invoices`` puede ser un generador de ``Invoice``: cada factura se dibuja
+    apenas llega. El logo y los QR repetidos se incrustan una sola vez en el
+    archivo, así que el tamaño crece solo con el contenido de cada factura.
+    Devuelve la ruta del PDF.
+    """
+    pdf = PDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    
+    rows = []
+    for invoice in invoices:
+        draw_invoice(pdf, invoice)
+        rows.append((invoice.number, invoice.date, invoice.client.name, invoice.total))
+    if not rows:
+        raise ValueError("No hay facturas en el periodo")
+    
+    # Resumen del libro
+    pdf.add_page()
+    pdf.set_font('Arial', 'B', 16)
+    pdf.cell(0, 10, "LIBRO DE FACTURAS", 0, 1, 'C')
+    pdf.set_font('Arial', '', 12)
+    pdf.cell(0, 10, f"Del {start_date.strftime('%d/%m/%Y')} al {end_date.strftime('%d/%m/%Y')}", 0, 1, 'C')
+    pdf.ln(5)
+    
+    pdf.set_font('Arial', 'B', 11)
+    pdf.cell(25, 8, "N°", 1)
+    pdf.cell(40, 8, "Fecha", 1)
+    pdf.cell(90, 8, "Cliente", 1)
+    pdf.cell(0, 8, "Total", 1, 1)
+    
+    pdf.set_font('Arial', '', 11)
+    for number, date, client_name, total in rows:
+        pdf.cell(25, 8, str(number), 1)
+        pdf.cell(40, 8, date.strftime("%d/%m/%Y %H:%M"), 1)
+        pdf.cell(90, 8, client_name[:40], 1)
+        pdf.cell(0, 8, f"${total:.2f}", 1, 1)
+    
+    pdf.set_font('Arial', 'B', 11)
+    pdf.cell(155, 8, f"{len(rows)} facturas", 1)
+    pdf.cell(0, 8, f"${sum(row[3] for row in rows):.2f}", 1, 1)
+    
+    output_path = output_path or invoice_book_path(start_date, end_date)
+    pdf.output(output_path)
+    return output_path
+
+
+@metrics.timed('pdf.report')
+def export_report_pdf(report_text, output_path=None):
+    """Exporta el texto de un reporte a PDF y devuelve su ruta"""
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_font('Arial', '', 12)
+    
+    # Dividir el texto en líneas y agregar al PDF
+    for line in report_text.split('\n'):
+        pdf.cell(0, 10, line, 0, 1)
+    
+    # Guardar PDF
+    output_path = output_path or os.path.join(
+        OUTPUT_DIR, f"Reporte_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+    pdf.output(output_path)
+    return output_path
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Importación masiva de clientes y equipos desde CSV o XLSX.
+
+El archivo se lee fila por fila (los XLSX con openpyxl en modo de solo
+lectura) y los registros válidos se acumulan en lotes: cada lote se guarda
+con una sola escritura de cada archivo JSON mediante
+``DataService.add_clients`` y ``DataService.add_devices``. Las filas con
+errores no detienen la importación; se informan con su número de fila.
+
+Los clientes se buscan antes de crearlos, por NIT, por teléfono o, si la
+fila no trae ninguno de los dos, por nombre; así importar dos veces el mismo
+archivo no duplica clientes.
+"""
+
+import csv
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+
+import metrics
+from indexes import normalize_text, normalize_serial
+from records import (Client, Device, DATE_FORMAT, ZERO, to_money, RECEIVED, STATUS_ALIASES,
+                     STATUSES as DEVICE_STATUSES)
+from service import ServiceError
+
+IMPORT_BATCH_SIZE = 20000
+
+# Campo -> nombres de columna aceptados (normalizados, sin acentos)
+CLIENT_COLUMNS = {
+    'name': ('nombre', 'cliente', 'nombre del cliente', 'name'),
+    'phone': ('telefono', 'tel', 'celular', 'movil', 'phone'),
+    'email': ('email', 'correo', 'correo electronico', 'e mail'),
+    'address': ('direccion', 'domicilio', 'address'),
+    'nit': ('nit', 'dui', 'nrc'),
+}
+
+DEVICE_COLUMNS = {
+    'client_name': ('cliente', 'nombre del cliente', 'nombre'),
+    'phone': CLIENT_COLUMNS['phone'],
+    'email': CLIENT_COLUMNS['email'],
+    'address': CLIENT_COLUMNS['address'],
+    'nit': CLIENT_COLUMNS['nit'],
+    'type': ('tipo', 'tipo de equipo', 'equipo'),
+    'brand': ('marca', 'brand'),
+    'model': ('modelo', 'model'),
+    'serial': ('serie', 'numero de serie', 'no de serie', 'serial', 's n'),
+    'issues': ('falla', 'fallas', 'problema', 'problemas', 'descripcion'),
+    'cost': ('costo', 'precio', 'total'),
+    'advance': ('anticipo', 'abono', 'adelanto'),
+    'status': ('estado',),
+    'date_received': ('fecha', 'fecha de ingreso', 'fecha recibido', 'recibido'),
+    'date_delivered': ('fecha de entrega', 'fecha entregado', 'entregado'),
+}
+
+# Tipos de importación: (columnas, campos obligatorios)
+IMPORT_KINDS = {
+    'clientes': (CLIENT_COLUMNS, ('name',)),
+    'equipos': (DEVICE_COLUMNS, ('brand', 'model')),
+}
+
+# Nombres de los campos para mostrar al elegir columnas
+FIELD_LABELS = {
+    'name': "Nombre", 'client_name': "Cliente", 'phone': "Teléfono", 'email': "Email",
+    'address': "Dirección", 'nit': "NIT", 'type': "Tipo", 'brand': "Marca", 'model': "Modelo",
+    'serial': "Serie", 'issues': "Problemas", 'cost': "Costo", 'advance': "Anticipo",
+    'status': "Estado", 'date_received': "Fecha de ingreso", 'date_delivered': "Fecha de entrega",
+}
+
+DATE_INPUT_FORMATS = (DATE_FORMAT, "%Y-%m-%d", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M",
+                      "%d/%m/%Y", "%d-%m-%Y")
+
+
+class ImportResult:
+    """Resumen de una importación"""
+
+    def __init__(self):
+        self.rows = 0
+        self.clients = 0
+        self.devices = 0
+        self.duplicates = 0
+        self.errors = []    # (número de fila, mensaje)
+
+    def summary(self):
+        return (f"Filas leídas: {self.rows}\n"
+                f"Clientes nuevos: {self.clients}\n"
+                f"Equipos nuevos: {self.devices}\n"
+                f"Duplicados omitidos: {self.duplicates}\n"
+                f"Filas con errores: {len(self.errors)}")
+
+
+def normalize_header(header):
+    return ' '.join(re.findall(r"[0-9a-z]+", normalize_text(header)))
+
+
+# Estados aceptados en la planilla (sin acentos ni mayúsculas); "En reparación" es el de antes
+STATUSES = {normalize_header(status): status for status in DEVICE_STATUSES}
+STATUSES.update((normalize_header(alias), status) for alias, status in STATUS_ALIASES.items())
+
+
+def _cell_text(value):
+    """Texto de una celda; los números enteros de Excel llegan como float"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _open_csv(path):
+    with open(path, 'rb') as f:
+        sample = f.read(65536)
+    try:
+        sample.decode('utf-8')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        # Excel en Windows guarda los CSV en cp1252
+        encoding = 'cp1252'
+    text = sample.decode(encoding, errors='ignore')
+    try:
+        dialect = csv.Sniffer().sniff(text, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    with open(path, 'r', encoding=encoding, newline='') as f:
+        yield from csv.reader(f, dialect)
+
+
+def _open_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ServiceError("Instale openpyxl para importar archivos XLSX: pip install openpyxl")
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell_text(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_table(path):
+    """Recorre las filas del archivo como listas de texto, empezando por los encabezados"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        return _open_xlsx(path)
+    if ext in ('.csv', '.txt'):
+        return _open_csv(path)
+    raise ServiceError(f"Formato no soportado: {ext or path} (use CSV o XLSX)")
+
+
+def read_headers(path):
+    """Encabezados del archivo, para elegir el mapeo de columnas"""
+    rows = read_table(path)
+    try:
+        return next(rows, [])
+    finally:
+        rows.close()
+
+
+def guess_mapping(headers, kind):
+    """Campo -> encabezado del archivo, reconociendo los nombres habituales"""
+    columns, _ = IMPORT_KINDS[kind]
+    normalized = {normalize_header(h): h for h in reversed(headers) if h}
+    mapping = {}
+    for field, aliases in columns.items():
+        for alias in aliases:
+            if alias in normalized and normalized[alias] not in mapping.values():
+                mapping[field] = normalized[alias]
+                break
+    return mapping
+
+
+def _column_positions(headers, kind, mapping):
+    columns, required = IMPORT_KINDS[kind]
+    mapping = dict(guess_mapping(headers, kind), **(mapping or {}))
+    positions = {}
+    for field, header in mapping.items():
+        if field not in columns:
+            raise ServiceError(f"Campo desconocido para {kind}: {field}")
+        if not header:
+            continue
+        if header not in headers:
+            raise ServiceError(f"La columna '{header}' no existe en el archivo")
+        positions[field] = headers.index(header)
+
+    missing = [f for f in required if f not in positions]
+    if kind == 'equipos' and not positions.keys() & {'client_name', 'phone', 'nit'}:
+        missing.append('client_name')
+    if missing:
+        raise ServiceError("Faltan columnas para: " + ", ".join(missing))
+    return positions
+
+
+def parse_amount(text):
+    """"$1,234.50", "1.234,50", "1234,5" o "" -> Decimal; error si no es un monto válido"""
+    text = text.replace('$', '').replace(' ', '')
+    if not text:
+        return ZERO
+    if ',' in text and '.' in text:
+        # El separador que aparece último es el decimal
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        whole, _, decimals = text.rpartition(',')
+        text = f"{whole}.{decimals}" if len(decimals) <= 2 and ',' not in whole else text.replace(',', '')
+    value = to_money(text)
+    if not value.is_finite() or value < 0:
+        raise ValueError("monto negativo")
+    return value
+
+
+@lru_cache(maxsize=4096)
+def parse_date(text):
+    """Fecha en cualquiera de DATE_INPUT_FORMATS -> datetime (None si vacía)"""
+    if not text:
+        return None
+    for fmt in DATE_INPUT_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"fecha no reconocida: {text}")
+
+
+def client_keys(record):
+    """Claves de duplicado de un cliente: NIT, teléfono y nombre"""
+    keys = []
+    nit = ''.join(re.findall(r"[0-9a-z]+", normalize_text(record.nit)))
+    if nit:
+        keys.append(('nit', nit))
+    phone = ''.join(ch for ch in record.phone if ch.isdigit())
+    if len(phone) >= 7:
+        keys.append(('phone', phone[-8:]))
+    name = normalize_header(record.name)
+    if name:
+        keys.append(('name', name))
+    return keys
+
+
+class _ClientDirectory:
+    """Clientes existentes y ya importados, buscables por sus claves de duplicado"""
+
+    def __init__(self, clients):
+        self._by_key = {}
+        for client in clients:
+            self.register(client)
+
+    def register(self, client):
+        for key in client_keys(client):
+            self._by_key.setdefault(key, client)
+
+    def find(self, record):
+        keys = client_keys(record)
+        strong = [k for k in keys if k[0] != 'name']
+        # El nombre solo identifica al cliente si la fila no trae NIT ni teléfono
+        for key in strong or keys:
+            if key in self._by_key:
+                return self._by_key[key]
+        return None
+
+
+class Importer:
+    """Importa un archivo en lotes sobre ``service`` (un ``DataService``).
+
+    ``mapping`` (campo -> encabezado) completa o corrige el mapeo que se
+    deduce de los encabezados; un encabezado vacío ignora el campo.
+    ``progress(filas)`` se llama después de guardar cada lote.
+    """
+
+    def __init__(self, service, kind, mapping=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        if kind not in IMPORT_KINDS:
+            raise ServiceError(f"Tipo de importación desconocido: {kind}")
+        self.service = service
+        self.kind = kind
+        self.mapping = mapping
+        self.batch_size = max(1, batch_size)
+        self.progress = progress
+        self.result = ImportResult()
+        self._clients = None
+        self._device_keys = None
+        self._pending_clients = []
+        self._pending_devices = []
+        # id() de cada cliente importado -> ID que le asignó el servicio; el
+        # directorio de clientes los mantiene vivos, así que id() no se repite
+        self._created_ids = {}
+
+    @metrics.timed('import.run')
+    def run(self, path):
+        rows = read_table(path)
+        try:
+            headers = next(rows, None)
+            if headers is None:
+                raise ServiceError("El archivo está vacío")
+            positions = _column_positions(headers, self.kind, self.mapping)
+
+            self._clients = _ClientDirectory(self.service.list_clients())
+            if self.kind == 'equipos':
+                # También los archivados: reimportar un historial viejo no debe duplicarlo
+                existing = self.service.list_devices() + self.service.archive.devices()
+                self._device_keys = {self._device_key(d) for d in existing if d.date_received}
+
+            handle = self._client_row if self.kind == 'clientes' else self._device_row
+            for line, row in enumerate(rows, start=2):
+                values = {field: row[pos].strip() if pos < len(row) else ''
+                          for field, pos in positions.items()}
+                if not any(values.values()):
+                    continue
+                self.result.rows += 1
+                try:
+                    handle(values)
+                except ValueError as e:
+                    self.result.errors.append((line, str(e)))
+                if len(self._pending_clients) + len(self._pending_devices) >= self.batch_size:
+                    self.flush()
+            self.flush()
+        finally:
+            rows.close()
+        return self.result
+
+    def flush(self):
+        """Guarda el lote acumulado: primero los clientes nuevos, luego los equipos"""
+        if self._pending_clients:
+            created = self.service.add_clients(self._pending_clients)
+            for pending, client in zip(self._pending_clients, created):
+                self._created_ids[id(pending)] = client.id
+            self.result.clients += len(created)
+            self._pending_clients = []
+        if self._pending_devices:
+            devices = [device.replace(client_id=self._client_id(client))
+                       for device, client in self._pending_devices]
+            self.result.devices += len(self.service.add_devices(devices))
+            self._pending_devices = []
+        if self.progress:
+            self.progress(self.result.rows)
+
+    def _client_id(self, client):
+        """ID de un cliente existente o de uno importado en un lote ya guardado"""
+        return client.id if client.id is not None else self._created_ids[id(client)]
+
+    def _new_client(self, client):
+        existing = self._clients.find(client)
+        if existing is not None:
+            return existing, False
+        # Todavía sin ID: se asigna al guardar el lote
+        self._pending_clients.append(client)
+        self._clients.register(client)
+        return client, True
+
+    def _client_row(self, values):
+        if not values.get('name'):
+            raise ValueError("falta el nombre del cliente")
+        _, created = self._new_client(Client(None, values['name'], values.get('phone', ''),
+                                             values.get('email', ''), values.get('address', ''),
+                                             values.get('nit', '')))
+        if not created:
+            self.result.duplicates += 1
+
+    @staticmethod
+    def _device_key(device, owner=None):
+        """Clave de duplicado; ``owner`` reemplaza al ID para los clientes importados"""
+        serial = normalize_serial(device.serial) or normalize_serial(f"{device.brand} {device.model}")
+        return (device.client_id if owner is None else owner, serial, device.date_received)
+
+    def _device_row(self, values):
+        if not values.get('brand') or not values.get('model'):
+            raise ValueError("marca y modelo son obligatorios")
+
+        client_data = Client(None, values.get('client_name', ''), values.get('phone', ''),
+                             values.get('email', ''), values.get('address', ''),
+                             values.get('nit', ''))
+        client = self._clients.find(client_data)
+        if client is None and not client_data.name:
+            raise ValueError("cliente no encontrado y la fila no trae su nombre")
+
+        try:
+            cost = parse_amount(values.get('cost', ''))
+            advance = parse_amount(values.get('advance', ''))
+        except ValueError:
+            raise ValueError(f"monto inválido: {values.get('cost', '')} / {values.get('advance', '')}")
+        status = values.get('status', '')
+        if status and normalize_header(status) not in STATUSES:
+            raise ValueError(f"estado desconocido: {status}")
+        date_received = parse_date(values.get('date_received', ''))
+        date_delivered = parse_date(values.get('date_delivered', ''))
+
+        # El cliente nuevo se registra recién con la fila entera válida
+        if client is None:
+            client, _ = self._new_client(client_data)
+        device = Device(None, client.id, type=values.get('type', ''), brand=values['brand'],
+                        model=values['model'], serial=values.get('serial', ''),
+                        issues=values.get('issues', ''), cost=cost, advance=advance,
+                        status=STATUSES.get(normalize_header(status), RECEIVED),
+                        date_received=date_received, date_delivered=date_delivered)
+
+        # Sin fecha de ingreso no hay forma fiable de reconocer un duplicado
+        if date_received:
+            # Los clientes importados no tienen ID hasta guardar el lote
+            key = self._device_key(device, None if client.id is not None else ('importado', id(client)))
+            if key in self._device_keys:
+                self.result.duplicates += 1
+                return
+            self._device_keys.add(key)
+
+        # El cliente puede estar pendiente: su ID se completa al guardar el lote
+        self._pending_devices.append((device, client))
+
+
+def import_file(service, path, kind, mapping=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Importa ``path`` y devuelve un ``ImportResult``"""
+    return Importer(service, kind, mapping, batch_size, progress).run(path)
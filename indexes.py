@@ -0,0 +1,660 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Índices en memoria para búsquedas rápidas sobre clientes y equipos"""
+
+import bisect
+import heapq
+import itertools
+import re
+import unicodedata
+
+# Los prefijos más cortos que esto solo coinciden con tokens exactos; un prefijo
+# de una letra expandiría a casi todo el vocabulario.
+MIN_PREFIX_LENGTH = 2
+
+# Hasta cuántas coincidencias conviene unir y ordenar de una vez, y con cuántas
+# listas todavía compensa una mezcla ordenada; por encima de ambos el prefijo es
+# tan frecuente que es más rápido recorrer todos los ids y filtrar.
+_MATERIALIZE_LIMIT = 20000
+_MERGE_WAYS = 32
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+def normalize_text(text):
+    """Pasa el texto a minúsculas y elimina acentos ("Reparación" -> "reparacion")"""
+    text = str(text or '')
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    """Divide el texto normalizado en tokens alfanuméricos"""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+# Hasta esta cantidad de elementos nuevos se insertan uno por uno; con más
+# conviene agregarlos al final y reordenar la lista entera
+INSORT_LIMIT = 64
+
+
+def _merge_sorted(items, new_items):
+    """Agrega ``new_items`` a la lista ordenada ``items`` manteniéndola ordenada"""
+    if len(new_items) <= INSORT_LIMIT:
+        for item in new_items:
+            bisect.insort(items, item)
+    else:
+        items.extend(new_items)
+        items.sort()
+
+
+class SearchIndex:
+    """Índice invertido token -> ids con búsqueda por prefijo.
+
+    ``fields`` son los atributos del registro que se indexan. En ``compact_fields``
+    (teléfono, NIT, serie) además se indexa el valor sin separadores, para que
+    "7777-8888" también se encuentre escribiendo "77778888".
+
+    Cada lista de ids se mantiene ordenada; como los ids nuevos siempre son
+    mayores, agregar un registro casi siempre es un ``append``. Así la búsqueda
+    puede recorrer los resultados del más reciente al más antiguo y detenerse
+    al llegar al límite sin materializar todas las coincidencias.
+    """
+
+    def __init__(self, fields, compact_fields=()):
+        self.fields = tuple(fields)
+        self.compact_fields = frozenset(compact_fields)
+        self._postings = {}     # token -> lista ordenada de ids
+        self._vocab = []        # tokens ordenados para expandir prefijos
+        self._doc_tokens = {}   # id -> frozenset de tokens del registro
+        self._docs = {}         # id -> registro indexado
+        self._ids = []          # todos los ids, ordenados
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def get(self, doc_id):
+        """Devuelve el registro indexado con ese id o None"""
+        return self._docs.get(doc_id)
+
+    def _record_tokens(self, record):
+        tokens = set()
+        for field in self.fields:
+            value_tokens = tokenize(getattr(record, field, ''))
+            tokens.update(value_tokens)
+            if field in self.compact_fields and len(value_tokens) > 1:
+                tokens.add(''.join(value_tokens))
+        return frozenset(tokens)
+
+    def rebuild(self, records):
+        """Reconstruye el índice completo a partir de una lista de registros"""
+        self._postings = {}
+        self._doc_tokens = {}
+        self._docs = {}
+        for record in records:
+            doc_id = record.id
+            tokens = self._record_tokens(record)
+            self._docs[doc_id] = record
+            self._doc_tokens[doc_id] = tokens
+            for token in tokens:
+                self._postings.setdefault(token, []).append(doc_id)
+        for postings in self._postings.values():
+            postings.sort()
+        self._vocab = sorted(self._postings)
+        self._ids = sorted(self._docs)
+
+    def _insert(self, record):
+        """Indexa un registro y devuelve los tokens que no estaban en el vocabulario"""
+        doc_id = record.id
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        tokens = self._record_tokens(record)
+        self._docs[doc_id] = record
+        self._doc_tokens[doc_id] = tokens
+        if not self._ids or self._ids[-1] < doc_id:
+            self._ids.append(doc_id)
+        else:
+            bisect.insort(self._ids, doc_id)
+        new_tokens = []
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                self._postings[token] = [doc_id]
+                new_tokens.append(token)
+            elif postings[-1] < doc_id:
+                postings.append(doc_id)
+            else:
+                bisect.insort(postings, doc_id)
+        return new_tokens
+
+    def add(self, record):
+        """Agrega o reemplaza un registro de forma incremental"""
+        for token in self._insert(record):
+            bisect.insort(self._vocab, token)
+
+    def add_many(self, records):
+        """Agrega o reemplaza varios registros; el vocabulario se ordena una sola vez"""
+        new_tokens = []
+        for record in records:
+            new_tokens.extend(self._insert(record))
+        _merge_sorted(self._vocab, new_tokens)
+
+    def remove(self, doc_id):
+        """Quita un registro del índice; no hace nada si no existe"""
+        if self._docs.pop(doc_id, None) is None:
+            return
+        pos = bisect.bisect_left(self._ids, doc_id)
+        del self._ids[pos]
+        for token in self._doc_tokens.pop(doc_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            pos = bisect.bisect_left(postings, doc_id)
+            if pos < len(postings) and postings[pos] == doc_id:
+                del postings[pos]
+            if not postings:
+                del self._postings[token]
+                pos = bisect.bisect_left(self._vocab, token)
+                if pos < len(self._vocab) and self._vocab[pos] == token:
+                    del self._vocab[pos]
+
+    def _expand(self, term):
+        """Tokens del vocabulario que empiezan con ``term``"""
+        if len(term) < MIN_PREFIX_LENGTH:
+            return [term] if term in self._postings else []
+        vocab = self._vocab
+        start = bisect.bisect_left(vocab, term)
+        end = bisect.bisect_left(vocab, term + '\uffff', start)
+        return vocab[start:end]
+
+    def _iter_descending(self, term, tokens, cost):
+        """Ids que coinciden con ``term`` sin repetir, de mayor a menor"""
+        postings = self._postings
+        if len(tokens) == 1:
+            return reversed(postings[tokens[0]])
+        if cost <= _MATERIALIZE_LIMIT:
+            return sorted(set().union(*(postings[t] for t in tokens)), reverse=True)
+        if len(tokens) <= _MERGE_WAYS:
+            merged = heapq.merge(*(reversed(postings[t]) for t in tokens), reverse=True)
+            return (doc_id for doc_id, _ in itertools.groupby(merged))
+        doc_tokens = self._doc_tokens
+        return (doc_id for doc_id in reversed(self._ids)
+                if any(tok.startswith(term) for tok in doc_tokens[doc_id]))
+
+    def search(self, query, limit=None):
+        """Ids que contienen todos los términos de ``query`` (por prefijo).
+
+        Los resultados se devuelven del id más reciente al más antiguo. Una
+        consulta vacía devuelve una lista vacía; quien llama decide si eso
+        significa "mostrar todo".
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        expansions = []
+        for term in terms:
+            tokens = self._expand(term)
+            if not tokens:
+                return []
+            cost = sum(len(self._postings[t]) for t in tokens)
+            expansions.append((cost, term, tokens))
+        expansions.sort()
+
+        # El término más selectivo genera los candidatos; los demás se
+        # verifican contra los tokens de cada candidato.
+        driver_cost, driver_term, driver = expansions[0]
+        required = frozenset(tokens[0] for _, _, tokens in expansions[1:] if len(tokens) == 1)
+        prefixes = [term for _, term, tokens in expansions[1:] if len(tokens) > 1]
+
+        results = []
+        doc_tokens = self._doc_tokens
+        for doc_id in self._iter_descending(driver_term, driver, driver_cost):
+            own = doc_tokens[doc_id]
+            if required and not required <= own:
+                continue
+            if prefixes and not all(any(tok.startswith(term) for tok in own) for term in prefixes):
+                continue
+            results.append(doc_id)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+
+def name_phone_keys(record):
+    """Claves de prefijo de un cliente: nombre y teléfono desde cada palabra o grupo"""
+    words = tokenize(record.name)
+    keys = {' '.join(words[i:]) for i in range(len(words))}
+    groups = re.findall(r"[0-9]+", record.phone)
+    keys.update(''.join(groups[i:]) for i in range(len(groups)))
+    return keys
+
+
+class PrefixIndex:
+    """Lista ordenada de pares (clave, id) para autocompletar por prefijo.
+
+    ``key_func`` devuelve las claves normalizadas de un registro. Buscar un
+    prefijo es una bisección más un recorrido de las claves que empiezan con
+    él, así que el costo depende de los resultados pedidos y no del total.
+    """
+
+    def __init__(self, key_func=name_phone_keys):
+        self.key_func = key_func
+        self._entries = []   # (clave, id) ordenados
+        self._keys = {}      # id -> claves del registro
+        self._docs = {}      # id -> registro
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def get(self, doc_id):
+        """Devuelve el registro con ese id o None"""
+        return self._docs.get(doc_id)
+
+    def rebuild(self, records):
+        """Reconstruye el índice completo"""
+        self._entries = []
+        self._keys = {}
+        self._docs = {}
+        for record in records:
+            doc_id = record.id
+            keys = self.key_func(record)
+            self._docs[doc_id] = record
+            self._keys[doc_id] = keys
+            self._entries.extend((key, doc_id) for key in keys)
+        self._entries.sort()
+
+    def add(self, record):
+        """Agrega o reemplaza un registro"""
+        doc_id = record.id
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        keys = self.key_func(record)
+        self._docs[doc_id] = record
+        self._keys[doc_id] = keys
+        for key in keys:
+            bisect.insort(self._entries, (key, doc_id))
+
+    def add_many(self, records):
+        """Agrega o reemplaza varios registros ordenando las entradas una sola vez"""
+        new_entries = []
+        for record in records:
+            doc_id = record.id
+            if doc_id in self._docs:
+                self.remove(doc_id)
+            keys = self.key_func(record)
+            self._docs[doc_id] = record
+            self._keys[doc_id] = keys
+            new_entries.extend((key, doc_id) for key in keys)
+        _merge_sorted(self._entries, new_entries)
+
+    def remove(self, doc_id):
+        """Quita un registro; no hace nada si no existe"""
+        self._docs.pop(doc_id, None)
+        for key in self._keys.pop(doc_id, ()):
+            pos = bisect.bisect_left(self._entries, (key, doc_id))
+            if pos < len(self._entries) and self._entries[pos] == (key, doc_id):
+                del self._entries[pos]
+
+    def _scan(self, prefix, seen, results, limit):
+        entries = self._entries
+        # Sin prefijo se listan solo las claves de nombre, que empiezan después
+        # de las de teléfono (los dígitos ordenan antes que ":")
+        pos = bisect.bisect_left(entries, (prefix or ':',))
+        while pos < len(entries) and len(results) < limit:
+            key, doc_id = entries[pos]
+            if not key.startswith(prefix):
+                break
+            if doc_id not in seen:
+                seen.add(doc_id)
+                results.append(doc_id)
+            pos += 1
+
+    def search(self, text, limit=50):
+        """Ids cuyas claves empiezan con ``text``, en orden alfabético de clave.
+
+        Un texto vacío devuelve los primeros ``limit`` registros.
+        """
+        seen = set()
+        results = []
+        words = tokenize(text)
+        self._scan(' '.join(words), seen, results, limit)
+        digits = ''.join(ch for ch in str(text) if ch.isdigit())
+        if digits and len(results) < limit:
+            self._scan(digits, seen, results, limit)
+        return results
+
+
+def normalize_serial(serial):
+    """Número de serie sin espacios, guiones ni acentos y en mayúsculas"""
+    return ''.join(tokenize(serial)).upper()
+
+
+class SerialIndex:
+    """Índices hash de equipos por número de serie y por marca+modelo.
+
+    Guarda solo ids; los registros se resuelven con el índice de equipos. Cada
+    consulta es una búsqueda en diccionario, sin importar cuánto historial haya.
+    """
+
+    def __init__(self):
+        self._by_serial = {}   # serie normalizada -> ids en orden de ingreso
+        self._by_model = {}    # (marca, modelo) normalizados -> ids
+        self._keys = {}        # id -> (serie, (marca, modelo))
+
+    @staticmethod
+    def model_key(brand, model):
+        return (' '.join(tokenize(brand)), ' '.join(tokenize(model)))
+
+    def rebuild(self, devices):
+        """Reconstruye ambos índices"""
+        self._by_serial = {}
+        self._by_model = {}
+        self._keys = {}
+        for device in sorted(devices, key=lambda d: d.id):
+            self.add(device)
+
+    def add(self, device):
+        """Registra un equipo; si ya existía se actualizan sus claves"""
+        doc_id = device.id
+        if doc_id in self._keys:
+            self.remove(doc_id)
+        serial = normalize_serial(device.serial)
+        model = self.model_key(device.brand, device.model)
+        self._keys[doc_id] = (serial, model)
+        if serial:
+            bisect.insort(self._by_serial.setdefault(serial, []), doc_id)
+        if any(model):
+            bisect.insort(self._by_model.setdefault(model, []), doc_id)
+
+    def add_many(self, devices):
+        """Registra varios equipos"""
+        for device in devices:
+            self.add(device)
+
+    def remove(self, doc_id):
+        """Quita un equipo de ambos índices"""
+        keys = self._keys.pop(doc_id, None)
+        if keys is None:
+            return
+        serial, model = keys
+        for table, key in ((self._by_serial, serial), (self._by_model, model)):
+            ids = table.get(key)
+            if ids and doc_id in ids:
+                ids.remove(doc_id)
+                if not ids:
+                    del table[key]
+
+    def serials(self):
+        """Diccionario serie -> ids (no modificar)"""
+        return self._by_serial
+
+    def by_serial(self, serial):
+        """Ids de los equipos con esa serie, del más antiguo al más reciente"""
+        return list(self._by_serial.get(normalize_serial(serial), ()))
+
+    def by_model(self, brand, model):
+        """Ids de los equipos de esa marca y modelo"""
+        return list(self._by_model.get(self.model_key(brand, model), ()))
+
+    def most_returning(self, limit=20):
+        """Pares (serie, ids) con más de un ingreso, los más frecuentes primero"""
+        repeats = ((serial, ids) for serial, ids in self._by_serial.items() if len(ids) > 1)
+        return heapq.nlargest(limit, repeats, key=lambda item: (len(item[1]), item[1][-1]))
+
+
+class ClientDeviceIndex:
+    """Índice hash cliente -> equipos, y cliente -> equipos facturados.
+
+    Como SerialIndex guarda solo ids. El historial y el estado de cuenta de
+    un cliente se arman con sus ids, sin recorrer todos los equipos.
+    """
+
+    def __init__(self):
+        self._devices = {}     # client_id -> ids de sus equipos, ordenados
+        self._invoiced = {}    # client_id -> ids de sus equipos con factura
+        self._keys = {}        # id -> (client_id, facturado)
+
+    def rebuild(self, devices):
+        """Reconstruye el índice"""
+        self._devices = {}
+        self._invoiced = {}
+        self._keys = {}
+        for device in sorted(devices, key=lambda d: d.id):
+            self.add(device)
+
+    def add(self, device):
+        """Registra un equipo; si ya existía se actualizan sus claves"""
+        doc_id = device.id
+        keys = (device.client_id, bool(device.factura_num))
+        if self._keys.get(doc_id) == keys:
+            return
+        if doc_id in self._keys:
+            self.remove(doc_id)
+        self._keys[doc_id] = keys
+        bisect.insort(self._devices.setdefault(device.client_id, []), doc_id)
+        if device.factura_num:
+            bisect.insort(self._invoiced.setdefault(device.client_id, []), doc_id)
+
+    def add_many(self, devices):
+        """Registra varios equipos"""
+        for device in devices:
+            self.add(device)
+
+    def remove(self, doc_id):
+        """Quita un equipo del índice"""
+        keys = self._keys.pop(doc_id, None)
+        if keys is None:
+            return
+        client_id, invoiced = keys
+        for table in (self._devices, self._invoiced) if invoiced else (self._devices,):
+            ids = table.get(client_id)
+            if ids and doc_id in ids:
+                ids.remove(doc_id)
+                if not ids:
+                    del table[client_id]
+
+    def has_devices(self, client_id):
+        return client_id in self._devices
+
+    def by_client(self, client_id):
+        """Ids de los equipos del cliente, del más antiguo al más reciente"""
+        return list(self._devices.get(client_id, ()))
+
+    def invoiced_by_client(self, client_id):
+        """Ids de los equipos del cliente que ya tienen factura"""
+        return list(self._invoiced.get(client_id, ()))
+
+
+class StatusIndex:
+    """Cola de equipos por estado: estado -> ids ordenados.
+
+    La cantidad de cada estado es el largo de su lista, así el tablero y la
+    lista de equipos listos para entregar no recorren todos los equipos.
+    """
+
+    def __init__(self):
+        self._queues = {}   # estado -> ids, del más antiguo al más reciente
+        self._status = {}   # id -> estado
+
+    def rebuild(self, devices):
+        """Reconstruye todas las colas"""
+        self._queues = {}
+        self._status = {}
+        for device in devices:
+            self._status[device.id] = device.status
+            self._queues.setdefault(device.status, []).append(device.id)
+        for ids in self._queues.values():
+            ids.sort()
+
+    def add(self, device):
+        """Registra un equipo; si cambió de estado pasa a la cola nueva"""
+        doc_id = device.id
+        previous = self._status.get(doc_id)
+        if previous == device.status:
+            return
+        if previous is not None:
+            self.remove(doc_id)
+        self._status[doc_id] = device.status
+        ids = self._queues.setdefault(device.status, [])
+        if not ids or ids[-1] < doc_id:
+            ids.append(doc_id)
+        else:
+            bisect.insort(ids, doc_id)
+
+    def add_many(self, devices):
+        """Registra varios equipos"""
+        for device in devices:
+            self.add(device)
+
+    def remove(self, doc_id):
+        """Quita un equipo de su cola"""
+        status = self._status.pop(doc_id, None)
+        if status is None:
+            return
+        ids = self._queues[status]
+        position = bisect.bisect_left(ids, doc_id)
+        if position < len(ids) and ids[position] == doc_id:
+            del ids[position]
+
+    def count(self, status):
+        return len(self._queues.get(status, ()))
+
+    def counts(self):
+        """Diccionario estado -> cantidad de equipos"""
+        return {status: len(ids) for status, ids in self._queues.items() if ids}
+
+    def ids(self, status, limit=None):
+        """Ids en ese estado, del más antiguo al más reciente; con ``limit``, los últimos"""
+        ids = self._queues.get(status, ())
+        if limit is None:
+            return list(ids)
+        return ids[-limit:] if limit > 0 else []
+
+
+def field_key(text):
+    """Tipo o marca normalizados: "Samsung ", "samsung" y "SAMSUNG" son la misma clave"""
+    return ' '.join(tokenize(text))
+
+
+class FilterIndex:
+    """Índices para los reportes filtrados (ver queries): tipo y marca -> ids
+    ordenados, y listas de (fecha, id) ordenadas por fecha de ingreso y de entrega.
+
+    Con las listas de fechas un rango es una bisección: se sabe cuántos
+    equipos caen en él sin recorrerlos, y el planificador de consultas puede
+    elegir la condición más selectiva.
+    """
+
+    def __init__(self):
+        self._by_type = {}      # tipo normalizado -> ids
+        self._by_brand = {}     # marca normalizada -> ids
+        self._received = []     # (fecha de ingreso, id) ordenados
+        self._delivered = []    # (fecha de entrega, id) ordenados
+        self._keys = {}         # id -> (tipo, marca, ingreso, entrega)
+
+    @staticmethod
+    def _keys_of(device):
+        return (field_key(device.type), field_key(device.brand),
+                device.date_received, device.date_delivered)
+
+    def rebuild(self, devices):
+        """Reconstruye todos los índices"""
+        self._by_type = {}
+        self._by_brand = {}
+        self._received = []
+        self._delivered = []
+        self._keys = {}
+        for device in sorted(devices, key=lambda d: d.id):
+            keys = self._keys[device.id] = self._keys_of(device)
+            type_key, brand_key, received, delivered = keys
+            self._by_type.setdefault(type_key, []).append(device.id)
+            self._by_brand.setdefault(brand_key, []).append(device.id)
+            if received is not None:
+                self._received.append((received, device.id))
+            if delivered is not None:
+                self._delivered.append((delivered, device.id))
+        self._received.sort()
+        self._delivered.sort()
+
+    def add(self, device):
+        """Registra un equipo; si ya existía se actualizan sus claves"""
+        doc_id = device.id
+        keys = self._keys_of(device)
+        if self._keys.get(doc_id) == keys:
+            return
+        if doc_id in self._keys:
+            self.remove(doc_id)
+        self._keys[doc_id] = keys
+        type_key, brand_key, received, delivered = keys
+        bisect.insort(self._by_type.setdefault(type_key, []), doc_id)
+        bisect.insort(self._by_brand.setdefault(brand_key, []), doc_id)
+        if received is not None:
+            bisect.insort(self._received, (received, doc_id))
+        if delivered is not None:
+            bisect.insort(self._delivered, (delivered, doc_id))
+
+    def add_many(self, devices):
+        """Registra varios equipos"""
+        for device in devices:
+            self.add(device)
+
+    def remove(self, doc_id):
+        """Quita un equipo de todos los índices"""
+        keys = self._keys.pop(doc_id, None)
+        if keys is None:
+            return
+        type_key, brand_key, received, delivered = keys
+        for table, key in ((self._by_type, type_key), (self._by_brand, brand_key)):
+            ids = table.get(key)
+            if ids and doc_id in ids:
+                ids.remove(doc_id)
+                if not ids:
+                    del table[key]
+        for dates, date in ((self._received, received), (self._delivered, delivered)):
+            if date is not None:
+                position = bisect.bisect_left(dates, (date, doc_id))
+                if position < len(dates) and dates[position] == (date, doc_id):
+                    del dates[position]
+
+    def by_type(self, text):
+        """Ids de los equipos de ese tipo (no modificar)"""
+        return self._by_type.get(field_key(text), ())
+
+    def by_brand(self, text):
+        """Ids de los equipos de esa marca (no modificar)"""
+        return self._by_brand.get(field_key(text), ())
+
+    @staticmethod
+    def _range(dates, start, end):
+        """Posiciones de ``dates`` entre ``start`` y ``end`` inclusive; None es sin límite"""
+        first = 0 if start is None else bisect.bisect_left(dates, (start,))
+        last = len(dates) if end is None else bisect.bisect_right(dates, (end, float('inf')))
+        return first, max(first, last)
+
+    def count_received(self, start=None, end=None):
+        first, last = self._range(self._received, start, end)
+        return last - first
+
+    def received_between(self, start=None, end=None):
+        """Ids de los equipos recibidos en el rango, por fecha de ingreso"""
+        first, last = self._range(self._received, start, end)
+        return [doc_id for _, doc_id in self._received[first:last]]
+
+    def count_delivered(self, start=None, end=None):
+        first, last = self._range(self._delivered, start, end)
+        return last - first
+
+    def delivered_between(self, start=None, end=None):
+        """Ids de los equipos entregados en el rango, por fecha de entrega"""
+        first, last = self._range(self._delivered, start, end)
+        return [doc_id for _, doc_id in self._delivered[first:last]]
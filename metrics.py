@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Tiempos de las operaciones del programa, para saber qué está lento.
+
+``timed(nombre)`` mide un bloque ``with`` o una función decorada y suma el
+tiempo al histograma de esa operación. Los histogramas viven en memoria y
+usan intervalos logarítmicos (20 por década, unos 12% de ancho), así que
+cuestan lo mismo con diez muestras que con un millón. Con ``enable_log``
+cada muestra se anota además en un registro que rota solo.
+
+``profile_next(n, ruta)`` perfila con cProfile las próximas ``n`` acciones
+(mediciones de primer nivel del hilo principal) y guarda el resultado en
+``ruta`` (.prof para pstats/snakeviz y .txt legible).
+"""
+
+import cProfile
+import functools
+import inspect
+import logging
+import logging.handlers
+import math
+import pstats
+import threading
+import time
+
+# Intervalos del histograma: de 1 µs a 1000 s
+BUCKETS_PER_DECADE = 20
+MIN_SECONDS = 1e-6
+MAX_BUCKET = 9 * BUCKETS_PER_DECADE
+
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+_log = logging.getLogger('taller.metricas')
+_log.propagate = False
+
+_lock = threading.Lock()
+_histograms = {}
+_local = threading.local()
+_profile = None
+
+
+class Histogram:
+    """Cantidad, total, mínimo, máximo y percentiles aproximados de una operación"""
+
+    __slots__ = ('count', 'total', 'min', 'max', '_buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._buckets = {}
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        if seconds <= MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log10(seconds / MIN_SECONDS) * BUCKETS_PER_DECADE), MAX_BUCKET)
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+
+    def percentile(self, p):
+        """Segundos por debajo de los cuales queda el ``p``% de las muestras"""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                # Centro geométrico del intervalo, sin salirse de lo observado
+                value = MIN_SECONDS * 10 ** ((bucket + 0.5) / BUCKETS_PER_DECADE)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+def record(name, seconds):
+    """Suma una muestra de ``seconds`` a la operación ``name``"""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds)
+    if _log.handlers:
+        _log.info("%s %.3f", name, seconds * 1000)
+
+
+def snapshot():
+    """{operación: resumen} de todas las operaciones medidas"""
+    with _lock:
+        return {name: h.summary() for name, h in _histograms.items()}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def enable_log(path):
+    """Anota cada muestra en ``path`` ("fecha operación ms"), rotando a los 1 MB"""
+    if _log.handlers:
+        return
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES,
+                                                   backupCount=LOG_BACKUPS, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    _log.addHandler(handler)
+    _log.setLevel(logging.INFO)
+
+
+class _Timer:
+    """Bloque medido; en el primer nivel del hilo principal también lo perfila si se pidió.
+
+    Usado como decorador, cada llamada a la función se mide con un ``_Timer`` nuevo.
+    """
+
+    __slots__ = ('name', '_start', '_profile')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        depth = getattr(_local, 'depth', 0)
+        _local.depth = depth + 1
+        self._profile = None
+        profile = _profile
+        if profile is not None and depth == 0 and threading.current_thread() is threading.main_thread():
+            try:
+                profile['profiler'].enable()
+                self._profile = profile
+            except ValueError:  # otro perfilador ya está activo
+                pass
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self._start
+        _local.depth -= 1
+        if self._profile is not None:
+            self._profile['profiler'].disable()
+            _profiled_action(self._profile)
+        record(self.name, elapsed)
+        return False
+
+    def __call__(self, function):
+        name = self.name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+def timed(name):
+    """Mide un bloque (``with timed(...)``) o cada llamada a una función (decorador)"""
+    return _Timer(name)
+
+
+def action(name):
+    """Como ``timed``, para métodos conectados a señales de Qt.
+
+    Qt pasa argumentos de más (``checked`` de ``clicked``) y solo los descarta
+    si la función misma los rechaza; detrás de un decorador eso ya no pasa,
+    así que aquí se descartan los que la función no acepta.
+    """
+    def decorator(function):
+        parameters = inspect.signature(function).parameters.values()
+        if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+            accepted = None
+        else:
+            accepted = sum(1 for p in parameters
+                           if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(name):
+                return function(*args[:accepted], **kwargs)
+        return wrapper
+    return decorator
+
+
+def profile_next(actions, path):
+    """Perfila las próximas ``actions`` acciones y guarda el resultado en ``path``"""
+    global _profile
+    _profile = {'profiler': cProfile.Profile(), 'remaining': max(1, actions), 'path': path}
+
+
+def profiling():
+    """Acciones que faltan por perfilar (0 si no hay un perfil en curso)"""
+    profile = _profile
+    return profile['remaining'] if profile else 0
+
+
+def _profiled_action(profile):
+    global _profile
+    profile['remaining'] -= 1
+    if profile['remaining'] > 0:
+        return
+    if _profile is profile:
+        _profile = None
+    profile['profiler'].dump_stats(profile['path'])
+    with open(profile['path'] + '.txt', 'w', encoding='utf-8') as f:
+        pstats.Stats(profile['profiler'], stream=f).sort_stats('cumulative').print_stats(60)
+    _log.info("perfil guardado en %s", profile['path'])
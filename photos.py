@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Procesamiento de las fotos de los equipos en segundo plano.
+
+Las fotos de un celular pesan de 4 a 12 MB y no hace falta guardarlas así:
+cada una se endereza según su EXIF, se achica hasta ``[Fotos] lado_maximo``
+y se vuelve a codificar en JPEG o WebP. Se hace con Pillow en otros
+procesos (``PhotoIngest``), así el alta del equipo vuelve enseguida y las
+fotos se agregan al equipo cuando terminan. Si se configura
+``[Fotos] originales`` se guarda además una copia sin tocar en esa carpeta.
+
+Sin Pillow las fotos se guardan tal cual, como antes.
+"""
+
+import concurrent.futures
+import io
+import os
+import shutil
+import threading
+
+import metrics
+import storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+MAX_SIDE = 1600
+QUALITY = 82
+FORMATS = {'jpeg': ('JPEG', '.jpg'), 'webp': ('WEBP', '.webp')}
+EXIF_ORIENTATION = 0x0112
+
+
+class PhotoOptions:
+    """Ajustes de ``[Fotos]`` en settings.ini; se pasan a los procesos con cada foto"""
+
+    __slots__ = ('max_side', 'quality', 'format', 'originals_dir')
+
+    def __init__(self, max_side=MAX_SIDE, quality=QUALITY, format='jpeg', originals_dir=''):
+        self.max_side = max_side
+        self.quality = quality
+        self.format = format if format in FORMATS else 'jpeg'
+        self.originals_dir = originals_dir
+
+    @classmethod
+    def from_settings(cls):
+        settings = storage.load_settings()
+        return cls(max_side=settings.getint('Fotos', 'lado_maximo', fallback=MAX_SIDE),
+                   quality=settings.getint('Fotos', 'calidad', fallback=QUALITY),
+                   format=settings.get('Fotos', 'formato', fallback='jpeg').strip().lower(),
+                   originals_dir=settings.get('Fotos', 'originales', fallback='').strip())
+
+
+def process_photo(source, options, original_name):
+    """Lee ``source``, la endereza, la achica y la recodifica; devuelve (extensión, bytes).
+
+    Se ejecuta en otro proceso. Si el archivo no es una imagen que Pillow
+    entienda, o recodificarla no sirve de nada, se devuelve el original.
+    """
+    with open(source, 'rb') as f:
+        original = f.read()
+    extension = os.path.splitext(source)[1].lower()
+
+    if options.originals_dir:
+        os.makedirs(options.originals_dir, exist_ok=True)
+        shutil.copyfile(source, os.path.join(options.originals_dir, original_name))
+
+    if Image is None:
+        return extension, original
+
+    try:
+        with Image.open(io.BytesIO(original)) as image:
+            rotated = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+            if max(image.size) <= options.max_side and not rotated \
+                    and image.format in ('JPEG', 'WEBP'):
+                # Ya es chica y comprimida: recodificarla solo perdería calidad
+                return extension, original
+            oriented = ImageOps.exif_transpose(image)
+            oriented.thumbnail((options.max_side, options.max_side), Image.LANCZOS)
+            if oriented.mode not in ('RGB', 'L'):
+                oriented = oriented.convert('RGB')
+            pil_format, extension = FORMATS[options.format]
+            buffer = io.BytesIO()
+            # Sin exif=: no se copian los metadatos (ubicación GPS incluida)
+            if pil_format == 'JPEG':
+                oriented.save(buffer, pil_format, quality=options.quality, optimize=True,
+                              progressive=True)
+            else:
+                oriented.save(buffer, pil_format, quality=options.quality, method=4)
+            return extension, buffer.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return os.path.splitext(source)[1].lower(), original
+
+
+class PhotoIngest:
+    """Procesa fotos en un grupo de procesos y las agrega a su equipo al terminar.
+
+    ``service`` es un ``DataService`` o ``RemoteService``: las fotos llegan ya
+    procesadas a ``add_device_images``, así una terminal remota sube la
+    versión chica. Un hilo aparte espera cada lote y hace la escritura, de a
+    un equipo por vez.
+    """
+
+    def __init__(self, service, workers=None):
+        self.service = service
+        self.workers = workers
+        self._pool = None
+        self._finisher = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def _processes(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def pending(self):
+        """Equipos con fotos todavía en proceso"""
+        with self._lock:
+            return self._pending
+
+    def submit(self, device_id, paths, on_done=None):
+        """Procesa ``paths`` y los agrega al equipo ``device_id``.
+
+        ``on_done(equipo, errores)`` se llama desde otro hilo al terminar;
+        ``equipo`` es None si no se pudo guardar ninguna foto.
+        """
+        options = PhotoOptions.from_settings()
+        pool = self._processes()
+        futures = [pool.submit(process_photo, path, options,
+                               f"device_{device_id}_{i}_{os.path.basename(path)}")
+                   for i, path in enumerate(paths)]
+        with self._lock:
+            self._pending += 1
+        return self._finisher.submit(self._finish, device_id, paths, futures, on_done)
+
+    def _finish(self, device_id, paths, futures, on_done):
+        device = None
+        errors = []
+        try:
+            with metrics.timed('photos.ingest'):
+                images = []
+                for path, future in zip(paths, futures):
+                    try:
+                        images.append(future.result())
+                    except Exception as e:
+                        errors.append(f"{os.path.basename(path)}: {e}")
+                if images:
+                    device = self.service.add_device_images(device_id, images)
+        except Exception as e:
+            errors.append(str(e))
+        finally:
+            with self._lock:
+                self._pending -= 1
+        if on_done is not None:
+            on_done(device, errors)
+        return device
+
+    def shutdown(self, wait=True):
+        """Termina los procesos; con ``wait`` espera a que se guarden las fotos pendientes"""
+        self._finisher.shutdown(wait=wait)
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
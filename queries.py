@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Filtros de equipos para reportes a medida y el planificador que los resuelve.
+
+``DeviceFilter`` junta las condiciones: tipo, marca, modelo, estado,
+cliente, rango de costo y rangos de fechas de ingreso y de entrega. En vez
+de recorrer todos los equipos, ``plan`` estima cuántos deja pasar cada
+condición que tiene índice (la cola del estado, los equipos del cliente,
+tipo y marca en ``indexes.FilterIndex`` y los rangos de fechas, que son
+una bisección), empieza por la más selectiva y la intersecta con las demás
+mientras no sean mucho más grandes. Las condiciones restantes (modelo,
+costo y las que no convino intersectar) se verifican solo sobre esos
+candidatos. Sin ninguna condición con índice se revisan todos los equipos.
+"""
+
+from datetime import datetime
+
+from indexes import field_key
+from records import DELIVERED, STATUSES, STATUS_ALIASES, to_money
+
+# Una condición se intersecta si no trae más de tantas veces los candidatos que ya
+# hay; si trae más, armar su conjunto cuesta más que verificarla en cada candidato
+INTERSECT_RATIO = 8
+
+PARAM_DATE_FORMAT = "%Y-%m-%d"
+
+
+def _day_start(value):
+    return None if value is None else datetime(value.year, value.month, value.day)
+
+
+def _day_end(value):
+    return None if value is None else datetime(value.year, value.month, value.day, 23, 59, 59)
+
+
+def _format_day(value):
+    return value.strftime("%d/%m/%Y")
+
+
+def _range_text(start, end):
+    if start is not None and end is not None:
+        return f"del {_format_day(start)} al {_format_day(end)}"
+    if start is not None:
+        return f"desde el {_format_day(start)}"
+    return f"hasta el {_format_day(end)}"
+
+
+class DeviceFilter:
+    """Condiciones de un reporte a medida; las vacías (``''`` o None) no filtran.
+
+    El tipo y la marca se comparan sin distinguir mayúsculas, acentos ni
+    espacios; el modelo basta con que esté contenido ("iphone 13" encuentra
+    "iPhone 13 Pro"). Las fechas abarcan los días completos.
+    """
+
+    __slots__ = ('type', 'brand', 'model', 'status', 'client_id', 'cost_min', 'cost_max',
+                 'received_from', 'received_to', 'delivered_from', 'delivered_to')
+
+    # Nombre de cada condición en los parámetros del servidor y de la línea de comandos
+    PARAMS = {'type': 'tipo', 'brand': 'marca', 'model': 'modelo', 'status': 'estado',
+              'client_id': 'cliente', 'cost_min': 'costo_min', 'cost_max': 'costo_max',
+              'received_from': 'recibido_desde', 'received_to': 'recibido_hasta',
+              'delivered_from': 'entregado_desde', 'delivered_to': 'entregado_hasta'}
+    DATE_FIELDS = ('received_from', 'received_to', 'delivered_from', 'delivered_to')
+
+    def __init__(self, type='', brand='', model='', status='', client_id=None, cost_min=None,
+                 cost_max=None, received_from=None, received_to=None, delivered_from=None,
+                 delivered_to=None):
+        self.type = type.strip()
+        self.brand = brand.strip()
+        self.model = model.strip()
+        status = status.strip()
+        self.status = STATUS_ALIASES.get(status, status)
+        if self.status and self.status not in STATUSES:
+            raise ValueError(f"Estado desconocido: {status}")
+        self.client_id = None if client_id is None else int(client_id)
+        self.cost_min = None if cost_min is None else to_money(cost_min)
+        self.cost_max = None if cost_max is None else to_money(cost_max)
+        self.received_from = _day_start(received_from)
+        self.received_to = _day_end(received_to)
+        self.delivered_from = _day_start(delivered_from)
+        self.delivered_to = _day_end(delivered_to)
+
+    @classmethod
+    def from_params(cls, params):
+        """Filtro a partir de textos (``{'marca': 'Apple', 'recibido_desde': 'AAAA-MM-DD'}``)"""
+        values = {}
+        for field, name in cls.PARAMS.items():
+            text = str(params.get(name) or '').strip()
+            if not text:
+                continue
+            if field in cls.DATE_FIELDS:
+                try:
+                    values[field] = datetime.strptime(text, PARAM_DATE_FORMAT)
+                except ValueError:
+                    raise ValueError(f"Fecha inválida (use AAAA-MM-DD): {name}")
+            elif field == 'client_id':
+                try:
+                    values[field] = int(text)
+                except ValueError:
+                    raise ValueError(f"Cliente inválido: {text}")
+            else:
+                values[field] = text
+        return cls(**values)
+
+    def to_params(self):
+        """Las condiciones usadas, como textos para ``from_params``"""
+        params = {}
+        for field, name in self.PARAMS.items():
+            value = getattr(self, field)
+            if value is None or value == '':
+                continue
+            params[name] = (value.strftime(PARAM_DATE_FORMAT) if field in self.DATE_FIELDS
+                            else str(value))
+        return params
+
+    def is_empty(self):
+        return not self.to_params()
+
+    def matches(self, device):
+        """True si el equipo cumple todas las condiciones"""
+        if self.status and device.status != self.status:
+            return False
+        if self.client_id is not None and device.client_id != self.client_id:
+            return False
+        if self.type and field_key(device.type) != field_key(self.type):
+            return False
+        if self.brand and field_key(device.brand) != field_key(self.brand):
+            return False
+        if self.model and field_key(self.model) not in field_key(device.model):
+            return False
+        if self.cost_min is not None and device.cost < self.cost_min:
+            return False
+        if self.cost_max is not None and device.cost > self.cost_max:
+            return False
+        for date, start, end in ((device.date_received, self.received_from, self.received_to),
+                                 (device.date_delivered, self.delivered_from, self.delivered_to)):
+            if start is None and end is None:
+                continue
+            if date is None or (start is not None and date < start) \
+                    or (end is not None and date > end):
+                return False
+        return True
+
+    def describe(self, client_name=None):
+        """Líneas con las condiciones usadas, para el encabezado del reporte"""
+        lines = []
+        for label, value in (("Tipo", self.type), ("Marca", self.brand),
+                             ("Modelo", self.model), ("Estado", self.status)):
+            if value:
+                lines.append(f"{label}: {value}")
+        if self.client_id is not None:
+            name = f"{client_name} " if client_name else ''
+            lines.append(f"Cliente: {name}(N° {self.client_id})")
+        if self.cost_min is not None and self.cost_max is not None:
+            lines.append(f"Costo: de ${self.cost_min:.2f} a ${self.cost_max:.2f}")
+        elif self.cost_min is not None:
+            lines.append(f"Costo: desde ${self.cost_min:.2f}")
+        elif self.cost_max is not None:
+            lines.append(f"Costo: hasta ${self.cost_max:.2f}")
+        for label, start, end in (("Recibidos", self.received_from, self.received_to),
+                                  ("Entregados", self.delivered_from, self.delivered_to)):
+            if start is not None or end is not None:
+                lines.append(f"{label} {_range_text(start, end)}")
+        return lines
+
+
+class QueryPlan:
+    """Candidatos que eligió ``plan`` y cómo los eligió.
+
+    ``ids`` es la lista ordenada de candidatos, o None si hay que revisar
+    todos los equipos. Los candidatos todavía se verifican con
+    ``DeviceFilter.matches``.
+    """
+
+    __slots__ = ('ids', 'steps')
+
+    def __init__(self, ids, steps):
+        self.ids = ids
+        self.steps = steps
+
+
+def plan(device_filter, filter_index, client_device_index, status_index=None):
+    """Elige los candidatos de ``device_filter`` con los índices.
+
+    Sin ``status_index`` (el archivo) se asume que todos los equipos están
+    entregados.
+    """
+    f = device_filter
+    options = []   # (equipos estimados, descripción, función que devuelve sus ids)
+    if f.status:
+        if status_index is not None:
+            options.append((status_index.count(f.status), f"estado {f.status}",
+                            lambda: status_index.ids(f.status)))
+        elif f.status != DELIVERED:
+            return QueryPlan([], ["solo hay equipos entregados"])
+    if f.client_id is not None:
+        client_ids = client_device_index.by_client(f.client_id)
+        options.append((len(client_ids), f"cliente {f.client_id}", lambda: client_ids))
+    if f.type:
+        type_ids = filter_index.by_type(f.type)
+        options.append((len(type_ids), f"tipo {f.type}", lambda: type_ids))
+    if f.brand:
+        brand_ids = filter_index.by_brand(f.brand)
+        options.append((len(brand_ids), f"marca {f.brand}", lambda: brand_ids))
+    if f.received_from is not None or f.received_to is not None:
+        options.append((filter_index.count_received(f.received_from, f.received_to),
+                        "fecha de ingreso",
+                        lambda: filter_index.received_between(f.received_from, f.received_to)))
+    if f.delivered_from is not None or f.delivered_to is not None:
+        options.append((filter_index.count_delivered(f.delivered_from, f.delivered_to),
+                        "fecha de entrega",
+                        lambda: filter_index.delivered_between(f.delivered_from, f.delivered_to)))
+    if not options:
+        return QueryPlan(None, ["ninguna condición con índice: se revisan todos los equipos"])
+
+    options.sort(key=lambda option: option[0])
+    estimate, label, fetch = options[0]
+    candidates = set(fetch())
+    steps = [f"{label}: {estimate} equipos"]
+    for estimate, label, fetch in options[1:]:
+        if not candidates:
+            break
+        if estimate > INTERSECT_RATIO * len(candidates):
+            steps.append(f"{label}: {estimate} equipos, se verifica en cada candidato")
+            continue
+        candidates.intersection_update(fetch())
+        steps.append(f"∩ {label}: {estimate} equipos -> quedan {len(candidates)}")
+    return QueryPlan(sorted(candidates), steps)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Tipos de registro del taller: Client, Device e Invoice.
+
+Los archivos JSON se validan una sola vez al leerlos (``from_dict``) y el
+resto del programa trabaja con atributos. Las clases usan ``__slots__``,
+así un equipo ocupa una fracción de lo que ocupaba como diccionario. Las
+fechas se guardan como ``datetime`` (``None`` si falta) y los montos como
+``Decimal`` con dos decimales. En disco el formato no cambia: ``to_dict``
+devuelve los mismos campos de texto y número de siempre.
+
+Un equipo pasa por las etapas de ``STATUSES``; ``history`` guarda cada
+cambio con su fecha. El estado "En reparación" de las versiones anteriores
+se lee como "Recibido".
+"""
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+# Enlace de pago que llevan los QR de recibos y facturas
+PAYMENT_URL = "https://pay.link.com/?amount={}"
+
+# Etapas de un equipo en el taller, en orden
+RECEIVED = "Recibido"
+DIAGNOSIS = "Diagnóstico"
+WAITING_PARTS = "Esperando repuesto"
+READY = "Listo"
+DELIVERED = "Entregado"
+STATUSES = (RECEIVED, DIAGNOSIS, WAITING_PARTS, READY, DELIVERED)
+
+# Cambios de estado permitidos; a Entregado solo se llega con la entrega (asigna la factura)
+TRANSITIONS = {
+    RECEIVED: (DIAGNOSIS, WAITING_PARTS, READY),
+    DIAGNOSIS: (RECEIVED, WAITING_PARTS, READY),
+    WAITING_PARTS: (DIAGNOSIS, READY),
+    READY: (DIAGNOSIS, WAITING_PARTS),
+    DELIVERED: (),
+}
+
+# Estados de versiones anteriores, que solo tenían "En reparación" y "Entregado"
+STATUS_ALIASES = {"En reparación": RECEIVED}
+
+
+def to_money(value):
+    """Convierte a Decimal con dos decimales; ValueError si no es un monto"""
+    if isinstance(value, Decimal):
+        return value.quantize(CENT)
+    try:
+        return Decimal(str(value).strip() or '0').quantize(CENT)
+    except InvalidOperation:
+        raise ValueError(f"Monto inválido: {value}")
+
+
+def parse_timestamp(text):
+    """Texto en DATE_FORMAT -> datetime, o None si está vacío o no es válido"""
+    if isinstance(text, datetime):
+        return text
+    if not text:
+        return None
+    try:
+        # DATE_FORMAT es ISO 8601 con espacio; fromisoformat es mucho más rápido que strptime
+        return datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_timestamp(value):
+    """datetime -> texto en DATE_FORMAT ('' si es None)"""
+    return value.isoformat(' ', 'seconds') if value else ''
+
+
+def now():
+    """Fecha y hora actuales sin microsegundos, como se guardan en los archivos"""
+    return datetime.now().replace(microsecond=0)
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+@lru_cache(maxsize=8192)
+def _cached_money(value):
+    try:
+        return to_money(value)
+    except ValueError:
+        return ZERO
+
+
+def _money(value):
+    # Los montos se repiten mucho (precios de lista, anticipos redondos): la
+    # caché evita convertirlos otra vez y hace que los equipos compartan el Decimal
+    if value is None:
+        return ZERO
+    try:
+        return _cached_money(value)
+    except TypeError:  # listas u objetos en un JSON editado a mano
+        return ZERO
+
+
+def _text(value):
+    if type(value) is str:
+        return value
+    return '' if value is None else str(value)
+
+
+def _status(value):
+    status = _text(value) or RECEIVED
+    return STATUS_ALIASES.get(status, status)
+
+
+def _history(value):
+    """[[estado, fecha], ...] -> ((estado, datetime), ...); se descartan las entradas inválidas"""
+    if not isinstance(value, list) or not value:
+        return ()
+    history = []
+    for entry in value:
+        if isinstance(entry, list) and len(entry) == 2:
+            date = parse_timestamp(entry[1])
+            if date is not None:
+                history.append((_status(entry[0]), date))
+    return tuple(history)
+
+
+class Record:
+    """Base de los registros: igualdad, copia con cambios y representación"""
+
+    __slots__ = ()
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        # Para pickle (ver snapshot): los valores en el orden de __init__, sin diccionario
+        return type(self), self._values()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash((type(self), getattr(self, self.__slots__[0])))
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def replace(self, **changes):
+        """Copia del registro con algunos campos cambiados"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+
+class Client(Record):
+    __slots__ = ('id', 'name', 'phone', 'email', 'address', 'nit', 'balance')
+
+    def __init__(self, id, name='', phone='', email='', address='', nit='', balance=ZERO):
+        self.id = id
+        self.name = name
+        self.phone = phone
+        self.email = email
+        self.address = address
+        self.nit = nit
+        self.balance = balance
+
+    @classmethod
+    def from_dict(cls, data):
+        """Cliente validado a partir de un registro JSON"""
+        get = data.get
+        return cls(_int(get('id')), _text(get('name')), _text(get('phone')),
+                   _text(get('email')), _text(get('address')), _text(get('nit')),
+                   _money(get('balance')))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'phone': self.phone,
+            'email': self.email,
+            'address': self.address,
+            'nit': self.nit,
+            'balance': float(self.balance)
+        }
+
+
+class Device(Record):
+    __slots__ = ('id', 'client_id', 'client_name', 'type', 'brand', 'model', 'serial', 'issues',
+                 'cost', 'advance', 'status', 'date_received', 'date_delivered', 'images',
+                 'factura_num', 'history')
+
+    def __init__(self, id, client_id, client_name='', type='', brand='', model='', serial='',
+                 issues='', cost=ZERO, advance=ZERO, status=RECEIVED, date_received=None,
+                 date_delivered=None, images=(), factura_num=0, history=()):
+        self.id = id
+        self.client_id = client_id
+        self.client_name = client_name
+        self.type = type
+        self.brand = brand
+        self.model = model
+        self.serial = serial
+        self.issues = issues
+        self.cost = cost
+        self.advance = advance
+        self.status = status
+        self.date_received = date_received
+        self.date_delivered = date_delivered
+        self.images = tuple(images)
+        self.factura_num = factura_num
+        self.history = tuple(history)    # ((estado, fecha), ...) de cada cambio de estado
+
+    @property
+    def balance(self):
+        """Saldo pendiente del equipo"""
+        return self.cost - self.advance
+
+    def status_since(self):
+        """Fecha en que el equipo pasó a su estado actual"""
+        if self.history and self.history[-1][0] == self.status:
+            return self.history[-1][1]
+        return self.date_delivered if self.status == DELIVERED else self.date_received
+
+    def with_status(self, status, when, **changes):
+        """Copia en el estado ``status`` con el cambio anotado en el historial"""
+        return self.replace(status=status, history=self.history + ((status, when),), **changes)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Equipo validado a partir de un registro JSON"""
+        get = data.get
+        images = get('images')
+        return cls(_int(get('id')), _int(get('client_id')), _text(get('client_name')),
+                   _text(get('type')), _text(get('brand')), _text(get('model')),
+                   _text(get('serial')), _text(get('issues')),
+                   _money(get('cost')), _money(get('advance')),
+                   _status(get('status')),
+                   parse_timestamp(get('date_received')),
+                   parse_timestamp(get('date_delivered')),
+                   [_text(path) for path in images] if isinstance(images, list) and images else (),
+                   _int(get('factura_num')),
+                   _history(get('history')))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'client_id': self.client_id,
+            'client_name': self.client_name,
+            'type': self.type,
+            'brand': self.brand,
+            'model': self.model,
+            'serial': self.serial,
+            'issues': self.issues,
+            'cost': float(self.cost),
+            'advance': float(self.advance),
+            'status': self.status,
+            'date_received': format_timestamp(self.date_received),
+            'date_delivered': format_timestamp(self.date_delivered),
+            'images': list(self.images),
+            'factura_num': self.factura_num,
+            'history': [[status, format_timestamp(date)] for status, date in self.history]
+        }
+
+
+class Invoice(Record):
+    """Factura de un equipo entregado; número y fecha salen del propio equipo"""
+
+    __slots__ = ('number', 'date', 'device', 'client')
+
+    def __init__(self, number, date, device, client):
+        self.number = number
+        self.date = date
+        self.device = device
+        self.client = client
+
+    @classmethod
+    def for_device(cls, device, client):
+        return cls(device.factura_num, device.date_delivered or now(), device, client)
+
+    @property
+    def total(self):
+        return self.device.cost
+
+    @property
+    def balance(self):
+        return self.device.balance
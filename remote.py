@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Cliente del servidor HTTP (server.py) con la misma interfaz que DataService.
+
+La ventana principal lo usa cuando settings.ini indica la URL de un
+servidor; así la terminal trabaja como cliente liviano y nunca escribe los
+archivos JSON directamente.
+"""
+
+import base64
+import json
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import metrics
+import reports
+from records import Client, Device, Invoice
+from service import (ServiceError, NotFoundError, SEARCH_RESULTS_LIMIT,
+                     CLIENT_PICKER_LIMIT, RETURNS_REPORT_LIMIT)
+
+REQUEST_TIMEOUT = 10
+
+
+class RemoteService:
+    """Operaciones del taller a través del servidor en ``base_url``"""
+
+    def __init__(self, base_url, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, method, path, params=None, payload=None):
+        url = f"{self.base_url}/api/{path}"
+        if params:
+            url += '?' + urlencode(params)
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        request = Request(url, data=data, headers=headers, method=method)
+        try:
+            # Una operación por recurso ("remote.GET devices"), sin los IDs de la ruta
+            with metrics.timed(f"remote.{method} {path.split('/')[0]}"), \
+                    urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error', str(e))
+            except ValueError:
+                message = str(e)
+            if e.code == 404:
+                raise NotFoundError(message)
+            raise ServiceError(message)
+        except (URLError, OSError) as e:
+            raise ServiceError(f"No se pudo conectar con el servidor {self.base_url}: {e}")
+
+    def reload(self):
+        """El servidor siempre tiene los datos al día; no hay nada que recargar"""
+
+    # Lecturas
+
+    def _clients(self, path, params=None):
+        return [Client.from_dict(c) for c in self._request('GET', path, params)]
+
+    def _devices(self, path, params=None):
+        return [Device.from_dict(d) for d in self._request('GET', path, params)]
+
+    def list_clients(self):
+        return self._clients('clients')
+
+    def list_devices(self):
+        return self._devices('devices')
+
+    def get_client(self, client_id):
+        try:
+            return Client.from_dict(self._request('GET', f'clients/{int(client_id)}'))
+        except NotFoundError:
+            return None
+
+    def get_device(self, device_id):
+        try:
+            return Device.from_dict(self._request('GET', f'devices/{int(device_id)}'))
+        except NotFoundError:
+            return None
+
+    def search_clients(self, query, limit=SEARCH_RESULTS_LIMIT):
+        return self._clients('clients', {'q': query, 'limit': limit})
+
+    def search_devices(self, query, limit=SEARCH_RESULTS_LIMIT):
+        return self._devices('devices', {'q': query, 'limit': limit})
+
+    def suggest_clients(self, text, limit=CLIENT_PICKER_LIMIT):
+        return self._clients('clients', {'suggest': text, 'limit': limit})
+
+    def devices_by_serial(self, serial):
+        return self._devices('devices', {'serial': serial})
+
+    def client_devices_by_model(self, client_id, brand, model):
+        return self._devices('devices', {'client_id': client_id, 'brand': brand, 'model': model})
+
+    def client_devices(self, client_id):
+        return self._devices(f'clients/{int(client_id)}/devices')
+
+    def client_invoices(self, client_id):
+        client = self.get_client(client_id)
+        if client is None:
+            return []
+        devices = sorted((d for d in self.client_devices(client_id) if d.factura_num),
+                         key=lambda d: d.factura_num)
+        return [Invoice.for_device(d, client) for d in devices]
+
+    def client_statement(self, client_id):
+        # El texto se arma aquí con los equipos del servidor
+        client = self.get_client(client_id)
+        if client is None:
+            raise NotFoundError("Cliente no encontrado")
+        return reports.build_client_statement(client, self.client_devices(client_id))
+
+    def most_returning(self, limit=RETURNS_REPORT_LIMIT):
+        return [(serial, [Device.from_dict(d) for d in devices])
+                for serial, devices in self._request('GET', 'reports/returns', {'limit': limit})]
+
+    def deliverable_devices(self):
+        return self._devices('deliveries')
+
+    def devices_by_status(self, status, limit=None):
+        params = {'status': status}
+        if limit is not None:
+            params['limit'] = limit
+        return self._devices('statuses', params)
+
+    def status_counts(self):
+        return self._request('GET', 'statuses')
+
+    def invoices_between(self, start_date, end_date):
+        params = {'desde': start_date.strftime("%Y-%m-%d"), 'hasta': end_date.strftime("%Y-%m-%d")}
+        return [Invoice.for_device(Device.from_dict(i['device']), Client.from_dict(i['client']))
+                for i in self._request('GET', 'invoices', params)]
+
+    def report(self, report_type, start_date=None, end_date=None):
+        params = {'range': report_type}
+        if start_date is not None:
+            params['desde'] = start_date.strftime("%Y-%m-%d")
+        if end_date is not None:
+            params['hasta'] = end_date.strftime("%Y-%m-%d")
+        return self._request('GET', 'reports', params)['text']
+
+    def turnaround_report(self, start_date, end_date):
+        params = {'desde': start_date.strftime("%Y-%m-%d"), 'hasta': end_date.strftime("%Y-%m-%d")}
+        return self._request('GET', 'reports/turnaround', params)['text']
+
+    def filter_report(self, device_filter):
+        return self._request('GET', 'reports/filter', device_filter.to_params())['text']
+
+    # Escrituras
+
+    def add_client(self, data):
+        return Client.from_dict(self._request('POST', 'clients', payload=data))
+
+    def delete_client(self, client_id):
+        self._request('DELETE', f'clients/{int(client_id)}')
+
+    def add_device(self, data, images=()):
+        encoded = [(ext, base64.b64encode(content).decode('ascii')) for ext, content in images]
+        return Device.from_dict(self._request('POST', 'devices', payload={'device': data, 'images': encoded}))
+
+    def add_device_images(self, device_id, images):
+        encoded = [(ext, base64.b64encode(content).decode('ascii')) for ext, content in images]
+        return Device.from_dict(self._request('POST', f'devices/{int(device_id)}/images',
+                                              payload={'images': encoded}))
+
+    def change_status(self, device_id, status):
+        return Device.from_dict(self._request('POST', f'statuses/{int(device_id)}',
+                                              payload={'status': status}))
+
+    def deliver_device(self, device_id):
+        result = self._request('POST', f'deliveries/{int(device_id)}')
+        return Device.from_dict(result['device']), Client.from_dict(result['client'])
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Reportes de texto sobre los equipos recibidos.
+
+No depende de PyQt5 ni de fpdf; la exportación a PDF está en documents.
+"""
+
+from datetime import datetime, timedelta
+
+from records import DELIVERED, STATUSES, ZERO, format_timestamp
+
+
+def report_range(report_type, start_date=None, end_date=None, now=None):
+    """Devuelve (inicio, fin) del periodo de un reporte.
+
+    Para "personalizado" se usan ``start_date`` y ``end_date`` (fechas o
+    datetimes), extendidos al día completo.
+    """
+    now = now or datetime.now()
+    if report_type == "diario":
+        start = now.replace(hour=0, minute=0, second=0)
+        end = now.replace(hour=23, minute=59, second=59)
+    elif report_type == "semanal":
+        start = now - timedelta(days=now.weekday())
+        start = start.replace(hour=0, minute=0, second=0)
+        end = start + timedelta(days=6)
+        end = end.replace(hour=23, minute=59, second=59)
+    elif report_type == "mensual":
+        start = now.replace(day=1, hour=0, minute=0, second=0)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        end = end.replace(hour=23, minute=59, second=59)
+    elif report_type == "personalizado":
+        if start_date is None or end_date is None:
+            raise ValueError("El reporte personalizado requiere fecha de inicio y fin")
+        start = datetime(start_date.year, start_date.month, start_date.day, 0, 0, 0)
+        end = datetime(end_date.year, end_date.month, end_date.day, 23, 59, 59)
+    else:
+        raise ValueError(f"Tipo de reporte desconocido: {report_type}")
+    return start, end
+
+
+def build_report(devices, report_type, start_date, end_date):
+    """Genera el texto del reporte de los equipos recibidos en el periodo"""
+    # Filtrar dispositivos por fecha (las fechas ya vienen como datetime)
+    filtered_devices = [d for d in devices
+                        if d.date_received is not None and start_date <= d.date_received <= end_date]
+    
+    # Generar reporte
+    report = f"Reporte de {report_type.capitalize()}\n"
+    report += f"Del {start_date.strftime('%d/%m/%Y')} al {end_date.strftime('%d/%m/%Y')}\n"
+    report += "="*50 + "\n\n"
+    return report + _devices_summary(filtered_devices)
+
+
+def build_filter_report(devices, conditions):
+    """Genera el texto del reporte de los equipos de un filtro (ver queries.DeviceFilter).
+
+    ``conditions`` son las líneas que describen el filtro.
+    """
+    report = "Reporte Filtrado\n"
+    for line in conditions or ["Sin filtros: todos los equipos"]:
+        report += f"{line}\n"
+    report += "="*50 + "\n\n"
+    return report + _devices_summary(devices)
+
+
+def _devices_summary(filtered_devices):
+    """Resumen por estado e ingresos, y el detalle de cada equipo"""
+    report = ""
+    
+    # Resumen
+    total_devices = len(filtered_devices)
+    delivered = sum(1 for d in filtered_devices if d.status == DELIVERED)
+    by_status = {}
+    for d in filtered_devices:
+        if d.status != DELIVERED:
+            by_status[d.status] = by_status.get(d.status, 0) + 1
+    total_income = sum(d.cost for d in filtered_devices)
+    
+    report += f"Total de equipos recibidos: {total_devices}\n"
+    report += f"Equipos entregados: {delivered}\n"
+    report += f"Equipos en el taller: {total_devices - delivered}\n"
+    for status in sorted(by_status, key=lambda s: (STATUSES.index(s) if s in STATUSES else len(STATUSES), s)):
+        report += f"  {status}: {by_status[status]}\n"
+    report += f"Ingresos totales: ${total_income:.2f}\n\n"
+    
+    # Detalle por equipo
+    report += "Detalle por equipo:\n"
+    report += "-"*50 + "\n"
+    for device in filtered_devices:
+        report += f"ID: {device.id} - Cliente: {device.client_name}\n"
+        report += f"Equipo: {device.type} {device.brand} {device.model}\n"
+        report += f"Problema: {device.issues[:50]}...\n"
+        report += f"Costo: ${device.cost:.2f} - Estado: {device.status}\n"
+        report += f"Fecha recibido: {format_timestamp(device.date_received)}\n"
+        if device.status == DELIVERED:
+            report += f"Fecha entregado: {format_timestamp(device.date_delivered)}\n"
+            report += f"N° Factura: {device.factura_num}\n"
+        report += "-"*50 + "\n"
+    
+    return report
+
+
+# Grupos por marca que se muestran en el reporte de tiempos (las de más equipos)
+TURNAROUND_BRANDS_SHOWN = 15
+
+
+def format_days(hours):
+    return f"{hours / 24:.1f} días"
+
+
+def build_turnaround_report(summary, start_date, end_date, target_days):
+    """Texto del reporte de tiempos de reparación a partir de ``TurnaroundStats.summary``"""
+    total, by_type, by_brand, by_month = summary
+    target_hours = target_days * 24
+
+    report = "Tiempos de Reparación (del ingreso a la entrega)\n"
+    report += f"Entregados de {start_date.strftime('%m/%Y')} a {end_date.strftime('%m/%Y')}\n"
+    report += "="*50 + "\n\n"
+
+    if not total.count:
+        return report + "No hay equipos entregados en el periodo.\n"
+
+    report += f"Equipos entregados: {total.count}\n"
+    report += f"Promedio: {format_days(total.total / total.count)} - "
+    report += f"Mediana: {format_days(total.percentile(50))} - "
+    report += f"p90: {format_days(total.percentile(90))} - Máximo: {format_days(total.max)}\n"
+    report += (f"Entregados en {target_days:g} días o menos: "
+               f"{total.fraction_within(target_hours):.0%}\n")
+    report += "(mediana, p90 y plazo son aproximados, con un margen de ±6%)\n\n"
+
+    def table(title, groups):
+        text = f"{title}:\n" + "-"*50 + "\n"
+        for name, sketch in groups:
+            hours, device_id, _ = sketch.slowest[0]
+            text += (f"{name}: {sketch.count} equipos - Mediana: {format_days(sketch.percentile(50))}"
+                     f" - p90: {format_days(sketch.percentile(90))}"
+                     f" - En plazo: {sketch.fraction_within(target_hours):.0%}"
+                     f" - Más lento: ID {device_id} ({format_days(hours)})\n")
+        return text + "\n"
+
+    def by_count(groups):
+        return sorted(groups.items(), key=lambda item: (-item[1].count, item[0]))
+
+    report += table("Por tipo de equipo", by_count(by_type))
+    brands = by_count(by_brand)
+    title = "Por marca"
+    if len(brands) > TURNAROUND_BRANDS_SHOWN:
+        title += f" (las {TURNAROUND_BRANDS_SHOWN} con más equipos)"
+    report += table(title, brands[:TURNAROUND_BRANDS_SHOWN])
+    report += table("Por mes de entrega", sorted(by_month.items()))
+
+    report += "Entregas más lentas:\n" + "-"*50 + "\n"
+    for hours, device_id, label in total.slowest:
+        report += f"ID: {device_id} - {format_days(hours)} - {label}\n"
+    return report
+
+
+def statement_movements(devices):
+    """Movimientos de la cuenta ordenados por fecha: (fecha, descripción, importe).
+
+    Cada equipo carga su costo al ingresar y abona el anticipo; al entregarlo
+    se cobra el saldo con la factura. Los abonos tienen importe negativo.
+    """
+    movements = []
+    for device in devices:
+        label = f"{device.type} {device.brand} {device.model}".strip()
+        movements.append((device.date_received, f"Equipo {device.id}: {label}", device.cost))
+        if device.advance:
+            movements.append((device.date_received, f"Anticipo equipo {device.id}", -device.advance))
+        if device.status == DELIVERED:
+            movements.append((device.date_delivered, f"Pago factura {device.factura_num} (equipo {device.id})",
+                              -device.balance))
+    # Orden estable: en la misma fecha el costo va antes que su anticipo
+    return sorted(movements, key=lambda m: m[0] or datetime.min)
+
+
+def build_client_statement(client, devices, now=None):
+    """Estado de cuenta de un cliente con todos sus equipos, facturas y pagos"""
+    now = now or datetime.now()
+    delivered = [d for d in devices if d.status == DELIVERED]
+    pending = [d for d in devices if d.status != DELIVERED]
+    open_balance = sum((d.balance for d in pending), ZERO)
+
+    report = "Estado de Cuenta\n"
+    report += f"Cliente: {client.name} (N° {client.id})\n"
+    report += f"Teléfono: {client.phone} - Email: {client.email} - NIT/CI: {client.nit}\n"
+    report += f"Fecha: {now.strftime('%d/%m/%Y %H:%M')}\n"
+    report += "="*50 + "\n\n"
+
+    report += f"Equipos recibidos: {len(devices)}\n"
+    report += f"Equipos entregados: {len(delivered)}\n"
+    report += f"Equipos pendientes: {len(pending)}\n"
+    report += f"Total facturado: ${sum((d.cost for d in delivered), ZERO):.2f}\n"
+    paid = sum((d.advance for d in pending), ZERO) + sum((d.cost for d in delivered), ZERO)
+    report += f"Total pagado: ${paid:.2f}\n"
+    report += f"Saldo pendiente: ${open_balance:.2f}\n\n"
+
+    report += "Equipos:\n" + "-"*50 + "\n"
+    for device in devices:
+        report += f"ID: {device.id} - {device.type} {device.brand} {device.model} - {device.status}\n"
+        report += f"Recibido: {format_timestamp(device.date_received)} - Costo: ${device.cost:.2f}"
+        report += f" - Anticipo: ${device.advance:.2f}"
+        if device.status == DELIVERED:
+            report += f" - Cobrado al entregar: ${device.balance:.2f}\n"
+        else:
+            report += f" - Saldo: ${device.balance:.2f}\n"
+    report += "\n"
+
+    report += "Facturas:\n" + "-"*50 + "\n"
+    for device in sorted(delivered, key=lambda d: d.factura_num):
+        report += (f"N° {device.factura_num} - {format_timestamp(device.date_delivered)} - "
+                   f"Equipo {device.id} - Total: ${device.cost:.2f}\n")
+    if not delivered:
+        report += "Sin facturas\n"
+    report += "\n"
+
+    report += "Movimientos:\n" + "-"*50 + "\n"
+    balance = ZERO
+    for date, description, amount in statement_movements(devices):
+        balance += amount
+        amount = f"-${abs(amount):.2f}" if amount.is_signed() else f"+${amount:.2f}"
+        day = date.strftime('%d/%m/%Y') if date else '--/--/----'
+        report += f"{day} {description}: {amount} (saldo ${balance:.2f})\n"
+    report += "-"*50 + "\n"
+    report += f"Saldo pendiente: ${open_balance:.2f}\n"
+    return report
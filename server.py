@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Servidor HTTP/JSON local para que varias terminales compartan una base.
+
+Un solo proceso es dueño de database/: mantiene los registros e índices en
+memoria (``service.DataService``) y serializa las escrituras con su lock.
+Las terminales se conectan con ``remote.RemoteService`` configurando la URL
+en settings.ini. Solo usa la biblioteca estándar:
+
+    python taller3.py serve --host 0.0.0.0 --port 8765
+
+Rutas:
+
+    GET    /api/clients                 ?q= búsqueda, ?suggest= autocompletar
+    GET    /api/clients/<id>
+    GET    /api/clients/<id>/devices    todos sus equipos, también los archivados
+    POST   /api/clients
+    DELETE /api/clients/<id>
+    GET    /api/devices                 ?q= búsqueda, ?serial=, ?client_id=&brand=&model=
+    GET    /api/devices/<id>
+    POST   /api/devices                 {"device": {...}, "images": [[ext, base64], ...]}
+    POST   /api/devices/<id>/images     {"images": [[ext, base64], ...]}
+    GET    /api/deliveries              equipos listos para entregar
+    POST   /api/deliveries/<id>         entrega el equipo y asigna factura
+    GET    /api/statuses                cantidad de equipos en cada estado
+    GET    /api/statuses?status=Listo&limit=200
+    POST   /api/statuses/<id>           {"status": "Listo"} cambia el estado del equipo
+    GET    /api/invoices?desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+    GET    /api/reports?range=mensual&desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+    GET    /api/reports/returns?limit=20
+    GET    /api/reports/turnaround?desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+    GET    /api/reports/filter?marca=Apple&estado=Recibido&costo_min=100&recibido_desde=AAAA-MM-DD
+    GET    /api/sync                    sucursal y vector "tiene" de sus registros
+    POST   /api/sync                    aplica un paquete y responde con lo que le falta al otro
+"""
+
+import base64
+import json
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import backups
+import metrics
+import sync
+from queries import DeviceFilter
+from records import Record
+from storage import METRICS_LOG
+from service import (DataService, ServiceError, NotFoundError, SEARCH_RESULTS_LIMIT,
+                     CLIENT_PICKER_LIMIT, RETURNS_REPORT_LIMIT)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def _int_arg(params, name, default=None):
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise ServiceError(f"Parámetro inválido: {name}")
+
+
+def _encode_record(value):
+    """Los registros viajan con el mismo formato que tienen en los archivos JSON"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"No se puede convertir a JSON: {type(value).__name__}")
+
+
+def _date_arg(params, name):
+    values = params.get(name)
+    if not values:
+        return None
+    try:
+        return datetime.strptime(values[0], "%Y-%m-%d")
+    except ValueError:
+        raise ServiceError(f"Fecha inválida (use AAAA-MM-DD): {name}")
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Traduce las rutas /api/... a métodos de ``self.server.service``"""
+
+    server_version = "TallerServer/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=_encode_record).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise ServiceError("El cuerpo de la petición no es JSON válido")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        params = parse_qs(url.query)
+        try:
+            if parts[:1] != ['api'] or len(parts) < 2:
+                raise NotFoundError("Ruta no encontrada")
+            handler = getattr(self, f"{method}_{parts[1]}", None)
+            if handler is None:
+                raise NotFoundError("Ruta no encontrada")
+            with metrics.timed(f"server.{method} {parts[1]}"):
+                status, payload = handler(parts[2:], params)
+        except NotFoundError as e:
+            self._send_json(404, {'error': str(e)})
+        except (ServiceError, sync.SyncError, ValueError, TypeError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': f"Error interno: {e}"})
+        else:
+            self._send_json(status, payload)
+
+    def do_GET(self):
+        self._dispatch('get')
+
+    def do_POST(self):
+        self._dispatch('post')
+
+    def do_DELETE(self):
+        self._dispatch('delete')
+
+    # Clientes
+
+    def get_clients(self, rest, params):
+        service = self.server.service
+        if len(rest) == 2 and rest[1] == 'devices':
+            return 200, service.client_devices(int(rest[0]))
+        if len(rest) == 1:
+            client = service.get_client(int(rest[0]))
+            if client is None:
+                raise NotFoundError("Cliente no encontrado")
+            return 200, client
+        if rest:
+            raise NotFoundError("Ruta no encontrada")
+        if 'q' in params:
+            limit = _int_arg(params, 'limit', SEARCH_RESULTS_LIMIT)
+            return 200, service.search_clients(params['q'][0], limit)
+        if 'suggest' in params:
+            limit = _int_arg(params, 'limit', CLIENT_PICKER_LIMIT)
+            return 200, service.suggest_clients(params['suggest'][0], limit)
+        return 200, service.list_clients()
+
+    def post_clients(self, rest, params):
+        return 201, self.server.service.add_client(self._read_json())
+
+    def delete_clients(self, rest, params):
+        if not rest:
+            raise NotFoundError("Ruta no encontrada")
+        self.server.service.delete_client(int(rest[0]))
+        return 200, {'deleted': int(rest[0])}
+
+    # Equipos
+
+    def get_devices(self, rest, params):
+        service = self.server.service
+        if rest:
+            device = service.get_device(int(rest[0]))
+            if device is None:
+                raise NotFoundError("Equipo no encontrado")
+            return 200, device
+        if 'q' in params:
+            limit = _int_arg(params, 'limit', SEARCH_RESULTS_LIMIT)
+            return 200, service.search_devices(params['q'][0], limit)
+        if 'serial' in params:
+            return 200, service.devices_by_serial(params['serial'][0])
+        if 'brand' in params and 'model' in params:
+            return 200, service.client_devices_by_model(
+                _int_arg(params, 'client_id'), params['brand'][0], params['model'][0])
+        return 200, service.list_devices()
+
+    def post_devices(self, rest, params):
+        body = self._read_json()
+        images = [(ext, base64.b64decode(data)) for ext, data in body.get('images', [])]
+        if len(rest) == 2 and rest[1] == 'images':
+            return 200, self.server.service.add_device_images(int(rest[0]), images)
+        if rest:
+            raise NotFoundError("Ruta no encontrada")
+        return 201, self.server.service.add_device(body.get('device', {}), images)
+
+    # Entregas
+
+    def get_deliveries(self, rest, params):
+        return 200, self.server.service.deliverable_devices()
+
+    def post_deliveries(self, rest, params):
+        if not rest:
+            raise NotFoundError("Ruta no encontrada")
+        device, client = self.server.service.deliver_device(int(rest[0]))
+        return 200, {'device': device, 'client': client}
+
+    # Estados
+
+    def get_statuses(self, rest, params):
+        if rest:
+            raise NotFoundError("Ruta no encontrada")
+        if 'status' in params:
+            return 200, self.server.service.devices_by_status(params['status'][0],
+                                                              _int_arg(params, 'limit'))
+        return 200, self.server.service.status_counts()
+
+    def post_statuses(self, rest, params):
+        if len(rest) != 1:
+            raise NotFoundError("Ruta no encontrada")
+        return 200, self.server.service.change_status(int(rest[0]), self._read_json().get('status', ''))
+
+    # Facturas
+
+    def get_invoices(self, rest, params):
+        if rest:
+            raise NotFoundError("Ruta no encontrada")
+        invoices = self.server.service.invoices_between(_date_arg(params, 'desde'),
+                                                        _date_arg(params, 'hasta'))
+        return 200, [{'device': i.device, 'client': i.client} for i in invoices]
+
+    # Reportes
+
+    def get_reports(self, rest, params):
+        service = self.server.service
+        if rest == ['returns']:
+            return 200, service.most_returning(_int_arg(params, 'limit', RETURNS_REPORT_LIMIT))
+        if rest == ['turnaround']:
+            text = service.turnaround_report(_date_arg(params, 'desde'), _date_arg(params, 'hasta'))
+            return 200, {'text': text}
+        if rest == ['filter']:
+            device_filter = DeviceFilter.from_params({name: values[0]
+                                                      for name, values in params.items()})
+            return 200, {'text': service.filter_report(device_filter)}
+        if rest:
+            raise NotFoundError("Ruta no encontrada")
+        report_type = params.get('range', ['diario'])[0]
+        text = service.report(report_type, _date_arg(params, 'desde'), _date_arg(params, 'hasta'))
+        return 200, {'text': text}
+
+    # Sincronización entre sucursales
+
+    def get_sync(self, rest, params):
+        if rest:
+            raise NotFoundError("Ruta no encontrada")
+        return 200, sync.Synchronizer(self.server.service).status()
+
+    def post_sync(self, rest, params):
+        if rest:
+            raise NotFoundError("Ruta no encontrada")
+        bundle = self._read_json()
+        synchronizer = sync.Synchronizer(self.server.service)
+        result = synchronizer.apply(bundle)
+        reply = synchronizer.bundle(bundle.get('tiene'))
+        reply['resultado'] = result.summary()
+        return 200, reply
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, ApiHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def make_server(service=None, host=DEFAULT_HOST, port=DEFAULT_PORT, verbose=False):
+    """Crea el servidor sin arrancarlo; ``port=0`` elige un puerto libre"""
+    return ApiServer((host, port), service or DataService(), verbose)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Atiende peticiones hasta Ctrl+C"""
+    metrics.enable_log(METRICS_LOG)
+    server = make_server(host=host, port=port, verbose=True)
+    # El servidor es dueño de database/: también hace los backups automáticos
+    scheduler = backups.BackupScheduler(lambda: server.service.writes).start()
+    print(f"Servidor del taller en http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+        server.server_close()
+        # La próxima vez el servidor arranca desde la instantánea (ver snapshot)
+        server.service.save_snapshot()
@@ -0,0 +1,878 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Operaciones del taller sobre clientes y equipos, sin interfaz gráfica.
+
+``DataService`` mantiene los registros y sus índices en memoria: las
+lecturas se sirven desde ahí y las escrituras pasan por los archivos JSON.
+La ventana principal lo usa directamente en modo local, y el servidor HTTP
+(server.py) lo expone para que varias terminales compartan una sola base.
+``remote.RemoteService`` ofrece los mismos métodos sobre HTTP.
+
+Los equipos entregados hace tiempo se mueven al archivo por años (ver
+archive); las consultas de historial, búsqueda y reportes lo incluyen.
+Con ``[Sucursal] numero`` configurado, cada cambio se anota además en el
+registro de la sucursal para sincronizarla con las demás (ver sync).
+
+Al arrancar se usa la instantánea de registros e índices que dejó el
+último cierre (ver snapshot), para las partes cuyo archivo no cambió.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+from datetime import datetime, timedelta
+
+import archive
+import changes
+import metrics
+import queries
+import records
+import storage
+import reports
+import snapshot
+import sync
+import turnaround
+from indexes import (ClientDeviceIndex, FilterIndex, SearchIndex, PrefixIndex, SerialIndex,
+                     StatusIndex)
+from records import (Client, Device, Invoice, ZERO, to_money, STATUSES, TRANSITIONS, RECEIVED,
+                     READY, DELIVERED)
+from storage import CLIENTS_FILE, DEVICES_FILE, IMAGES_DIR, TURNAROUND_FILE
+
+# Campos indexados para la búsqueda de clientes y equipos
+CLIENT_SEARCH_FIELDS = ('name', 'phone', 'email', 'nit')
+CLIENT_COMPACT_FIELDS = ('phone', 'nit')
+DEVICE_SEARCH_FIELDS = ('id', 'client_name', 'type', 'brand', 'model', 'serial', 'issues')
+DEVICE_COMPACT_FIELDS = ('serial',)
+SEARCH_RESULTS_LIMIT = 500
+CLIENT_PICKER_LIMIT = 50
+RETURNS_REPORT_LIMIT = 20
+
+MAX_DEVICE_IMAGES = 3
+
+
+class ServiceError(Exception):
+    """Error de una operación, con un mensaje apto para mostrar al usuario"""
+
+
+class NotFoundError(ServiceError):
+    """El cliente o equipo pedido no existe"""
+
+
+def _merge_records(records, upserts, deleted, index):
+    """Lista nueva con ``upserts`` reemplazados o agregados al final y sin los IDs ``deleted``.
+
+    ``index`` responde qué IDs ya están en ``records``. Con sucursales los IDs
+    no llegan en orden, así que no alcanza con comparar contra el último.
+    """
+    changed = {r.id: r for r in upserts}
+    if not deleted and not any(record_id in index for record_id in changed):
+        # Solo altas (lo más común): no hace falta recorrer la lista
+        return records + sorted(upserts, key=lambda r: r.id)
+    merged = [changed.pop(r.id, r) for r in records if r.id not in deleted]
+    merged.extend(sorted(changed.values(), key=lambda r: r.id))
+    return merged
+
+
+class DataService:
+    """Clientes y equipos en memoria con índices de búsqueda.
+
+    Todas las operaciones públicas toman ``lock``; así el servidor puede
+    atender varias conexiones a la vez y las escrituras quedan serializadas.
+
+    Las escrituras toman además ``storage.write_lock()`` para excluir a otras
+    instancias que usen la misma carpeta. Dentro del bloqueo se compara la
+    firma (inodo, mtime, tamaño) de cada archivo con
+    la de la última lectura o escritura propia: si nadie más lo modificó se
+    trabaja sobre la copia en memoria y los índices se actualizan de forma
+    incremental; si cambió, primero se aplican los cambios que la otra
+    instancia dejó en el registro de cambios (ver changes) y solo si eso no
+    alcanza se relee y se reindexa.
+    """
+
+    def __init__(self, auto_archive=True, warm_start=True):
+        self.auto_archive = auto_archive
+        self.lock = threading.RLock()
+        self.client_index = SearchIndex(CLIENT_SEARCH_FIELDS, CLIENT_COMPACT_FIELDS)
+        self.client_prefix_index = PrefixIndex()
+        self.device_index = SearchIndex(DEVICE_SEARCH_FIELDS, DEVICE_COMPACT_FIELDS)
+        self.serial_index = SerialIndex()
+        self.client_device_index = ClientDeviceIndex()
+        self.status_index = StatusIndex()
+        self.filter_index = FilterIndex()
+        self.archive = archive.DeviceArchive(DEVICE_SEARCH_FIELDS, DEVICE_COMPACT_FIELDS)
+        self.clients = []
+        self.devices = []
+        self._client_signature = None
+        self._device_signature = None
+        self.journal = changes.Journal()
+        self._changes = changes.ChangeSet()
+        self.sync_log = sync.local_log()
+        self.turnaround = None
+        self._turnaround_signature = None
+        self._turnaround_checked = None
+        self._snapshot_sources = None
+        # Veces que esta instancia guardó clientes o equipos (ver backups.BackupScheduler)
+        self.writes = 0
+        self.reload(warm_start)
+
+    @metrics.timed('service.reload')
+    def reload(self, warm_start=False):
+        """Vuelve a leer los archivos JSON, reconstruye los índices y archiva lo antiguo.
+
+        Con ``warm_start`` toma de la instantánea de arranque lo que siga al día.
+        """
+        with self.lock:
+            storage.initialize_json_files()
+            self.journal.seek_end()
+            self._client_signature = None
+            self._device_signature = None
+            self._changes = changes.ChangeSet()
+            self.turnaround = None
+            if warm_start:
+                self._restore_snapshot()
+            self._current_clients()
+            self._current_devices()
+            if self.auto_archive:
+                self.archive_delivered()
+
+    def _snapshot_parts(self):
+        """Partes de la instantánea: {nombre: (firma del archivo, registros e índices)}"""
+        return {'clientes': (self._client_signature,
+                             (self.clients, self.client_index, self.client_prefix_index)),
+                'equipos': (self._device_signature,
+                            (self.devices, self.device_index, self.serial_index,
+                             self.client_device_index, self.status_index, self.filter_index))}
+
+    def _restore_snapshot(self):
+        """Toma de la instantánea las partes cuyo archivo no cambió desde que se guardó"""
+        sources = {'clientes': storage.file_signature(CLIENTS_FILE),
+                   'equipos': storage.file_signature(DEVICES_FILE)}
+        parts = snapshot.load(snapshot.code_signature(__file__), sources)
+        if 'clientes' in parts:
+            self.clients, self.client_index, self.client_prefix_index = parts['clientes']
+            self._client_signature = sources['clientes']
+        if 'equipos' in parts:
+            (self.devices, self.device_index, self.serial_index,
+             self.client_device_index, self.status_index, self.filter_index) = parts['equipos']
+            self._device_signature = sources['equipos']
+        if len(parts) == len(sources):
+            self._snapshot_sources = sources
+
+    def save_snapshot(self):
+        """Guarda registros e índices para el próximo arranque (ver snapshot).
+
+        Si no cambiaron desde la última instantánea no se vuelve a escribir.
+        Devuelve True si se escribió.
+        """
+        with self.lock:
+            self._current_clients()
+            self._current_devices()
+            sources = {'clientes': self._client_signature, 'equipos': self._device_signature}
+            if sources == self._snapshot_sources and os.path.exists(storage.SNAPSHOT_FILE):
+                return False
+            snapshot.save(snapshot.code_signature(__file__), self._snapshot_parts())
+            self._snapshot_sources = sources
+            return True
+
+    def _set_clients(self, clients):
+        self.clients = clients
+        self.client_index.rebuild(clients)
+        self.client_prefix_index.rebuild(clients)
+
+    def _set_devices(self, devices):
+        self.devices = devices
+        self.device_index.rebuild(devices)
+        self.serial_index.rebuild(devices)
+        self.client_device_index.rebuild(devices)
+        self.status_index.rebuild(devices)
+        self.filter_index.rebuild(devices)
+
+    def _current_clients(self):
+        """Clientes al día con el archivo; si otro proceso lo cambió aplica sus cambios o lo relee"""
+        signature = storage.file_signature(CLIENTS_FILE)
+        if signature != self._client_signature:
+            self._catch_up()
+        if signature != self._client_signature:
+            if self._client_signature is not None:
+                self._changes.all_clients = True
+            self._set_clients(storage.load_clients())
+            self._client_signature = signature
+        return self.clients
+
+    def _current_devices(self):
+        """Equipos al día con el archivo; si otro proceso lo cambió aplica sus cambios o lo relee"""
+        signature = storage.file_signature(DEVICES_FILE)
+        if signature != self._device_signature:
+            self._catch_up()
+        if signature != self._device_signature:
+            if self._device_signature is not None:
+                self._changes.all_devices = True
+            self._set_devices(storage.load_devices())
+            self._device_signature = signature
+        return self.devices
+
+    def _catch_up(self):
+        """Aplica las entradas del registro de cambios que dejaron otras instancias"""
+        for entry in self.journal.read() or ():
+            if entry.get('reload'):
+                continue
+            before = tuple(entry.get('before') or ())
+            after = tuple(entry.get('after') or ())
+            deleted = set(entry.get('delete', ()))
+            # Solo se aplica sobre la misma versión del archivo que tenía quien escribió;
+            # si no, la relectura completa de _current_* se encarga
+            if entry.get('file') == 'clientes' and before == self._client_signature:
+                upserts = [Client.from_dict(c) for c in entry.get('upsert', ())]
+                self.clients = _merge_records(self.clients, upserts, deleted, self.client_index)
+                for client_id in deleted:
+                    self.client_index.remove(client_id)
+                    self.client_prefix_index.remove(client_id)
+                self.client_index.add_many(upserts)
+                self.client_prefix_index.add_many(upserts)
+                self._client_signature = after
+                self._changes.clients.update(c.id for c in upserts)
+                self._changes.deleted_clients.update(deleted)
+            elif entry.get('file') == 'equipos' and before == self._device_signature:
+                upserts = [Device.from_dict(d) for d in entry.get('upsert', ())]
+                self.devices = _merge_records(self.devices, upserts, deleted, self.device_index)
+                for device_id in deleted:
+                    self.device_index.remove(device_id)
+                    self.serial_index.remove(device_id)
+                    self.client_device_index.remove(device_id)
+                    self.status_index.remove(device_id)
+                    self.filter_index.remove(device_id)
+                self.device_index.add_many(upserts)
+                self.serial_index.add_many(upserts)
+                self.client_device_index.add_many(upserts)
+                self.status_index.add_many(upserts)
+                self.filter_index.add_many(upserts)
+                self._device_signature = after
+                self._changes.devices.update(d.id for d in upserts)
+                self._changes.deleted_devices.update(deleted)
+
+    def _save_clients(self, clients, changed=(), deleted=(), branch_log=True):
+        """Guarda los clientes y anota ``changed``/``deleted`` en el registro de cambios.
+
+        Con ``branch_log`` los cambios se anotan también para las otras sucursales.
+        """
+        before = self._client_signature
+        storage.save_clients(clients)
+        self.clients = clients
+        self.writes += 1
+        self._client_signature = storage.file_signature(CLIENTS_FILE)
+        self.journal.append(changes.make_entry('clientes', before, self._client_signature,
+                                               changed, deleted))
+        if branch_log and self.sync_log is not None:
+            self.sync_log.record('clientes', changed, deleted)
+
+    def _save_devices(self, devices, changed=(), deleted=(), branch_log=True):
+        """Guarda los equipos y anota ``changed``/``deleted`` en el registro de cambios.
+
+        Con ``branch_log`` los cambios se anotan también para las otras sucursales.
+        """
+        before = self._device_signature
+        storage.save_devices(devices)
+        self.devices = devices
+        self.writes += 1
+        self._device_signature = storage.file_signature(DEVICES_FILE)
+        self.journal.append(changes.make_entry('equipos', before, self._device_signature,
+                                               changed, deleted))
+        if branch_log and self.sync_log is not None:
+            self.sync_log.record('equipos', changed, deleted)
+
+    def _current_turnaround(self):
+        """Histogramas de tiempos al día con tiempos.json y con las entregas de equipos.json"""
+        signature = storage.file_signature(TURNAROUND_FILE)
+        if self.turnaround is None or signature != self._turnaround_signature:
+            data = storage.load_turnaround()
+            if data is None:
+                self._rebuild_turnaround()
+                return self.turnaround
+            self.turnaround = turnaround.TurnaroundStats.from_dict(data)
+            self._turnaround_signature = signature
+            self._turnaround_checked = None
+        devices = self._current_devices()
+        if self._turnaround_checked != self._device_signature:
+            # Entregas que otra instancia no alcanzó a sumar (o hechas con una versión anterior)
+            self.turnaround.add_new(devices)
+            self._turnaround_checked = self._device_signature
+        return self.turnaround
+
+    @metrics.timed('service.rebuild_turnaround')
+    def _rebuild_turnaround(self):
+        with storage.write_lock():
+            current = self._current_devices()
+            active_ids = {d.id for d in current}
+            # El archivo se recorre sin cargarlo entero: solo hace falta una vez
+            archived = self.archive.iter_devices(lambda d: d.id not in active_ids)
+            self.turnaround = turnaround.TurnaroundStats.build(itertools.chain(archived, current))
+            self._save_turnaround()
+
+    def _save_turnaround(self):
+        storage.save_turnaround(self.turnaround.to_dict())
+        self._turnaround_signature = storage.file_signature(TURNAROUND_FILE)
+        self._turnaround_checked = self._device_signature
+
+    @staticmethod
+    def _client_from_form(data):
+        """Cliente todavía sin ID a partir de los datos de un formulario o petición"""
+        return Client(None,
+                      str(data.get('name', '')).strip(),
+                      str(data.get('phone', '')).strip(),
+                      str(data.get('email', '')).strip(),
+                      str(data.get('address', '')).strip(),
+                      str(data.get('nit', '')).strip())
+
+    def refresh(self):
+        """Pone al día clientes y equipos con lo que guardaron otras instancias"""
+        with self.lock:
+            self._current_clients()
+            self._current_devices()
+
+    def poll_changes(self):
+        """``ChangeSet`` con lo que otras instancias cambiaron desde la consulta anterior"""
+        with self.lock:
+            self.refresh()
+            result, self._changes = self._changes, changes.ChangeSet()
+            return result
+
+    # Lecturas
+
+    def list_clients(self):
+        with self.lock:
+            return list(self._current_clients())
+
+    def list_devices(self):
+        """Equipos activos y entregados recientemente (sin el archivo)"""
+        with self.lock:
+            return list(self._current_devices())
+
+    def get_client(self, client_id):
+        """Cliente con ese ID o None"""
+        with self.lock:
+            return self.client_index.get(client_id)
+
+    def get_device(self, device_id):
+        """Equipo con ese ID o None; busca también en el archivo"""
+        with self.lock:
+            return self.device_index.get(device_id) or self.archive.get(device_id)
+
+    @metrics.timed('service.search_clients')
+    def search_clients(self, query, limit=SEARCH_RESULTS_LIMIT):
+        with self.lock:
+            ids = self.client_index.search(query, limit=limit)
+            return [self.client_index.get(client_id) for client_id in ids]
+
+    @metrics.timed('service.search_devices')
+    def search_devices(self, query, limit=SEARCH_RESULTS_LIMIT):
+        """Equipos que coinciden, los más recientes primero.
+
+        El archivo solo se consulta si los equipos activos no llenan el límite.
+        """
+        with self.lock:
+            ids = self.device_index.search(query, limit=limit)
+            results = [self.device_index.get(device_id) for device_id in ids]
+            if limit is None or len(results) < limit:
+                remaining = None if limit is None else limit - len(results)
+                results.extend(d for d in self.archive.search(query, limit=remaining)
+                               if d.id not in self.device_index)
+            return results
+
+    @metrics.timed('service.suggest_clients')
+    def suggest_clients(self, text, limit=CLIENT_PICKER_LIMIT):
+        """Clientes cuyo nombre o teléfono empieza con ``text``"""
+        with self.lock:
+            ids = self.client_prefix_index.search(text, limit=limit)
+            return [self.client_prefix_index.get(client_id) for client_id in ids]
+
+    def _with_archived(self, archived, ids):
+        """Une equipos archivados y activos sin repetir, ordenados por ID"""
+        merged = {d.id: d for d in archived}
+        merged.update((i, self.device_index.get(i)) for i in ids)
+        return [merged[i] for i in sorted(merged)]
+
+    @metrics.timed('service.devices_by_serial')
+    def devices_by_serial(self, serial):
+        """Ingresos con ese número de serie, del más antiguo al más reciente"""
+        with self.lock:
+            return self._with_archived(self.archive.by_serial(serial),
+                                       self.serial_index.by_serial(serial))
+
+    def client_devices_by_model(self, client_id, brand, model):
+        """Equipos de un cliente con esa marca y modelo"""
+        with self.lock:
+            devices = self._with_archived(self.archive.by_model(brand, model),
+                                          self.serial_index.by_model(brand, model))
+            return [d for d in devices if d.client_id == client_id]
+
+    @metrics.timed('service.client_devices')
+    def client_devices(self, client_id):
+        """Todos los equipos del cliente, activos y archivados, del más antiguo al más reciente"""
+        with self.lock:
+            self._current_devices()
+            return self._with_archived(self.archive.by_client(client_id),
+                                       self.client_device_index.by_client(client_id))
+
+    @metrics.timed('service.client_invoices')
+    def client_invoices(self, client_id):
+        """Facturas (``Invoice``) del cliente, por número"""
+        with self.lock:
+            self._current_devices()
+            client = self.client_index.get(client_id)
+            if client is None:
+                return []
+            devices = self._with_archived(self.archive.invoiced_by_client(client_id),
+                                          self.client_device_index.invoiced_by_client(client_id))
+            return [Invoice.for_device(d, client) for d in sorted(devices, key=lambda d: d.factura_num)]
+
+    @metrics.timed('service.client_statement')
+    def client_statement(self, client_id):
+        """Texto del estado de cuenta del cliente"""
+        with self.lock:
+            client = self.client_index.get(client_id)
+            if client is None:
+                raise NotFoundError("Cliente no encontrado")
+            devices = self.client_devices(client_id)
+        return reports.build_client_statement(client, devices)
+
+    @metrics.timed('service.most_returning')
+    def most_returning(self, limit=RETURNS_REPORT_LIMIT):
+        """Pares (serie, equipos) de las series con más ingresos"""
+        with self.lock:
+            archived_serials = self.archive.serials()
+            if not archived_serials:
+                return [(serial, [self.device_index.get(i) for i in ids])
+                        for serial, ids in self.serial_index.most_returning(limit)]
+
+            # Mismo orden que SerialIndex.most_returning: cantidad y luego el ingreso más reciente
+            hot_serials = self.serial_index.serials()
+            ranked = []
+            for serial in archived_serials.keys() | hot_serials.keys():
+                ids = archived_serials.get(serial, []) + hot_serials.get(serial, [])
+                if len(ids) > 1:
+                    ranked.append((len(ids), max(ids), serial))
+            return [(serial, self.devices_by_serial(serial))
+                    for _, _, serial in heapq.nlargest(limit, ranked)]
+
+    def deliverable_devices(self):
+        """Equipos listos para entregar, de la cola del estado Listo"""
+        return self.devices_by_status(READY)
+
+    def devices_by_status(self, status, limit=None):
+        """Equipos en ese estado, del más antiguo al más reciente; con ``limit``, los últimos"""
+        with self.lock:
+            self._current_devices()
+            return [self.device_index.get(i) for i in self.status_index.ids(status, limit)]
+
+    def status_counts(self):
+        """Cantidad de equipos activos en cada estado, en el orden del taller"""
+        with self.lock:
+            self._current_devices()
+            counts = self.status_index.counts()
+            return {status: counts.pop(status, 0) for status in STATUSES} | counts
+
+    @metrics.timed('service.report')
+    def report(self, report_type, start_date=None, end_date=None):
+        """Texto del reporte del periodo indicado"""
+        start, end = reports.report_range(report_type, start_date, end_date)
+        with self.lock:
+            # Solo se leen las particiones del archivo que caen en el periodo
+            archived = self.archive.devices_between(start, end)
+            current = self._current_devices()
+            active_ids = {d.id for d in current} if archived else ()
+            devices = [d for d in archived if d.id not in active_ids] + current
+        return reports.build_report(devices, report_type, start, end)
+
+    @metrics.timed('service.filter_devices')
+    def filter_devices(self, device_filter):
+        """Equipos activos y archivados que cumplen ``device_filter`` (ver queries), por ID"""
+        with self.lock:
+            self._current_devices()
+            plan = queries.plan(device_filter, self.filter_index, self.client_device_index,
+                                self.status_index)
+            candidates = self.devices if plan.ids is None else map(self.device_index.get, plan.ids)
+            current = [d for d in candidates if device_filter.matches(d)]
+            archived = [d for d in self.archive.filter(device_filter)
+                        if d.id not in self.device_index]
+            return sorted(archived + current, key=lambda d: d.id) if archived else current
+
+    def explain_filter(self, device_filter):
+        """Pasos que sigue el planificador para los equipos activos (ver queries.plan)"""
+        with self.lock:
+            self._current_devices()
+            return queries.plan(device_filter, self.filter_index, self.client_device_index,
+                                self.status_index).steps
+
+    @metrics.timed('service.filter_report')
+    def filter_report(self, device_filter):
+        """Texto del reporte de los equipos que cumplen ``device_filter``"""
+        devices = self.filter_devices(device_filter)
+        client = None
+        if device_filter.client_id is not None:
+            client = self.get_client(device_filter.client_id)
+        return reports.build_filter_report(devices, device_filter.describe(client and client.name))
+
+    @metrics.timed('service.invoices_between')
+    def invoices_between(self, start_date, end_date):
+        """Facturas (``Invoice``) de los equipos entregados entre las dos fechas, por número"""
+        start, end = reports.report_range("personalizado", start_date, end_date)
+        with self.lock:
+            self._current_clients()
+            current = [d for d in self._current_devices()
+                       if d.factura_num and d.date_delivered is not None
+                       and start <= d.date_delivered <= end]
+            active_ids = {d.id for d in self.devices}
+            archived = [d for d in self.archive.delivered_between(start, end)
+                        if d.factura_num and d.id not in active_ids]
+            devices = sorted(archived + current, key=lambda d: d.factura_num)
+            return [Invoice.for_device(d, self.client_index.get(d.client_id)) for d in devices
+                    if d.client_id in self.client_index]
+
+    @metrics.timed('service.turnaround_report')
+    def turnaround_report(self, start_date, end_date):
+        """Texto del reporte de tiempos de reparación de los meses entre las dos fechas"""
+        start, end = reports.report_range("personalizado", start_date, end_date)
+        with self.lock:
+            summary = self._current_turnaround().summary(start, end)
+        return reports.build_turnaround_report(summary, start, end, turnaround.target_days())
+
+    def rebuild_turnaround(self):
+        """Recalcula tiempos.json con todos los equipos; devuelve cuántos entregados contó"""
+        with self.lock:
+            self._rebuild_turnaround()
+            return sum(m['total'].count for m in self.turnaround.months.values())
+
+    # Escrituras
+
+    @metrics.timed('service.add_client')
+    def add_client(self, data):
+        """Agrega un cliente y lo devuelve con su ID asignado"""
+        client = self._client_from_form(data)
+        if not client.name:
+            raise ServiceError("El nombre del cliente es obligatorio")
+
+        with self.lock, storage.write_lock():
+            clients = self._current_clients()
+
+            # Generar ID único
+            new_id = storage.get_next_client_id(clients)
+
+            new_client = client.replace(id=new_id)
+            self._save_clients(clients + [new_client], [new_client])
+            self.client_index.add(new_client)
+            self.client_prefix_index.add(new_client)
+            return new_client
+
+    @metrics.timed('service.add_clients')
+    def add_clients(self, new_clients):
+        """Agrega varios ``Client`` con una sola escritura del archivo.
+
+        Pensado para importaciones: el ID de cada registro se ignora y se
+        asigna uno nuevo. Devuelve los clientes creados, en el mismo orden.
+        """
+        new_clients = list(new_clients)
+        if any(not c.name.strip() for c in new_clients):
+            raise ServiceError("El nombre del cliente es obligatorio")
+
+        with self.lock, storage.write_lock():
+            clients = self._current_clients()
+            first_id = storage.get_next_client_id(clients)
+            created = [c.replace(id=first_id + i, balance=ZERO) for i, c in enumerate(new_clients)]
+            self._save_clients(clients + created, created)
+            self.client_index.add_many(created)
+            self.client_prefix_index.add_many(created)
+            return created
+
+    def client_has_devices(self, client_id):
+        """Si el cliente tiene equipos, activos o archivados"""
+        with self.lock:
+            self._current_devices()
+            return (self.client_device_index.has_devices(client_id)
+                    or self.archive.has_client_devices(client_id))
+
+    @metrics.timed('service.delete_client')
+    def delete_client(self, client_id):
+        """Elimina un cliente que no tenga equipos registrados"""
+        with self.lock, storage.write_lock():
+            # Verificar si el cliente tiene equipos asociados
+            if self.client_has_devices(client_id):
+                raise ServiceError("No se puede eliminar el cliente porque tiene equipos registrados. "
+                                   "Primero elimine o transfiera los equipos.")
+
+            clients = self._current_clients()
+            remaining = [c for c in clients if c.id != client_id]
+            if len(remaining) == len(clients):
+                raise NotFoundError("Cliente no encontrado")
+            self._save_clients(remaining, deleted=[client_id])
+            self.client_index.remove(client_id)
+            self.client_prefix_index.remove(client_id)
+
+    @metrics.timed('service.add_device')
+    def add_device(self, data, images=()):
+        """Recibe un equipo y lo devuelve con su ID asignado.
+
+        ``images`` es una lista de pares (extensión, contenido en bytes); se
+        guardan en database/images con el ID del equipo.
+        """
+        client_id = data.get('client_id')
+        brand = str(data.get('brand', '')).strip()
+        model = str(data.get('model', '')).strip()
+        cost = to_money(data.get('cost', 0))
+        advance = to_money(data.get('advance', 0))
+
+        if not client_id:
+            raise ServiceError("Seleccione un cliente")
+
+        if not brand or not model:
+            raise ServiceError("Marca y modelo son obligatorios")
+
+        with self.lock, storage.write_lock():
+            devices = self._current_devices()
+            clients = self._current_clients()
+
+            # Obtener nombre del cliente
+            client = self.client_index.get(client_id)
+            if not client:
+                raise NotFoundError("Cliente no encontrado")
+
+            # Generar ID único
+            new_id = storage.get_next_device_id(devices)
+            now = records.now()
+
+            # Guardar imágenes en directorio
+            saved_images = self._write_images(new_id, images)
+
+            new_device = Device(new_id, client.id, client.name,
+                                type=str(data.get('type', '')),
+                                brand=brand,
+                                model=model,
+                                serial=str(data.get('serial', '')).strip(),
+                                issues=str(data.get('issues', '')).strip(),
+                                cost=cost,
+                                advance=advance,
+                                status=RECEIVED,
+                                date_received=now,
+                                images=saved_images,
+                                history=((RECEIVED, now),))
+            self._save_devices(devices + [new_device], [new_device])
+            self.device_index.add(new_device)
+            self.serial_index.add(new_device)
+            self.client_device_index.add(new_device)
+            self.status_index.add(new_device)
+            self.filter_index.add(new_device)
+
+            # Actualizar saldo del cliente
+            updated_client = client.replace(balance=client.balance + new_device.balance)
+            self._save_clients([updated_client if c.id == client_id else c for c in clients],
+                               [updated_client])
+            self.client_index.add(updated_client)
+            self.client_prefix_index.add(updated_client)
+            return new_device
+
+    @staticmethod
+    def _write_images(device_id, images, existing=()):
+        """Guarda pares (extensión, bytes) en database/images a continuación de ``existing``"""
+        saved = list(existing)
+        for ext, content in list(images)[:MAX_DEVICE_IMAGES - len(saved)]:
+            new_path = os.path.join(IMAGES_DIR, f"device_{device_id}_{len(saved)}{ext}")
+            with open(new_path, 'wb') as f:
+                f.write(content)
+            saved.append(new_path)
+        return saved
+
+    @metrics.timed('service.add_device_images')
+    def add_device_images(self, device_id, images):
+        """Agrega fotos (pares extensión, bytes) a un equipo ya registrado y lo devuelve.
+
+        Las que pasan de MAX_DEVICE_IMAGES se descartan.
+        """
+        with self.lock, storage.write_lock():
+            devices = self._current_devices()
+            device = self.device_index.get(device_id)
+            if not device:
+                raise NotFoundError("Equipo no encontrado")
+            updated = device.replace(images=self._write_images(device_id, images, device.images))
+            self._save_devices([updated if d.id == device_id else d for d in devices], [updated])
+            self.device_index.add(updated)
+            return updated
+
+    @metrics.timed('service.add_devices')
+    def add_devices(self, new_devices):
+        """Agrega varios ``Device`` con una sola escritura de cada archivo.
+
+        Pensado para importaciones de datos antiguos: se respetan el estado y
+        las fechas de cada registro; el ID se ignora y se asigna uno nuevo.
+        Devuelve los equipos creados.
+        """
+        new_devices = list(new_devices)
+        with self.lock, storage.write_lock():
+            devices = self._current_devices()
+            clients = self._current_clients()
+
+            now = records.now()
+            first_id = storage.get_next_device_id(devices)
+            created = []
+            balances = {}
+            for i, device in enumerate(new_devices):
+                client = self.client_index.get(device.client_id)
+                if not client:
+                    raise NotFoundError(f"Cliente no encontrado: {device.client_id}")
+                created.append(device.replace(id=first_id + i,
+                                              client_name=client.name,
+                                              date_received=device.date_received or now,
+                                              images=(),
+                                              factura_num=0))
+                balances[client.id] = balances.get(client.id, ZERO) + device.balance
+
+            # Los entregados importados no tienen factura, así que add_new no los
+            # ve: se suman aquí (antes de guardar, por si hay que reconstruir todo)
+            delivered = [d for d in created if d.status == DELIVERED]
+            if delivered:
+                stats = self._current_turnaround()
+                for device in delivered:
+                    stats.add(device)
+
+            self._save_devices(devices + created, created)
+            self.device_index.add_many(created)
+            self.serial_index.add_many(created)
+            self.client_device_index.add_many(created)
+            self.status_index.add_many(created)
+            self.filter_index.add_many(created)
+            if delivered:
+                self._save_turnaround()
+
+            # Actualizar saldos con una sola escritura de clientes
+            updated = {}
+            for client_id, amount in balances.items():
+                client = self.client_index.get(client_id)
+                updated[client_id] = client.replace(balance=client.balance + amount)
+            self._save_clients([updated.get(c.id, c) for c in clients], updated.values())
+            self.client_index.add_many(updated.values())
+            self.client_prefix_index.add_many(updated.values())
+            return created
+
+    @metrics.timed('service.deliver_device')
+    def deliver_device(self, device_id):
+        """Marca un equipo como entregado con el próximo número de factura.
+
+        Devuelve el par (equipo, cliente) para generar la factura.
+        """
+        with self.lock, storage.write_lock():
+            devices = self._current_devices()
+            self._current_clients()
+            device = self.device_index.get(device_id)
+            if not device:
+                raise NotFoundError("Equipo no encontrado")
+            if device.status == DELIVERED:
+                raise ServiceError("El equipo ya fue entregado")
+            if device.status != READY:
+                raise ServiceError(f"El equipo todavía no está listo (estado: {device.status})")
+
+            client = self.client_index.get(device.client_id)
+            if not client:
+                raise NotFoundError("Cliente no encontrado")
+
+            # Actualizar estado del equipo
+            now = records.now()
+            delivered = device.with_status(DELIVERED, now, date_delivered=now,
+                                           factura_num=storage.get_next_factura_number(devices))
+            self._save_devices([delivered if d.id == device_id else d for d in devices], [delivered])
+            self.device_index.add(delivered)
+            self.client_device_index.add(delivered)
+            self.status_index.add(delivered)
+            self.filter_index.add(delivered)
+
+            # _current_turnaround suma la entrega: su factura es la más alta
+            self._current_turnaround()
+            self._save_turnaround()
+            return delivered, client
+
+    @metrics.timed('service.change_status')
+    def change_status(self, device_id, status):
+        """Pasa un equipo a otra etapa (ver records.TRANSITIONS) y lo devuelve.
+
+        El cambio queda en el historial del equipo con su fecha. Para
+        entregarlo se usa ``deliver_device``, que asigna la factura.
+        """
+        with self.lock, storage.write_lock():
+            devices = self._current_devices()
+            device = self.device_index.get(device_id)
+            if not device:
+                raise NotFoundError("Equipo no encontrado")
+            if status == device.status:
+                return device
+            if status == DELIVERED:
+                raise ServiceError("Para entregar el equipo use la entrega, que genera la factura")
+            if status not in STATUSES:
+                raise ServiceError(f"Estado inválido: {status}")
+            # Un estado desconocido (importado de otro sistema) puede pasar a cualquier etapa
+            if status not in TRANSITIONS.get(device.status, STATUSES):
+                raise ServiceError(f"No se puede pasar de {device.status} a {status}")
+
+            updated = device.with_status(status, records.now())
+            self._save_devices([updated if d.id == device_id else d for d in devices], [updated])
+            self.device_index.add(updated)
+            self.status_index.add(updated)
+            return updated
+
+    @metrics.timed('service.archive_delivered')
+    def archive_delivered(self, days=None, now=None):
+        """Pasa al archivo los equipos entregados hace más de ``days`` días.
+
+        Por defecto usa ``[Archivo] dias`` de settings.ini. Devuelve cuántos
+        equipos se archivaron.
+        """
+        if days is None:
+            days = archive.archive_after_days()
+        if days <= 0:
+            return 0
+        cutoff = (now or datetime.now()) - timedelta(days=days)
+
+        with self.lock, storage.write_lock():
+            devices = self._current_devices()
+            old, keep = archive.split_archivable(devices, cutoff)
+            if not old:
+                return 0
+
+            # Primero el archivo y después equipos.json: si algo falla en medio,
+            # el siguiente archivado reemplaza los registros ya copiados
+            self.archive.store(old,
+                               last_device_id=max(d.id for d in devices),
+                               last_factura_num=max(d.factura_num for d in devices))
+            # No es un borrado: cada sucursal archiva sus equipos entregados por su cuenta
+            self._save_devices(keep, deleted=[d.id for d in old], branch_log=False)
+            self._set_devices(keep)
+            return len(old)
+
+    @metrics.timed('service.apply_remote_changes')
+    def apply_remote_changes(self, clients=(), deleted_clients=(), devices=()):
+        """Guarda registros que llegaron de otra sucursal (ver sync).
+
+        No se anotan en el registro de la sucursal: ya están en el de su origen.
+        """
+        clients, devices = list(clients), list(devices)
+        deleted_clients = set(deleted_clients)
+        with self.lock, storage.write_lock():
+            if clients or deleted_clients:
+                merged = _merge_records(self._current_clients(), clients, deleted_clients,
+                                        self.client_index)
+                self._save_clients(merged, clients, deleted_clients, branch_log=False)
+                for client_id in deleted_clients:
+                    self.client_index.remove(client_id)
+                    self.client_prefix_index.remove(client_id)
+                self.client_index.add_many(clients)
+                self.client_prefix_index.add_many(clients)
+            if devices:
+                merged = _merge_records(self._current_devices(), devices, (), self.device_index)
+                self._save_devices(merged, devices, branch_log=False)
+                self.device_index.add_many(devices)
+                self.serial_index.add_many(devices)
+                self.client_device_index.add_many(devices)
+                self.status_index.add_many(devices)
+                self.filter_index.add_many(devices)
+                if any(d.status == DELIVERED for d in devices):
+                    # add_new suma las entregas de la otra sucursal por su bloque de facturas
+                    self._current_turnaround()
+                    self._save_turnaround()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Instantánea binaria de los registros e índices para arrancar sin releer los JSON.
+
+Al abrir, ``DataService`` lee clientes.json y equipos.json, valida cada
+registro y arma todos los índices; con muchos equipos eso tarda varios
+segundos. Al cerrar (y después de archivar) se guarda el estado ya armado
+en cache/arranque.pickle, y el siguiente arranque lo carga con una sola
+lectura.
+
+El archivo tiene dos partes en pickle: una cabecera chica y el estado. La
+cabecera guarda la versión del formato, la de Python, la firma de records,
+indexes y service (si se actualiza el programa la instantánea deja de
+servir) y la firma (inodo, mtime, tamaño) de cada archivo de datos tal
+como estaba en memoria. Solo se usan las partes cuyo archivo no cambió
+desde entonces; el resto se relee normalmente. Cualquier problema al leer
+la instantánea equivale a no tenerla.
+
+La carpeta cache/ queda fuera de database/: no entra en las copias de
+seguridad y se puede borrar en cualquier momento.
+"""
+
+import contextlib
+import gc
+import io
+import os
+import pickle
+import sys
+import tempfile
+
+import indexes
+import metrics
+import records
+import storage
+from storage import SNAPSHOT_FILE
+
+# Cambiarlo si cambia lo que se guarda en cada parte
+SNAPSHOT_VERSION = 2
+MAGIC = b'TALLER-ARRANQUE\n'
+
+
+def _code_signature(path):
+    """(mtime en ns, tamaño) de un archivo de código; el inodo cambia con cada copia"""
+    signature = storage.file_signature(path)
+    return signature and signature[1:]
+
+
+def code_signature(*paths):
+    """Firma del código que define los registros y los índices guardados.
+
+    ``paths`` son archivos de código que se suman a los de records e indexes.
+    """
+    return (SNAPSHOT_VERSION, sys.version_info[:2],
+            tuple(_code_signature(p) for p in (records.__file__, indexes.__file__) + paths))
+
+
+@metrics.timed('snapshot.save')
+def save(code, parts, path=SNAPSHOT_FILE):
+    """Guarda ``parts`` ({nombre: (firma del archivo de datos, estado)}) en ``path``.
+
+    Cada parte es un pickle aparte, así al cargar se saltean las que no
+    están al día. Se escribe en un temporal que luego se renombra, como los
+    JSON.
+    """
+    payloads = {name: pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+                for name, (_, state) in parts.items()}
+    header = {'code': code,
+              'parts': [(name, source, len(payloads[name])) for name, (source, _) in parts.items()]}
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for payload in payloads.values():
+                f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+@metrics.timed('snapshot.load')
+def load(code, sources, path=SNAPSHOT_FILE):
+    """Partes de la instantánea que siguen al día: {nombre: estado}.
+
+    ``sources`` tiene la firma actual de cada archivo de datos; una parte se
+    carga solo si su firma coincide con la guardada. Devuelve {} si no hay
+    instantánea o si es de otra versión del programa.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return {}
+    if not data.startswith(MAGIC):
+        return {}
+
+    view = memoryview(data)
+    loaded = {}
+    # Cientos de miles de objetos nuevos dispararían el recolector de ciclos una
+    # y otra vez sin nada que liberar
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        f = io.BytesIO(view[len(MAGIC):])
+        header = pickle.load(f)
+        if header.get('code') != code:
+            return {}
+        offset = len(MAGIC) + f.tell()
+        for name, source, length in header['parts']:
+            if source is not None and source == sources.get(name):
+                loaded[name] = pickle.loads(view[offset:offset + length])
+            offset += length
+    except Exception:
+        # Archivo truncado, de otra versión de las clases, etc.: se relee todo
+        return {}
+    finally:
+        if enabled:
+            gc.enable()
+    return loaded
+
+
+def discard(path=SNAPSHOT_FILE):
+    """Borra la instantánea, si existe"""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
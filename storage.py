@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Rutas y acceso a los archivos JSON de la base de datos.
+
+Este módulo no depende de PyQt5, de modo que la interfaz gráfica y el modo
+de línea de comandos comparten la misma lógica de datos.
+
+Varias instancias pueden usar la misma carpeta database/: los ciclos de
+leer-modificar-escribir se hacen dentro de ``write_lock()`` (bloqueo entre
+procesos) y cada archivo se escribe en un temporal que luego se renombra
+sobre el original. Como el renombrado es atómico, las lecturas no necesitan
+bloqueo: siempre ven el archivo anterior completo o el nuevo completo.
+"""
+
+import os
+import json
+import re
+import time
+import tempfile
+import threading
+import contextlib
+import configparser
+
+import metrics
+from records import Client, Device
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Configuración de directorios
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_DIR = os.path.join(BASE_DIR, "database")
+CLIENTS_FILE = os.path.join(DATABASE_DIR, "clientes.json")
+DEVICES_FILE = os.path.join(DATABASE_DIR, "equipos.json")
+IMAGES_DIR = os.path.join(DATABASE_DIR, "images")
+JOURNAL_FILE = os.path.join(DATABASE_DIR, "cambios.jsonl")
+TURNAROUND_FILE = os.path.join(DATABASE_DIR, "tiempos.json")
+ARCHIVE_DIR = os.path.join(DATABASE_DIR, "archivo")
+ARCHIVE_INDEX_FILE = os.path.join(ARCHIVE_DIR, "indice.json")
+SYNC_DIR = os.path.join(DATABASE_DIR, "sucursales")
+OUTPUT_DIR = os.path.join(BASE_DIR, "recibos")
+FACTURAS_DIR = os.path.join(BASE_DIR, "facturas")
+BACKUP_DIR = os.path.join(BASE_DIR, "backup")
+BACKUP_CATALOG_FILE = os.path.join(BACKUP_DIR, "catalogo.json")
+LOGS_DIR = os.path.join(BASE_DIR, "logs")
+METRICS_LOG = os.path.join(LOGS_DIR, "metricas.log")
+LOGO_PATH = os.path.join(BASE_DIR, "logo.png")
+SETTINGS_FILE = os.path.join(BASE_DIR, "settings.ini")
+LOCK_FILE = os.path.join(DATABASE_DIR, ".lock")
+# Instantánea de arranque (ver snapshot): se puede borrar, no es parte de los datos
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+SNAPSHOT_FILE = os.path.join(CACHE_DIR, "arranque.pickle")
+
+# Segundos que se espera el bloqueo de escritura antes de rendirse
+LOCK_TIMEOUT = 30
+
+# Crear directorios si no existen
+os.makedirs(DATABASE_DIR, exist_ok=True)
+os.makedirs(IMAGES_DIR, exist_ok=True)
+os.makedirs(ARCHIVE_DIR, exist_ok=True)
+os.makedirs(SYNC_DIR, exist_ok=True)
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(FACTURAS_DIR, exist_ok=True)
+os.makedirs(BACKUP_DIR, exist_ok=True)
+os.makedirs(LOGS_DIR, exist_ok=True)
+
+# Número de la primera factura cuando todavía no hay ninguna
+FIRST_FACTURA_NUMBER = 1001
+
+# IDs y facturas de cada sucursal: la sucursal n numera desde n * BRANCH_BLOCK
+# (ver sync); lo anterior a sincronizar queda en el bloque 0
+BRANCH_BLOCK = 10_000_000
+
+
+def load_settings():
+    """Lee settings.ini; si no existe devuelve una configuración vacía"""
+    settings = configparser.ConfigParser()
+    settings.read(SETTINGS_FILE, encoding='utf-8')
+    return settings
+
+
+def branch_number():
+    """Número de esta sucursal (``[Sucursal] numero``); 0 si no se sincroniza con otras"""
+    return max(load_settings().getint('Sucursal', 'numero', fallback=0), 0)
+
+
+def branch_of(number):
+    """Sucursal en cuyo bloque cae un ID o número de factura"""
+    return number // BRANCH_BLOCK
+
+
+class LockTimeout(OSError):
+    """Otra instancia mantiene el bloqueo de escritura demasiado tiempo"""
+
+
+class _DatabaseLock:
+    """Bloqueo de escritura entre procesos sobre LOCK_FILE.
+
+    Es reentrante dentro del proceso: el lock de hilos serializa a los hilos
+    propios y solo el primer nivel toma el bloqueo del sistema operativo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def _acquire_os_lock(self, timeout):
+        self._file = open(self.path, 'a+')
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                # Sin esperar: si otro proceso lo tiene se reintenta hasta el plazo
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    self._file.close()
+                    self._file = None
+                    raise LockTimeout("La base de datos está ocupada por otra terminal")
+                time.sleep(0.05)
+
+    def _release_os_lock(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    @contextlib.contextmanager
+    def hold(self, timeout=LOCK_TIMEOUT):
+        start = time.perf_counter()
+        with self._thread_lock:
+            if self._depth == 0:
+                self._acquire_os_lock(timeout)
+                metrics.record('storage.lock_wait', time.perf_counter() - start)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._release_os_lock()
+
+
+_database_lock = _DatabaseLock(LOCK_FILE)
+
+
+def write_lock(timeout=LOCK_TIMEOUT):
+    """Contexto que protege un ciclo leer-modificar-escribir entre procesos"""
+    return _database_lock.hold(timeout)
+
+
+@metrics.timed('storage.write_json')
+def write_json_atomic(path, data):
+    """Escribe ``data`` en un temporal del mismo directorio y lo renombra sobre ``path``.
+
+    Las listas se guardan con un registro por línea: sigue siendo legible y
+    cada registro se codifica con el codificador en C de json, que con
+    ``indent`` no se usa y es varias veces más lento en archivos grandes.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            if isinstance(data, list) and data:
+                f.write('[\n')
+                f.write(',\n'.join(json.dumps(item) for item in data))
+                f.write('\n]\n')
+            else:
+                # json.dump escribe por partes con el codificador en Python; dumps usa el de C
+                f.write(json.dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp crea el archivo solo legible por el dueño; conservar los permisos del original
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def is_temporary_file(filename):
+    """Archivos auxiliares de database/ que no forman parte de los datos"""
+    return (filename in (os.path.basename(LOCK_FILE), os.path.basename(JOURNAL_FILE))
+            or filename.endswith('.tmp'))
+
+
+def initialize_json_files():
+    """Crea los archivos JSON si no existen con estructura inicial"""
+    with write_lock():
+        if not os.path.exists(CLIENTS_FILE):
+            write_json_atomic(CLIENTS_FILE, [])
+
+        if not os.path.exists(DEVICES_FILE):
+            write_json_atomic(DEVICES_FILE, [])
+
+
+@metrics.timed('storage.load_clients')
+def load_clients():
+    """Carga los clientes desde el archivo JSON, validados como ``Client``"""
+    return [Client.from_dict(c) for c in iter_json_list(CLIENTS_FILE)]
+
+
+@metrics.timed('storage.load_devices')
+def load_devices():
+    """Carga los equipos desde el archivo JSON, validados como ``Device``"""
+    return list(iter_devices())
+
+
+# Caracteres que se leen por vez al recorrer un archivo sin cargarlo entero
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_SKIP_RE = re.compile(r'[\s,]*')
+
+
+def iter_json_list(path, chunk_size=STREAM_CHUNK_SIZE):
+    """Objetos del arreglo JSON de ``path`` de a uno, leyendo el archivo por partes.
+
+    La memoria usada es la de un bloque más un registro, sin importar el
+    tamaño del archivo. Los elementos que no son objetos se descartan. Si el
+    archivo no es un arreglo no se devuelve nada; si se corta a la mitad
+    (editado a mano), se devuelven los registros anteriores al error.
+    """
+    try:
+        f = open(path, 'r')
+    except FileNotFoundError:
+        return
+    with f:
+        buffer = ''
+        while not buffer:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer = chunk.lstrip()
+        if not buffer.startswith('['):
+            return
+        pos = 1
+        eof = False
+        while True:
+            pos = _SKIP_RE.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    return
+                # El registro sigue en el próximo bloque
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            if end == len(buffer) and not eof:
+                # Un número al final del bloque podría estar cortado
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                if chunk:
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    continue
+            pos = end
+            if isinstance(item, dict):
+                yield item
+
+
+def iter_devices(filter=None, path=DEVICES_FILE):
+    """Equipos de ``path`` (equipos.json o una partición) validados, de a uno.
+
+    Con ``filter`` solo se devuelven los equipos para los que devuelve True.
+    Sirve para reportes y exportaciones que necesitan una parte del historial
+    sin cargar el archivo completo en memoria.
+    """
+    for data in iter_json_list(path):
+        device = Device.from_dict(data)
+        if filter is None or filter(device):
+            yield device
+
+
+def file_signature(path):
+    """(inodo, mtime en ns, tamaño) de un archivo, o None si no existe.
+
+    Cada escritura atómica crea un archivo nuevo, así que el inodo cambia
+    aunque dos escrituras caigan en el mismo instante con el mismo tamaño.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def save_clients(clients):
+    """Guarda la lista completa de clientes (llamar dentro de ``write_lock()``)"""
+    write_json_atomic(CLIENTS_FILE, [c.to_dict() for c in clients])
+
+
+def save_devices(devices):
+    """Guarda la lista completa de equipos (llamar dentro de ``write_lock()``)"""
+    write_json_atomic(DEVICES_FILE, [d.to_dict() for d in devices])
+
+
+def archive_partition_path(year):
+    """Archivo de equipos archivados recibidos en ``year``"""
+    return os.path.join(ARCHIVE_DIR, f"equipos_{year}.json")
+
+
+@metrics.timed('storage.load_archive_partition')
+def load_archive_partition(year):
+    """Equipos archivados de un año, con estructura validada"""
+    return list(iter_devices(path=archive_partition_path(year)))
+
+
+def save_archive_partition(year, devices):
+    """Guarda una partición del archivo (llamar dentro de ``write_lock()``)"""
+    write_json_atomic(archive_partition_path(year), [d.to_dict() for d in devices])
+
+
+def load_archive_index():
+    """Resumen del archivo: años guardados y los últimos ID y factura archivados.
+
+    ``years`` es {"2023": {"count": n, "min_id": a, "max_id": b,
+    "last_delivered": "AAAA-MM-DD hh:mm:ss"}, ...}. ``branches`` guarda lo mismo
+    que ``last_device_id``/``last_factura_num`` para cada bloque de sucursal.
+    """
+    index = {'last_device_id': 0, 'last_factura_num': 0, 'years': {}, 'branches': {}}
+    try:
+        with open(ARCHIVE_INDEX_FILE, 'r') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            index.update(data)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return index
+
+
+def save_archive_index(index):
+    """Guarda el resumen del archivo (llamar dentro de ``write_lock()``)"""
+    write_json_atomic(ARCHIVE_INDEX_FILE, index)
+
+
+def load_turnaround():
+    """Histogramas de tiempos de reparación (ver turnaround), o None si no existen"""
+    try:
+        with open(TURNAROUND_FILE, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def save_turnaround(data):
+    """Guarda los histogramas de tiempos (llamar dentro de ``write_lock()``)"""
+    write_json_atomic(TURNAROUND_FILE, data)
+
+
+def load_backup_catalog():
+    """Copias de seguridad hechas (ver backups), de la más antigua a la más reciente"""
+    try:
+        with open(BACKUP_CATALOG_FILE, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    return [entry for entry in data if isinstance(entry, dict)] if isinstance(data, list) else []
+
+
+def save_backup_catalog(entries):
+    """Guarda el catálogo de copias (llamar dentro de ``write_lock()``)"""
+    write_json_atomic(BACKUP_CATALOG_FILE, entries)
+
+
+def _last_number(numbers, branch):
+    """El más alto de ``numbers``; con ``branch`` solo cuentan los de su bloque"""
+    if not branch:
+        return max(numbers, default=0)
+    low = branch * BRANCH_BLOCK
+    return max((n for n in numbers if low <= n < low + BRANCH_BLOCK), default=0)
+
+
+def _archived_last(field, branch):
+    """Último ID o factura archivados (de la sucursal ``branch`` si hay sucursales)"""
+    index = load_archive_index()
+    if not branch:
+        return index[field]
+    return index['branches'].get(str(branch), {}).get(field, 0)
+
+
+def get_next_client_id(clients):
+    """Próximo ID de cliente (dentro del bloque de la sucursal, si hay)"""
+    branch = branch_number()
+    return max(_last_number((c.id for c in clients), branch), branch * BRANCH_BLOCK) + 1
+
+
+def get_next_device_id(devices):
+    """Próximo ID de equipo; tiene en cuenta los equipos ya archivados"""
+    branch = branch_number()
+    last_id = max(_last_number((d.id for d in devices), branch),
+                  _archived_last('last_device_id', branch))
+    return max(last_id, branch * BRANCH_BLOCK) + 1
+
+
+def get_next_factura_number(devices=None):
+    """Obtiene el próximo número de factura"""
+    if devices is None:
+        devices = iter_devices()
+
+    # Buscar el último número de factura usado, también entre los archivados
+    branch = branch_number()
+    last_num = max(_last_number((d.factura_num for d in devices), branch),
+                   _archived_last('last_factura_num', branch))
+
+    # Si no hay facturas previas, empezar desde un número base
+    if last_num == 0:
+        return branch * BRANCH_BLOCK + FIRST_FACTURA_NUMBER
+
+    return last_num + 1
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Sincronización entre sucursales con registros de cambios incrementales.
+
+Cada sucursal tiene un número (``[Sucursal] numero`` en settings.ini) y
+numera clientes, equipos y facturas dentro de su propio bloque (ver
+storage.BRANCH_BLOCK), así dos sucursales nunca usan el mismo ID ni la
+misma factura. Todas parten de una copia de la misma carpeta database/.
+
+Cada guardado propio agrega a database/sucursales/sucursal_<n>.jsonl una
+entrada por registro con un número de secuencia (1, 2, 3...) y una marca
+de Lamport. Las entradas que llegan de otras sucursales se guardan en el
+registro de su origen, de modo que cada sucursal puede reenviar los cambios
+de las demás. El vector "tiene" ({sucursal: última secuencia}) dice hasta
+dónde llegó cada registro: un paquete lleva solo las entradas que el
+destino todavía no tiene, así el costo depende de lo que cambió y no del
+tamaño de la base.
+
+Al recibir, gana la versión con la marca de Lamport más alta (a igual
+marca, la sucursal de número mayor), así todas llegan al mismo resultado
+sin importar el orden. El saldo de los clientes no se copia: cada equipo
+nuevo que llega suma su saldo, igual que al recibirlo en el mostrador. Las
+fotos de los equipos quedan en la sucursal que las tomó.
+"""
+
+import json
+import os
+import re
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+import storage
+from records import Client, Device, ZERO
+from storage import SYNC_DIR
+
+STATE_FILE = os.path.join(SYNC_DIR, "estado.json")
+VERSIONS_FILE = os.path.join(SYNC_DIR, "versiones.json")
+LOG_NAME_RE = re.compile(r'sucursal_(\d+)\.jsonl$')
+
+# Bytes que se leen por vez desde el final al buscar la última entrada
+TAIL_BLOCK = 8192
+EXCHANGE_TIMEOUT = 120
+
+KINDS = {'clientes': Client, 'equipos': Device}
+
+
+class SyncError(Exception):
+    """No se puede sincronizar: sin número de sucursal o con un paquete incompleto"""
+
+
+def log_path(origin):
+    return os.path.join(SYNC_DIR, f"sucursal_{origin}.jsonl")
+
+
+class BranchLog:
+    """Registro de cambios de una sucursal: una entrada JSON por línea y ``seq`` creciente"""
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.path = log_path(origin)
+
+    def _tail(self, f):
+        """(última entrada completa o None, bytes hasta el final de esa entrada)"""
+        pos = end = f.seek(0, os.SEEK_END)
+        tail = b''
+        while pos > 0:
+            step = min(TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            # Una línea sin su salto quedó a medio escribir y no cuenta
+            complete = tail[:tail.rfind(b'\n') + 1]
+            start = complete.rfind(b'\n', 0, len(complete) - 1)
+            if complete and (start >= 0 or pos == 0):
+                return json.loads(complete[start + 1:]), end - len(tail) + len(complete)
+        return None, 0
+
+    def last(self):
+        """Última entrada escrita, o None si el registro está vacío"""
+        try:
+            with open(self.path, 'rb') as f:
+                return self._tail(f)[0]
+        except FileNotFoundError:
+            return None
+
+    def last_seq(self):
+        entry = self.last()
+        return entry['seq'] if entry else 0
+
+    def append(self, entries):
+        """Agrega entradas al final (llamar dentro de ``storage.write_lock()``)"""
+        data = ''.join(json.dumps(entry) + '\n' for entry in entries).encode('utf-8')
+        with open(self.path, 'ab+') as f:
+            _, end = self._tail(f)
+            if f.seek(0, os.SEEK_END) != end:
+                # Restos de una escritura cortada (un corte de luz)
+                f.truncate(end)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read_after(self, seq):
+        """Entradas con secuencia mayor que ``seq``.
+
+        El punto de partida se busca por bisección sobre el archivo, así que
+        leer lo nuevo no obliga a recorrer todo el historial.
+        """
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return []
+        with f:
+            def first_seq_from(offset):
+                # Secuencia de la primera línea que empieza en ``offset`` o después
+                if offset:
+                    f.seek(offset - 1)
+                    f.readline()
+                else:
+                    f.seek(0)
+                start = f.tell()
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    return None, start
+                return json.loads(line)['seq'], start
+
+            low, high = 0, f.seek(0, os.SEEK_END)
+            while low < high:
+                middle = (low + high) // 2
+                found, _ = first_seq_from(middle)
+                if found is None or found > seq:
+                    high = middle
+                else:
+                    low = middle + 1
+            _, start = first_seq_from(low)
+            f.seek(start)
+            entries = []
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                entry = json.loads(line)
+                if entry['seq'] > seq:
+                    entries.append(entry)
+            return entries
+
+    def record(self, kind, upserts=(), deleted=()):
+        """Anota cambios propios con la próxima marca de Lamport (dentro de ``write_lock()``)"""
+        upserts = list(upserts)
+        if not upserts and not deleted:
+            return
+        last = self.last() or {'seq': 0, 'ts': 0}
+        seq = last['seq']
+        clock = max(last['ts'], load_state()['lamport']) + 1
+        entries = []
+        for record in upserts:
+            seq += 1
+            entries.append({'seq': seq, 'ts': clock, 'o': self.origin, 't': kind,
+                            'id': record.id, 'r': record.to_dict()})
+        for record_id in deleted:
+            seq += 1
+            entries.append({'seq': seq, 'ts': clock, 'o': self.origin, 't': kind,
+                            'id': record_id, 'borrado': True})
+        self.append(entries)
+
+
+def local_log():
+    """Registro de la sucursal configurada, o None si no hay ``[Sucursal] numero``"""
+    branch = storage.branch_number()
+    return BranchLog(branch) if branch else None
+
+
+def have_vector():
+    """{sucursal: última secuencia guardada} de todos los registros presentes"""
+    have = {}
+    for name in os.listdir(SYNC_DIR):
+        match = LOG_NAME_RE.match(name)
+        if match:
+            origin = int(match.group(1))
+            have[origin] = BranchLog(origin).last_seq()
+    return have
+
+
+def _load_json(path, default):
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+    return data if isinstance(data, dict) else default
+
+
+def load_state():
+    """Reloj de Lamport y último vector "tiene" conocido de cada sucursal"""
+    state = {'lamport': 0, 'peers': {}}
+    state.update(_load_json(STATE_FILE, {}))
+    return state
+
+
+def _vector(data):
+    """Vector "tiene" con claves enteras (en JSON viajan como texto)"""
+    return {int(origin): int(seq) for origin, seq in (data or {}).items()}
+
+
+class SyncResult:
+    """Resumen de un paquete recibido"""
+
+    __slots__ = ('received', 'applied', 'superseded', 'skipped')
+
+    def __init__(self):
+        self.received = 0      # entradas nuevas guardadas en los registros
+        self.applied = 0       # registros que cambiaron en esta sucursal
+        self.superseded = 0    # entradas que perdieron ante una versión más nueva
+        self.skipped = 0       # clientes no borrados porque aquí tienen equipos
+
+    def summary(self):
+        text = (f"{self.received} cambios recibidos, {self.applied} registros actualizados, "
+                f"{self.superseded} reemplazados por versiones más nuevas")
+        if self.skipped:
+            text += f", {self.skipped} clientes no borrados porque tienen equipos"
+        return text
+
+
+class Synchronizer:
+    """Arma y aplica paquetes de cambios sobre un ``DataService`` local"""
+
+    def __init__(self, service):
+        if service.sync_log is None:
+            raise SyncError("Configure [Sucursal] numero en settings.ini para sincronizar")
+        self.service = service
+        self.branch = service.sync_log.origin
+
+    def status(self):
+        with self.service.lock, storage.write_lock():
+            return {'sucursal': self.branch, 'tiene': have_vector()}
+
+    def bundle(self, peer_has=None):
+        """Paquete con las entradas de todos los registros que faltan según ``peer_has``.
+
+        Sin ``peer_has`` lleva todo el historial.
+        """
+        peer_has = _vector(peer_has)
+        with self.service.lock, storage.write_lock():
+            have = have_vector()
+            entries = []
+            for origin in sorted(have):
+                if have[origin] > peer_has.get(origin, 0):
+                    entries.extend(BranchLog(origin).read_after(peer_has.get(origin, 0)))
+            return {'sucursal': self.branch, 'tiene': have, 'cambios': entries}
+
+    def bundle_for(self, peer):
+        """Paquete para la sucursal ``peer`` según lo último que se supo de ella"""
+        return self.bundle(load_state()['peers'].get(str(peer)))
+
+    def apply(self, bundle):
+        """Guarda y aplica un paquete de otra sucursal; devuelve un ``SyncResult``"""
+        result = SyncResult()
+        service = self.service
+        with service.lock, storage.write_lock():
+            # get_client/get_device responden desde los índices: primero ponerlos al día
+            service.refresh()
+            have = have_vector()
+            fresh = self._fresh_entries(bundle.get('cambios', ()), have)
+            versions = self._current_versions(have)
+
+            # Gana la versión más nueva; el orden de llegada no cambia el resultado
+            winners = {}
+            for entry in sorted(fresh, key=lambda e: (e['ts'], e['o'], e['seq'])):
+                key = f"{entry['t']}:{entry['id']}"
+                version = [entry['ts'], entry['o']]
+                if key not in versions['v'] or version > versions['v'][key]:
+                    versions['v'][key] = version
+                    winners[key] = entry
+                else:
+                    result.superseded += 1
+
+            clients, deleted_clients, devices = self._records(winners.values(), result)
+            service.apply_remote_changes(clients, deleted_clients, devices)
+            result.applied = len(clients) + len(deleted_clients) + len(devices)
+
+            by_origin = {}
+            for entry in fresh:
+                by_origin.setdefault(entry['o'], []).append(entry)
+            for origin, entries in by_origin.items():
+                BranchLog(origin).append(entries)
+                versions['hasta'][str(origin)] = entries[-1]['seq']
+            result.received = len(fresh)
+            storage.write_json_atomic(VERSIONS_FILE, versions)
+
+            state = load_state()
+            state['lamport'] = max([state['lamport']] + [e['ts'] for e in fresh])
+            sender = bundle.get('sucursal')
+            if sender is not None:
+                known = _vector(state['peers'].get(str(sender)))
+                for origin, seq in _vector(bundle.get('tiene')).items():
+                    known[origin] = max(known.get(origin, 0), seq)
+                state['peers'][str(sender)] = {str(o): s for o, s in sorted(known.items())}
+            storage.write_json_atomic(STATE_FILE, state)
+        return result
+
+    @staticmethod
+    def _fresh_entries(entries, have):
+        """Entradas que todavía no están en los registros locales, en orden por origen"""
+        expected = {origin: seq + 1 for origin, seq in have.items()}
+        fresh = []
+        for entry in sorted(entries, key=lambda e: (e['o'], e['seq'])):
+            origin = entry['o']
+            if entry.get('t') not in KINDS:
+                raise SyncError(f"Entrada desconocida de la sucursal {origin}: {entry.get('t')}")
+            following = expected.get(origin, 1)
+            if entry['seq'] < following:
+                continue
+            if entry['seq'] > following:
+                raise SyncError(f"Al paquete le faltan los cambios {following} a {entry['seq'] - 1} "
+                                f"de la sucursal {origin}")
+            fresh.append(entry)
+            expected[origin] = following + 1
+        return fresh
+
+    @staticmethod
+    def _current_versions(have):
+        """Versión (marca, sucursal) de cada registro cambiado desde que se sincroniza.
+
+        versiones.json se pone al día solo con las entradas escritas desde la
+        sincronización anterior (en la práctica, los cambios propios).
+        """
+        versions = _load_json(VERSIONS_FILE, {})
+        versions.setdefault('hasta', {})
+        versions.setdefault('v', {})
+        for origin, seq in have.items():
+            folded = versions['hasta'].get(str(origin), 0)
+            if seq > folded:
+                for entry in BranchLog(origin).read_after(folded):
+                    key = f"{entry['t']}:{entry['id']}"
+                    version = [entry['ts'], entry['o']]
+                    if version > versions['v'].get(key, [0, 0]):
+                        versions['v'][key] = version
+                versions['hasta'][str(origin)] = seq
+        return versions
+
+    def _records(self, entries, result):
+        """(clientes, IDs de clientes borrados, equipos) a guardar para las entradas ganadoras"""
+        service = self.service
+        clients, deleted_clients, devices = {}, set(), {}
+        for entry in entries:
+            if entry['t'] == 'clientes':
+                if entry.get('borrado'):
+                    deleted_clients.add(entry['id'])
+                else:
+                    clients[entry['id']] = Client.from_dict(entry['r'])
+            elif not entry.get('borrado'):
+                # Los equipos no se borran: solo salen de equipos.json hacia el archivo
+                devices[entry['id']] = Device.from_dict(entry['r'])
+
+        balances = {}
+        for device_id, device in devices.items():
+            local = service.get_device(device_id)
+            if local is None:
+                balances[device.client_id] = balances.get(device.client_id, ZERO) + device.balance
+            # Las rutas de las fotos son de la otra sucursal
+            devices[device_id] = device.replace(images=local.images if local else ())
+
+        for client_id, client in clients.items():
+            local = service.get_client(client_id)
+            clients[client_id] = client.replace(balance=local.balance if local else ZERO)
+        for client_id, amount in balances.items():
+            client = clients.get(client_id) or service.get_client(client_id)
+            if client is not None:
+                clients[client_id] = client.replace(balance=client.balance + amount)
+
+        for client_id in list(deleted_clients):
+            if client_id in balances or service.client_has_devices(client_id):
+                deleted_clients.discard(client_id)
+                result.skipped += 1
+            else:
+                clients.pop(client_id, None)
+        return list(clients.values()), deleted_clients, list(devices.values())
+
+
+def write_bundle(bundle, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f)
+
+
+def read_bundle(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            bundle = json.load(f)
+    except json.JSONDecodeError as e:
+        raise SyncError(f"El paquete no es JSON válido: {e}")
+    if not isinstance(bundle, dict) or 'cambios' not in bundle:
+        raise SyncError("El archivo no es un paquete de sincronización")
+    return bundle
+
+
+def _call(base_url, payload=None, timeout=EXCHANGE_TIMEOUT):
+    data = None if payload is None else json.dumps(payload).encode('utf-8')
+    request = Request(f"{base_url.rstrip('/')}/api/sync", data=data,
+                      headers={'Content-Type': 'application/json'} if data else {},
+                      method='GET' if data is None else 'POST')
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except HTTPError as e:
+        try:
+            message = json.loads(e.read().decode('utf-8')).get('error', str(e))
+        except ValueError:
+            message = str(e)
+        raise SyncError(f"La otra sucursal respondió: {message}")
+    except (URLError, OSError) as e:
+        raise SyncError(f"No se pudo conectar con {base_url}: {e}")
+
+
+def exchange(synchronizer, base_url, timeout=EXCHANGE_TIMEOUT):
+    """Sincroniza con el servidor de otra sucursal (``taller3.py serve``).
+
+    Primero se pregunta qué tiene, se le manda solo lo que le falta y se
+    aplica lo que devuelve. Devuelve (resultado local, resumen del otro lado).
+    """
+    remote = _call(base_url, timeout=timeout)
+    reply = _call(base_url, synchronizer.bundle(remote.get('tiene')), timeout)
+    return synchronizer.apply(reply), reply.get('resultado', '')
@@ -2,44 +2,43 @@
 # -*- coding: utf-8 -*-
 
 import sys
+
+# Modo de línea de comandos (p. ej. "python taller3.py report --range mensual"):
+# se atiende antes de importar PyQt5 para poder usarlo sin pantalla.
+if __name__ == "__main__" and len(sys.argv) > 1:
+    from cli import main
+    sys.exit(main(sys.argv[1:]))
+
 import os
-import json
-import shutil
 import subprocess
 import smtplib
-import zipfile
+import html
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
-from datetime import datetime, timedelta
-from fpdf import FPDF
-import qrcode
+from datetime import datetime
 import webbrowser
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QLineEdit, QTextEdit, QComboBox, 
                              QTableWidget, QTableWidgetItem, QTabWidget, QMessageBox,
                              QFileDialog, QDialog, QFormLayout, QDoubleSpinBox, QGridLayout,
-                             QScrollArea, QDateEdit, QGroupBox)
-from PyQt5.QtCore import Qt, QSize, QDate
+                             QScrollArea, QDateEdit, QGroupBox, QSpinBox, QHeaderView, QListWidget,
+                             QListWidgetItem)
+from PyQt5.QtCore import Qt, QSize, QDate, QTimer, QFileSystemWatcher, pyqtSignal
 from PyQt5.QtGui import QIcon, QPixmap, QImageReader
-
-# Configuración de directorios
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE_DIR = os.path.join(BASE_DIR, "database")
-CLIENTS_FILE = os.path.join(DATABASE_DIR, "clientes.json")
-DEVICES_FILE = os.path.join(DATABASE_DIR, "equipos.json")
-IMAGES_DIR = os.path.join(DATABASE_DIR, "images")
-OUTPUT_DIR = os.path.join(BASE_DIR, "recibos")
-FACTURAS_DIR = os.path.join(BASE_DIR, "facturas")
-BACKUP_DIR = os.path.join(BASE_DIR, "backup")
-LOGO_PATH = os.path.join(BASE_DIR, "logo.png")
-
-# Crear directorios si no existen
-os.makedirs(DATABASE_DIR, exist_ok=True)
-os.makedirs(IMAGES_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(FACTURAS_DIR, exist_ok=True)
-os.makedirs(BACKUP_DIR, exist_ok=True)
+import storage
+import documents
+import backups
+import importer
+import metrics
+import photos
+import reports
+import thermal
+from service import DataService, ServiceError, CLIENT_PICKER_LIMIT, MAX_DEVICE_IMAGES
+from remote import RemoteService
+from queries import DeviceFilter
+from records import ZERO, STATUSES, TRANSITIONS, READY, DELIVERED
+from storage import BACKUP_DIR, LOGO_PATH, LOGS_DIR, METRICS_LOG, JOURNAL_FILE
 
 # Configuración de email
 EMAIL_CONFIG = {
@@ -49,16 +48,18 @@ EMAIL_CONFIG = {
     'password': 'tucontraseña'
 }
 
-class PDF(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 12)
-        self.cell(0, 10, 'CONTROL DE REPARACIONES', 0, 1, 'C')
-        self.ln(5)
-    
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
+# Espera tras el último cambio en database/ antes de refrescar las ventanas
+CHANGE_DEBOUNCE_MS = 250
+
+# Equipos que muestra cada columna del tablero (los más recientes); el título tiene el total
+BOARD_COLUMN_LIMIT = 200
+
+def create_service():
+    """Servicio de datos: el servidor de settings.ini si hay uno, si no la base local"""
+    url = storage.load_settings().get('Servidor', 'url', fallback='').strip()
+    if url:
+        return RemoteService(url)
+    return DataService()
 
 class AboutDialog(QDialog):
     def __init__(self):
@@ -102,7 +103,361 @@ class ImagePreviewDialog(QDialog):
         main_layout = QVBoxLayout(self)
         main_layout.addWidget(scroll)
 
+class ImportDialog(QDialog):
+    """Importa clientes o equipos desde CSV/XLSX eligiendo qué columna va a cada campo"""
+    def __init__(self, service, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self.headers = []
+        self.column_combos = {}
+        self.setWindowTitle("Importar Datos")
+        self.setWindowIcon(QIcon(LOGO_PATH))
+        self.setMinimumSize(520, 600)
+        
+        layout = QVBoxLayout(self)
+        
+        file_layout = QHBoxLayout()
+        self.file_input = QLineEdit()
+        self.file_input.setReadOnly(True)
+        self.file_input.setPlaceholderText("Archivo CSV o XLSX con encabezados")
+        browse_btn = QPushButton("Examinar...")
+        browse_btn.clicked.connect(self.choose_file)
+        file_layout.addWidget(self.file_input)
+        file_layout.addWidget(browse_btn)
+        layout.addLayout(file_layout)
+        
+        self.kind_combo = QComboBox()
+        self.kind_combo.addItem("Clientes", 'clientes')
+        self.kind_combo.addItem("Equipos", 'equipos')
+        self.kind_combo.currentIndexChanged.connect(self.update_columns)
+        layout.addWidget(self.kind_combo)
+        
+        self.columns_group = QGroupBox("Columnas del archivo")
+        self.columns_layout = QFormLayout(self.columns_group)
+        layout.addWidget(self.columns_group)
+        
+        self.import_btn = QPushButton("Importar")
+        self.import_btn.setEnabled(False)
+        self.import_btn.clicked.connect(self.run_import)
+        layout.addWidget(self.import_btn)
+        
+        self.result_text = QTextEdit()
+        self.result_text.setReadOnly(True)
+        layout.addWidget(self.result_text)
+    
+    def choose_file(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Seleccionar archivo", "", "Hojas de cálculo (*.csv *.xlsx);;Todos (*)")
+        if not path:
+            return
+        try:
+            self.headers = [h for h in importer.read_headers(path) if h]
+        except (ServiceError, OSError) as e:
+            QMessageBox.warning(self, "Advertencia", str(e))
+            return
+        self.file_input.setText(path)
+        self.update_columns()
+    
+    def update_columns(self):
+        while self.columns_layout.rowCount():
+            self.columns_layout.removeRow(0)
+        self.column_combos = {}
+        kind = self.kind_combo.currentData()
+        columns, required = importer.IMPORT_KINDS[kind]
+        guessed = importer.guess_mapping(self.headers, kind)
+        for field in columns:
+            combo = QComboBox()
+            combo.addItem("(no importar)", "")
+            for header in self.headers:
+                combo.addItem(header, header)
+            combo.setCurrentIndex(max(0, combo.findData(guessed.get(field, ""))))
+            label = importer.FIELD_LABELS[field] + (" *" if field in required else "")
+            self.columns_layout.addRow(label, combo)
+            self.column_combos[field] = combo
+        self.import_btn.setEnabled(bool(self.headers))
+    
+    def run_import(self):
+        mapping = {field: combo.currentData() for field, combo in self.column_combos.items()}
+        self.import_btn.setEnabled(False)
+        self.result_text.setPlainText("Importando...")
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        
+        def progress(rows):
+            self.result_text.setPlainText(f"Importando... {rows} filas")
+            QApplication.processEvents()
+        
+        try:
+            result = importer.import_file(self.service, self.file_input.text(),
+                                          self.kind_combo.currentData(), mapping, progress=progress)
+        except ServiceError as e:
+            self.result_text.setPlainText(str(e))
+        except Exception as e:
+            self.result_text.setPlainText(f"No se pudo importar: {str(e)}")
+        else:
+            lines = [result.summary()]
+            if result.errors:
+                lines.append("")
+                lines.extend(f"Fila {line}: {message}" for line, message in result.errors)
+            self.result_text.setPlainText("\n".join(lines))
+        finally:
+            QApplication.restoreOverrideCursor()
+            self.import_btn.setEnabled(True)
+
+class BackupCatalogDialog(QDialog):
+    """Copias de seguridad hechas: fecha, tamaño, duración y si pasaron la verificación"""
+    COLUMNS = ("Fecha", "Motivo", "Archivo", "Tamaño (MB)", "Archivos", "Duración (s)", "Verificación")
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Historial de Backups")
+        self.setWindowIcon(QIcon(LOGO_PATH))
+        self.resize(820, 420)
+        
+        layout = QVBoxLayout(self)
+        table = QTableWidget(0, len(self.COLUMNS))
+        table.setHorizontalHeaderLabels(self.COLUMNS)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        # Las más recientes primero
+        for entry in reversed(storage.load_backup_catalog()):
+            row = table.rowCount()
+            table.insertRow(row)
+            verified = entry.get('verificado')
+            values = (entry.get('fecha', ''), entry.get('motivo', ''), entry.get('archivo', ''),
+                      f"{entry.get('bytes', 0) / 1024 / 1024:.1f}" if verified else "",
+                      str(entry.get('archivos', '')) if verified else "",
+                      f"{entry.get('segundos', 0):.1f}",
+                      "Correcta" if verified else f"Error: {entry.get('error', '')}")
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(value))
+        layout.addWidget(table)
+        
+        close_btn = QPushButton("Cerrar")
+        close_btn.clicked.connect(self.accept)
+        layout.addWidget(close_btn)
+
+
+class DiagnosticsDialog(QDialog):
+    """Tiempos de cada operación medida y captura de perfil de las próximas acciones"""
+    COLUMNS = ("Operación", "Veces", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Máx (ms)", "Total (s)")
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnóstico")
+        self.setWindowIcon(QIcon(LOGO_PATH))
+        self.resize(760, 500)
+        
+        layout = QVBoxLayout(self)
+        
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setSortingEnabled(True)
+        layout.addWidget(self.table)
+        
+        profile_group = QGroupBox("Perfil (cProfile)")
+        profile_layout = QHBoxLayout(profile_group)
+        profile_layout.addWidget(QLabel("Próximas acciones:"))
+        self.profile_actions = QSpinBox()
+        self.profile_actions.setRange(1, 100)
+        self.profile_actions.setValue(5)
+        profile_layout.addWidget(self.profile_actions)
+        profile_btn = QPushButton("Perfilar")
+        profile_btn.clicked.connect(self.start_profile)
+        profile_layout.addWidget(profile_btn)
+        self.profile_status = QLabel()
+        self.profile_status.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        profile_layout.addWidget(self.profile_status, 1)
+        layout.addWidget(profile_group)
+        
+        buttons = QHBoxLayout()
+        log_label = QLabel(f"Registro: {METRICS_LOG}")
+        log_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        buttons.addWidget(log_label, 1)
+        reset_btn = QPushButton("Reiniciar")
+        reset_btn.clicked.connect(self.reset)
+        buttons.addWidget(reset_btn)
+        close_btn = QPushButton("Cerrar")
+        close_btn.clicked.connect(self.close)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+        
+        self.profile_path = None
+        self.refresh()
+        # Mientras está abierto se sigue actualizando con lo que se hace en la ventana principal
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+    
+    def refresh(self):
+        stats = metrics.snapshot()
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(stats))
+        for row, (name, summary) in enumerate(sorted(stats.items())):
+            values = (summary['count'], summary['p50'] * 1000, summary['p95'] * 1000,
+                      summary['p99'] * 1000, summary['max'] * 1000, summary['total'])
+            self.table.setItem(row, 0, QTableWidgetItem(name))
+            for column, value in enumerate(values, start=1):
+                item = QTableWidgetItem()
+                # Guardar el número (no el texto) para que la columna ordene bien
+                item.setData(Qt.DisplayRole, value if column == 1 else round(value, 2))
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+        
+        remaining = metrics.profiling()
+        if remaining:
+            self.profile_status.setText(f"Perfilando... faltan {remaining} acciones")
+        elif self.profile_path and os.path.exists(self.profile_path):
+            self.profile_status.setText(f"Perfil guardado en {self.profile_path}.txt")
+    
+    def start_profile(self):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.profile_path = os.path.join(LOGS_DIR, f"perfil_{timestamp}.prof")
+        metrics.profile_next(self.profile_actions.value(), self.profile_path)
+        self.refresh()
+    
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+class ClientHistoryDialog(QDialog):
+    """Todos los equipos y facturas de un cliente, con su saldo y el estado de cuenta en PDF"""
+    COLUMNS = ("ID", "Recibido", "Equipo", "N° Serie", "Estado", "Costo", "Anticipo", "Saldo",
+               "Factura", "Entregado")
+    
+    def __init__(self, service, client, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self.client = client
+        self.setWindowTitle(f"Historial de {client.name}")
+        self.setWindowIcon(QIcon(LOGO_PATH))
+        self.resize(900, 500)
+        
+        # Los equipos salen del índice por cliente, también los archivados
+        self.devices = service.client_devices(client.id)
+        delivered = [d for d in self.devices if d.status == DELIVERED]
+        open_balance = sum((d.balance for d in self.devices if d.status != DELIVERED), ZERO)
+        
+        layout = QVBoxLayout(self)
+        info = QLabel(f"<b>{html.escape(client.name)}</b> (N° {client.id})<br>"
+                      f"Teléfono: {html.escape(client.phone)} - Email: {html.escape(client.email)}"
+                      f" - NIT/CI: {html.escape(client.nit)}<br>"
+                      f"Equipos: {len(self.devices)} - Facturas: {len(delivered)}"
+                      f" - Total facturado: ${sum((d.cost for d in delivered), ZERO):.2f}"
+                      f" - <b>Saldo pendiente: ${open_balance:.2f}</b>")
+        info.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(info)
+        
+        self.table = QTableWidget(len(self.devices), len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        # Los más recientes arriba
+        for row, device in enumerate(reversed(self.devices)):
+            values = (str(device.id), format_date(device.date_received),
+                      f"{device.type} {device.brand} {device.model}", device.serial, device.status,
+                      f"{device.cost:.2f}", f"{device.advance:.2f}",
+                      f"{ZERO if device.status == DELIVERED else device.balance:.2f}",
+                      str(device.factura_num or ''), format_date(device.date_delivered))
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+        layout.addWidget(self.table)
+        
+        buttons = QHBoxLayout()
+        buttons.addStretch(1)
+        statement_btn = QPushButton("Estado de Cuenta (PDF)")
+        statement_btn.clicked.connect(self.export_statement)
+        buttons.addWidget(statement_btn)
+        close_btn = QPushButton("Cerrar")
+        close_btn.clicked.connect(self.close)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+    
+    def export_statement(self):
+        try:
+            with metrics.timed('ui.client_statement'):
+                text = reports.build_client_statement(self.client, self.devices)
+                path = documents.export_report_pdf(text, documents.statement_path(self.client.id))
+            webbrowser.open(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo generar el estado de cuenta: {str(e)}")
+
+
+def format_date(value):
+    return value.strftime("%d/%m/%Y") if value else ""
+
+
+class ClientPicker(QComboBox):
+    """Combo de clientes que se llena bajo demanda desde un índice por prefijo"""
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.NoInsert)
+        self.setMaxVisibleItems(15)
+        self.lineEdit().setPlaceholderText("Escriba nombre o teléfono del cliente...")
+        
+        # Esperar a que el usuario deje de escribir antes de consultar
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.refresh_matches)
+        self.lineEdit().textEdited.connect(self.search_timer.start)
+        
+        self.refresh_matches()
+    
+    @staticmethod
+    def client_label(client):
+        """Texto del cliente en la lista; el teléfono distingue nombres repetidos"""
+        if client.phone:
+            return f"{client.name} - {client.phone}"
+        return client.name
+    
+    @metrics.action('ui.client_picker')
+    def refresh_matches(self):
+        """Carga en la lista solo los clientes que coinciden con lo escrito"""
+        text = self.currentText()
+        if self.currentIndex() != -1 and text == self.itemText(self.currentIndex()):
+            text = ''
+        
+        self.blockSignals(True)
+        self.clear()
+        for client in self.service.suggest_clients(text, CLIENT_PICKER_LIMIT):
+            self.addItem(self.client_label(client), client.id)
+        self.setCurrentIndex(-1)
+        self.setEditText(text)
+        self.blockSignals(False)
+        
+        if text and self.count() and self.hasFocus():
+            self.showPopup()
+    
+    def select_client(self, client_id):
+        """Selecciona un cliente por ID aunque no esté en la lista actual"""
+        index = self.findData(client_id)
+        if index == -1:
+            client = self.service.get_client(client_id)
+            if client is None:
+                return False
+            self.insertItem(0, self.client_label(client), client_id)
+            index = 0
+        self.setCurrentIndex(index)
+        return True
+    
+    def selected_client_id(self):
+        """ID del cliente elegido, o None si el texto no corresponde a una opción"""
+        index = self.currentIndex()
+        if index == -1 or self.currentText() != self.itemText(index):
+            return None
+        return self.itemData(index)
+
 class MainWindow(QMainWindow):
+    # Equipo con sus fotos ya guardadas (o None) y errores; se emite desde el hilo de PhotoIngest
+    photos_ingested = pyqtSignal(object, list)
+    # Ruta del backup pedido desde el menú (o None) y el error; se emite desde el hilo de backups
+    backup_finished = pyqtSignal(object, object)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Control de Reparaciones")
@@ -110,21 +465,24 @@ class MainWindow(QMainWindow):
         self.resize(960, 640)
         self.image_paths = []
         
-        # Inicializar archivos JSON si no existen
-        self.initialize_json_files()
+        # Datos locales (con índices en memoria) o del servidor compartido
+        self.service = create_service()
+        if isinstance(self.service, RemoteService):
+            self.setWindowTitle(f"Control de Reparaciones - {self.service.base_url}")
         
         self.setup_ui()
         self.create_menu()
-    
-    def initialize_json_files(self):
-        """Crea los archivos JSON si no existen con estructura inicial"""
-        if not os.path.exists(CLIENTS_FILE):
-            with open(CLIENTS_FILE, 'w') as f:
-                json.dump([], f)
+        self.setup_change_watcher()
+        
+        # Las fotos se achican en otros procesos después de registrar el equipo
+        self.photo_ingest = photos.PhotoIngest(self.service)
+        self.photos_ingested.connect(self.on_photos_ingested)
         
-        if not os.path.exists(DEVICES_FILE):
-            with open(DEVICES_FILE, 'w') as f:
-                json.dump([], f)
+        # Backups automáticos y los del menú, en un hilo aparte (en modo cliente los hace el servidor)
+        self.backup_scheduler = None
+        if not isinstance(self.service, RemoteService):
+            self.backup_scheduler = backups.BackupScheduler(lambda: self.service.writes).start()
+        self.backup_finished.connect(self.on_backup_finished)
     
     def setup_ui(self):
         self.tabs = QTabWidget()
@@ -135,18 +493,21 @@ class MainWindow(QMainWindow):
         self.receipt_tab = QWidget()
         self.reports_tab = QWidget()
         self.delivery_tab = QWidget()
+        self.board_tab = QWidget()
         
         self.tabs.addTab(self.client_tab, "Clientes")
         self.tabs.addTab(self.device_tab, "Equipos")
         self.tabs.addTab(self.receipt_tab, "Recibos")
         self.tabs.addTab(self.reports_tab, "Reportes")
         self.tabs.addTab(self.delivery_tab, "Entregas")
+        self.tabs.addTab(self.board_tab, "Tablero")
         
         self.setup_client_tab()
         self.setup_device_tab()
         self.setup_receipt_tab()
         self.setup_reports_tab()
         self.setup_delivery_tab()
+        self.setup_board_tab()
         
         self.setCentralWidget(self.tabs)
     
@@ -159,9 +520,16 @@ class MainWindow(QMainWindow):
         backup_action.triggered.connect(self.create_backup)
         restore_action = file_menu.addAction("Restaurar Backup")
         restore_action.triggered.connect(self.restore_backup)
+        catalog_action = file_menu.addAction("Historial de Backups")
+        catalog_action.triggered.connect(self.show_backup_catalog)
+        file_menu.addSeparator()
+        import_action = file_menu.addAction("Importar datos")
+        import_action.triggered.connect(self.import_data)
         
         # Menú Ayuda
         help_menu = menubar.addMenu("Ayuda")
+        diagnostics_action = help_menu.addAction("Diagnóstico")
+        diagnostics_action.triggered.connect(self.show_diagnostics)
         about_action = help_menu.addAction("Acerca de")
         about_action.triggered.connect(self.show_about)
     
@@ -191,11 +559,20 @@ class MainWindow(QMainWindow):
         delete_btn = QPushButton("Eliminar Cliente")
         delete_btn.clicked.connect(self.delete_client)
         delete_btn.setStyleSheet("background-color: #ff6666; color: white;")
+        history_btn = QPushButton("Ver Historial")
+        history_btn.clicked.connect(self.show_client_history)
         
         btn_layout.addWidget(add_btn)
         btn_layout.addWidget(clear_btn)
+        btn_layout.addWidget(history_btn)
         btn_layout.addWidget(delete_btn)
         
+        # Búsqueda
+        self.client_search = QLineEdit()
+        self.client_search.setPlaceholderText("Buscar por nombre, teléfono, email o NIT/CI...")
+        self.client_search.setClearButtonEnabled(True)
+        self.client_search.textChanged.connect(self.update_client_table)
+        
         # Tabla de clientes
         self.client_table = QTableWidget()
         self.client_table.setColumnCount(6)
@@ -209,6 +586,7 @@ class MainWindow(QMainWindow):
         layout.addLayout(form_layout)
         layout.addLayout(btn_layout)
         layout.addWidget(QLabel("Lista de Clientes:"))
+        layout.addWidget(self.client_search)
         layout.addWidget(self.client_table)
         
         self.client_tab.setLayout(layout)
@@ -218,8 +596,7 @@ class MainWindow(QMainWindow):
         
         # Formulario de equipo
         form_layout = QFormLayout()
-        self.device_client = QComboBox()
-        self.update_client_combo()
+        self.device_client = ClientPicker(self.service)
         
         self.device_type = QComboBox()
         self.device_type.addItems(["Smartphone", "iPhone", "Tablet", "Computadora"])
@@ -235,6 +612,16 @@ class MainWindow(QMainWindow):
         self.device_advance.setRange(0, 9999)
         self.device_advance.setPrefix("$ ")
         
+        # Historial de reparaciones previas del mismo equipo
+        self.device_history = QLabel()
+        self.device_history.setWordWrap(True)
+        self.device_history.setStyleSheet("color: #b35900;")
+        self.device_history.setVisible(False)
+        self.device_serial.textChanged.connect(self.update_repair_history)
+        self.device_brand.textChanged.connect(self.update_repair_history)
+        self.device_model.textChanged.connect(self.update_repair_history)
+        self.device_client.currentIndexChanged.connect(self.update_repair_history)
+        
         # Sección para imágenes
         self.image_preview_layout = QHBoxLayout()
         btn_add_images = QPushButton("Agregar Imágenes (Máx 3)")
@@ -247,6 +634,7 @@ class MainWindow(QMainWindow):
         form_layout.addRow("Marca:", self.device_brand)
         form_layout.addRow("Modelo:", self.device_model)
         form_layout.addRow("N° Serie:", self.device_serial)
+        form_layout.addRow("", self.device_history)
         form_layout.addRow("Problemas:", self.device_issues)
         form_layout.addRow("Costo:", self.device_cost)
         form_layout.addRow("Anticipo:", self.device_advance)
@@ -264,6 +652,12 @@ class MainWindow(QMainWindow):
         btn_layout.addWidget(add_btn)
         btn_layout.addWidget(clear_btn)
         
+        # Búsqueda
+        self.device_search = QLineEdit()
+        self.device_search.setPlaceholderText("Buscar por cliente, marca, modelo, serie o problema...")
+        self.device_search.setClearButtonEnabled(True)
+        self.device_search.textChanged.connect(self.update_device_table)
+        
         # Tabla de equipos
         self.device_table = QTableWidget()
         self.device_table.setColumnCount(9)
@@ -277,6 +671,7 @@ class MainWindow(QMainWindow):
         layout.addLayout(form_layout)
         layout.addLayout(btn_layout)
         layout.addWidget(QLabel("Lista de Equipos:"))
+        layout.addWidget(self.device_search)
         layout.addWidget(self.device_table)
         
         self.device_tab.setLayout(layout)
@@ -295,12 +690,15 @@ class MainWindow(QMainWindow):
         btn_layout = QHBoxLayout()
         generate_btn = QPushButton("Generar Recibo (PDF)")
         generate_btn.clicked.connect(self.generate_receipt)
+        ticket_btn = QPushButton("Imprimir Ticket")
+        ticket_btn.clicked.connect(self.print_receipt_ticket)
         email_btn = QPushButton("Enviar por Email")
         email_btn.clicked.connect(self.send_receipt_email)
         whatsapp_btn = QPushButton("Enviar por WhatsApp")
         whatsapp_btn.clicked.connect(self.send_receipt_whatsapp)
         
         btn_layout.addWidget(generate_btn)
+        btn_layout.addWidget(ticket_btn)
         btn_layout.addWidget(email_btn)
         btn_layout.addWidget(whatsapp_btn)
         
@@ -325,6 +723,53 @@ class MainWindow(QMainWindow):
         date_layout.addWidget(self.end_date)
         date_group.setLayout(date_layout)
         
+        # Filtros del reporte a medida (se resuelven con índices, ver queries)
+        filter_group = QGroupBox("Reporte filtrado")
+        filter_layout = QGridLayout()
+        self.filter_type = QComboBox()
+        self.filter_type.setEditable(True)
+        self.filter_type.addItems(["", "Smartphone", "iPhone", "Tablet", "Computadora"])
+        self.filter_brand = QLineEdit()
+        self.filter_model = QLineEdit()
+        self.filter_model.setPlaceholderText("Contiene...")
+        self.filter_status = QComboBox()
+        self.filter_status.addItem("(Todos)", "")
+        for status in STATUSES:
+            self.filter_status.addItem(status, status)
+        self.filter_client = ClientPicker(self.service)
+        self.filter_cost_min = QDoubleSpinBox()
+        self.filter_cost_min.setRange(0, 99999)
+        self.filter_cost_min.setPrefix("$ ")
+        self.filter_cost_min.setSpecialValueText("Sin mínimo")
+        self.filter_cost_max = QDoubleSpinBox()
+        self.filter_cost_max.setRange(0, 99999)
+        self.filter_cost_max.setPrefix("$ ")
+        self.filter_cost_max.setSpecialValueText("Sin máximo")
+        self.filter_dates = QComboBox()
+        self.filter_dates.addItem("Recibidos entre las fechas", "received")
+        self.filter_dates.addItem("Entregados entre las fechas", "delivered")
+        self.filter_dates.addItem("Cualquier fecha", "")
+        filter_btn = QPushButton("Reporte Filtrado")
+        filter_btn.clicked.connect(self.generate_filter_report)
+        
+        filter_layout.addWidget(QLabel("Tipo:"), 0, 0)
+        filter_layout.addWidget(self.filter_type, 0, 1)
+        filter_layout.addWidget(QLabel("Marca:"), 0, 2)
+        filter_layout.addWidget(self.filter_brand, 0, 3)
+        filter_layout.addWidget(QLabel("Modelo:"), 0, 4)
+        filter_layout.addWidget(self.filter_model, 0, 5)
+        filter_layout.addWidget(QLabel("Estado:"), 1, 0)
+        filter_layout.addWidget(self.filter_status, 1, 1)
+        filter_layout.addWidget(QLabel("Cliente:"), 1, 2)
+        filter_layout.addWidget(self.filter_client, 1, 3, 1, 3)
+        filter_layout.addWidget(QLabel("Costo desde:"), 2, 0)
+        filter_layout.addWidget(self.filter_cost_min, 2, 1)
+        filter_layout.addWidget(QLabel("hasta:"), 2, 2)
+        filter_layout.addWidget(self.filter_cost_max, 2, 3)
+        filter_layout.addWidget(self.filter_dates, 2, 4)
+        filter_layout.addWidget(filter_btn, 2, 5)
+        filter_group.setLayout(filter_layout)
+        
         # Botones de reportes
         btn_layout = QHBoxLayout()
         daily_btn = QPushButton("Reporte Diario")
@@ -335,11 +780,17 @@ class MainWindow(QMainWindow):
         monthly_btn.clicked.connect(lambda: self.generate_report("mensual"))
         custom_btn = QPushButton("Reporte Personalizado")
         custom_btn.clicked.connect(lambda: self.generate_report("personalizado"))
+        returns_btn = QPushButton("Reporte de Reingresos")
+        returns_btn.clicked.connect(self.generate_returns_report)
+        turnaround_btn = QPushButton("Tiempos de Reparación")
+        turnaround_btn.clicked.connect(self.generate_turnaround_report)
         
         btn_layout.addWidget(daily_btn)
         btn_layout.addWidget(weekly_btn)
         btn_layout.addWidget(monthly_btn)
         btn_layout.addWidget(custom_btn)
+        btn_layout.addWidget(returns_btn)
+        btn_layout.addWidget(turnaround_btn)
         
         # Área de reporte
         self.report_text = QTextEdit()
@@ -348,12 +799,18 @@ class MainWindow(QMainWindow):
         # Botón para exportar a PDF
         export_btn = QPushButton("Exportar Reporte a PDF")
         export_btn.clicked.connect(self.export_report_to_pdf)
+        invoice_book_btn = QPushButton("Libro de Facturas (PDF)")
+        invoice_book_btn.clicked.connect(self.export_invoice_book)
+        export_layout = QHBoxLayout()
+        export_layout.addWidget(export_btn)
+        export_layout.addWidget(invoice_book_btn)
         
         # Añadir widgets al layout
         layout.addWidget(date_group)
         layout.addLayout(btn_layout)
+        layout.addWidget(filter_group)
         layout.addWidget(self.report_text)
-        layout.addWidget(export_btn)
+        layout.addLayout(export_layout)
         
         self.reports_tab.setLayout(layout)
     
@@ -365,7 +822,7 @@ class MainWindow(QMainWindow):
         self.delivery_device = QComboBox()
         self.update_delivery_combo()
         
-        form_layout.addRow("Equipo para entregar:", self.delivery_device)
+        form_layout.addRow("Equipo listo para entregar:", self.delivery_device)
         
         # Botón de entrega
         deliver_btn = QPushButton("Entregar Equipo y Generar Factura")
@@ -375,6 +832,44 @@ class MainWindow(QMainWindow):
         layout.addWidget(deliver_btn)
         self.delivery_tab.setLayout(layout)
     
+    def setup_board_tab(self):
+        layout = QVBoxLayout()
+        
+        # Una columna por etapa, con su cola de equipos
+        columns_layout = QHBoxLayout()
+        self.board_groups = {}
+        self.board_lists = {}
+        for status in STATUSES:
+            if status == DELIVERED:
+                continue
+            group = QGroupBox(status)
+            group_layout = QVBoxLayout(group)
+            device_list = QListWidget()
+            device_list.itemClicked.connect(self.select_board_device)
+            group_layout.addWidget(device_list)
+            columns_layout.addWidget(group)
+            self.board_groups[status] = group
+            self.board_lists[status] = device_list
+        
+        # Cambio de estado del equipo elegido
+        move_layout = QHBoxLayout()
+        self.board_selected = QLabel("Seleccione un equipo del tablero")
+        self.board_status = QComboBox()
+        move_btn = QPushButton("Cambiar Estado")
+        move_btn.clicked.connect(self.change_device_status)
+        self.board_delivered = QLabel()
+        move_layout.addWidget(self.board_selected, 1)
+        move_layout.addWidget(QLabel("Pasar a:"))
+        move_layout.addWidget(self.board_status)
+        move_layout.addWidget(move_btn)
+        move_layout.addWidget(self.board_delivered)
+        
+        layout.addLayout(columns_layout)
+        layout.addLayout(move_layout)
+        self.board_tab.setLayout(layout)
+        self.board_device_id = None
+        self.update_board()
+    
     def clear_client_form(self):
         """Limpia el formulario de cliente"""
         self.client_name.clear()
@@ -398,171 +893,316 @@ class MainWindow(QMainWindow):
             self.image_preview_layout.itemAt(i).widget().setParent(None)
     
     def load_clients(self):
-        """Carga los clientes desde el archivo JSON con estructura validada"""
-        try:
-            with open(CLIENTS_FILE, 'r') as f:
-                clients = json.load(f)
-                
-                # Validar estructura de cada cliente
-                valid_clients = []
-                for client in clients:
-                    if isinstance(client, dict):
-                        # Asegurar que tenga los campos mínimos requeridos
-                        valid_client = {
-                            'id': client.get('id', 0),
-                            'name': client.get('name', ''),
-                            'phone': client.get('phone', ''),
-                            'email': client.get('email', ''),
-                            'address': client.get('address', ''),
-                            'nit': client.get('nit', ''),
-                            'balance': client.get('balance', 0)
-                        }
-                        valid_clients.append(valid_client)
-                
-                return valid_clients
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        """Devuelve la lista de clientes"""
+        return self.service.list_clients()
     
     def load_devices(self):
-        """Carga los equipos desde el archivo JSON con estructura validada"""
-        try:
-            with open(DEVICES_FILE, 'r') as f:
-                devices = json.load(f)
-                
-                # Validar estructura de cada equipo
-                valid_devices = []
-                for device in devices:
-                    if isinstance(device, dict):
-                        # Asegurar que tenga los campos mínimos requeridos
-                        valid_device = {
-                            'id': device.get('id', 0),
-                            'client_id': device.get('client_id', 0),
-                            'client_name': device.get('client_name', ''),
-                            'type': device.get('type', ''),
-                            'brand': device.get('brand', ''),
-                            'model': device.get('model', ''),
-                            'serial': device.get('serial', ''),
-                            'issues': device.get('issues', ''),
-                            'cost': device.get('cost', 0),
-                            'advance': device.get('advance', 0),
-                            'status': device.get('status', 'En reparación'),
-                            'date_received': device.get('date_received', ''),
-                            'date_delivered': device.get('date_delivered', ''),
-                            'images': device.get('images', []),
-                            'factura_num': device.get('factura_num', 0)
-                        }
-                        valid_devices.append(valid_device)
-                
-                return valid_devices
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        """Devuelve la lista de equipos"""
+        return self.service.list_devices()
     
+    @metrics.action('ui.update_client_table')
     def update_client_table(self):
         """Actualiza la tabla de clientes con los datos actuales"""
-        clients = self.load_clients()
+        query = self.client_search.text().strip()
+        if query:
+            clients = self.service.search_clients(query)
+        else:
+            clients = self.load_clients()
         self.client_table.setRowCount(len(clients))
         
         for row, client in enumerate(clients):
-            self.client_table.setItem(row, 0, QTableWidgetItem(str(client['id'])))
-            self.client_table.setItem(row, 1, QTableWidgetItem(client['name']))
-            self.client_table.setItem(row, 2, QTableWidgetItem(client['phone']))
-            self.client_table.setItem(row, 3, QTableWidgetItem(client['email']))
-            self.client_table.setItem(row, 4, QTableWidgetItem(client['nit']))
-            self.client_table.setItem(row, 5, QTableWidgetItem(str(client['balance'])))
+            self.fill_client_row(row, client)
     
+    def fill_client_row(self, row, client):
+        self.client_table.setItem(row, 0, QTableWidgetItem(str(client.id)))
+        self.client_table.setItem(row, 1, QTableWidgetItem(client.name))
+        self.client_table.setItem(row, 2, QTableWidgetItem(client.phone))
+        self.client_table.setItem(row, 3, QTableWidgetItem(client.email))
+        self.client_table.setItem(row, 4, QTableWidgetItem(client.nit))
+        self.client_table.setItem(row, 5, QTableWidgetItem(str(client.balance)))
+    
+    @metrics.action('ui.update_device_table')
     def update_device_table(self):
         """Actualiza la tabla de equipos con los datos actuales"""
-        devices = self.load_devices()
+        query = self.device_search.text().strip()
+        if query:
+            devices = self.service.search_devices(query)
+        else:
+            devices = self.load_devices()
         self.device_table.setRowCount(len(devices))
         
         for row, device in enumerate(devices):
-            self.device_table.setItem(row, 0, QTableWidgetItem(str(device['id'])))
-            self.device_table.setItem(row, 1, QTableWidgetItem(device['client_name']))
-            self.device_table.setItem(row, 2, QTableWidgetItem(device['type']))
-            self.device_table.setItem(row, 3, QTableWidgetItem(device['brand']))
-            self.device_table.setItem(row, 4, QTableWidgetItem(device['model']))
-            self.device_table.setItem(row, 5, QTableWidgetItem(device['issues']))
-            self.device_table.setItem(row, 6, QTableWidgetItem(str(device['cost'])))
-            self.device_table.setItem(row, 7, QTableWidgetItem(device['status']))
-            self.device_table.setItem(row, 8, QTableWidgetItem(str(len(device['images']))))
+            self.fill_device_row(row, device)
+    
+    def fill_device_row(self, row, device):
+        self.device_table.setItem(row, 0, QTableWidgetItem(str(device.id)))
+        self.device_table.setItem(row, 1, QTableWidgetItem(device.client_name))
+        self.device_table.setItem(row, 2, QTableWidgetItem(device.type))
+        self.device_table.setItem(row, 3, QTableWidgetItem(device.brand))
+        self.device_table.setItem(row, 4, QTableWidgetItem(device.model))
+        self.device_table.setItem(row, 5, QTableWidgetItem(device.issues))
+        self.device_table.setItem(row, 6, QTableWidgetItem(str(device.cost)))
+        self.device_table.setItem(row, 7, QTableWidgetItem(device.status))
+        self.device_table.setItem(row, 8, QTableWidgetItem(str(len(device.images))))
     
     def update_client_combo(self):
-        """Actualiza el combo box de clientes con validación"""
-        self.device_client.clear()
-        clients = self.load_clients()
-        
-        for client in clients:
-            # Asegurarse de que el cliente tiene nombre e ID
-            if 'name' in client and 'id' in client:
-                self.device_client.addItem(client['name'], client['id'])
-            else:
-                print(f"Cliente inválido omitido: {client}")
+        """Actualiza las coincidencias del selector de clientes desde el índice"""
+        self.device_client.refresh_matches()
     
+    @metrics.action('ui.update_receipt_combo')
     def update_receipt_combo(self):
         """Actualiza el combo box de equipos para recibos"""
         self.receipt_device.clear()
         devices = self.load_devices()
         
         for device in devices:
-            if all(key in device for key in ['id', 'client_name', 'type']):
-                self.receipt_device.addItem(
-                    f"{device['id']} - {device['client_name']} - {device['type']}", 
-                    device['id']
-                )
+            self.receipt_device.addItem(self.device_label(device), device.id)
     
+    @metrics.action('ui.update_delivery_combo')
     def update_delivery_combo(self):
         """Actualiza el combo box de equipos para entregas"""
         self.delivery_device.clear()
-        devices = self.load_devices()
+        devices = self.service.deliverable_devices()
         
         for device in devices:
-            if 'status' in device and device['status'] == 'En reparación':
-                if all(key in device for key in ['id', 'client_name', 'type']):
-                    self.delivery_device.addItem(
-                        f"{device['id']} - {device['client_name']} - {device['type']}", 
-                        device['id']
-                    )
+            self.delivery_device.addItem(self.device_label(device), device.id)
     
+    @metrics.action('ui.update_board')
+    def update_board(self):
+        """Actualiza el tablero desde las colas por estado, sin recorrer todos los equipos"""
+        counts = self.service.status_counts()
+        for status, device_list in self.board_lists.items():
+            self.board_groups[status].setTitle(f"{status} ({counts.get(status, 0)})")
+            device_list.clear()
+            # Los más recientes arriba
+            for device in reversed(self.service.devices_by_status(status, BOARD_COLUMN_LIMIT)):
+                item = QListWidgetItem(f"{self.device_label(device)} {device.brand} {device.model}")
+                item.setData(Qt.UserRole, device.id)
+                device_list.addItem(item)
+        self.board_delivered.setText(f"Entregados recientes: {counts.get(DELIVERED, 0)}")
+        if self.board_device_id is not None:
+            self.select_board_device(None)
+    
+    def select_board_device(self, item):
+        """Muestra el equipo elegido y las etapas a las que puede pasar"""
+        for device_list in self.board_lists.values():
+            if item is not None and device_list is not item.listWidget():
+                device_list.clearSelection()
+        self.board_device_id = item.data(Qt.UserRole) if item is not None else None
+        device = self.service.get_device(self.board_device_id) if self.board_device_id else None
+        self.board_status.clear()
+        if device is None:
+            self.board_device_id = None
+            self.board_selected.setText("Seleccione un equipo del tablero")
+            return
+        since = device.status_since()
+        self.board_selected.setText(f"{self.device_label(device)} - {device.status}"
+                                    + (f" desde {since.strftime('%d/%m/%Y %H:%M')}" if since else ""))
+        for status in TRANSITIONS.get(device.status, STATUSES):
+            if status not in (device.status, DELIVERED):
+                self.board_status.addItem(status)
+    
+    def change_device_status(self):
+        """Pasa el equipo elegido en el tablero a la etapa indicada"""
+        status = self.board_status.currentText()
+        if self.board_device_id is None or not status:
+            QMessageBox.warning(self, "Error", "Seleccione un equipo del tablero")
+            return
+        try:
+            with metrics.timed('ui.change_status'):
+                device = self.service.change_status(self.board_device_id, status)
+                self.apply_table_changes(self.device_table, [device], (), self.fill_device_row)
+                self.set_combo_item(self.delivery_device, device.id,
+                                    self.device_label(device) if device.status == READY else None)
+                self.board_device_id = None
+                self.update_board()
+        except ServiceError as e:
+            QMessageBox.warning(self, "Error", str(e))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo cambiar el estado: {str(e)}")
+    
+    @staticmethod
+    def device_label(device):
+        return f"{device.id} - {device.client_name} - {device.type}"
+    
+    def setup_change_watcher(self):
+        """Vigila database/ para mostrar lo que guardan otras ventanas de esta PC o de la red local"""
+        # Con servidor cada consulta ya trae los datos al día
+        if isinstance(self.service, RemoteService):
+            return
+        # Un guardado toca varios archivos seguidos: se espera a que terminen
+        self.change_timer = QTimer(self)
+        self.change_timer.setSingleShot(True)
+        self.change_timer.setInterval(CHANGE_DEBOUNCE_MS)
+        self.change_timer.timeout.connect(self.apply_external_changes)
+        
+        self.change_watcher = QFileSystemWatcher([storage.DATABASE_DIR], self)
+        self.change_watcher.directoryChanged.connect(self.schedule_change_check)
+        self.change_watcher.fileChanged.connect(self.schedule_change_check)
+        self.watch_journal()
+    
+    def watch_journal(self):
+        # Al rotar, cambios.jsonl se reemplaza y el vigilante lo pierde
+        if os.path.exists(JOURNAL_FILE) and JOURNAL_FILE not in self.change_watcher.files():
+            self.change_watcher.addPath(JOURNAL_FILE)
+    
+    def schedule_change_check(self, path=None):
+        self.watch_journal()
+        self.change_timer.start()
+    
+    @metrics.action('ui.apply_external_changes')
+    def apply_external_changes(self):
+        """Actualiza tablas y listas solo con lo que otra instancia cambió"""
+        changes = self.service.poll_changes()
+        if not changes:
+            return
+        
+        if changes.all_clients or changes.clients or changes.deleted_clients:
+            if changes.all_clients or self.client_search.text().strip():
+                # Con un filtro activo un cambio puede hacer entrar o salir filas
+                self.update_client_table()
+            else:
+                clients = [c for c in map(self.service.get_client, changes.clients) if c]
+                self.apply_table_changes(self.client_table, clients, changes.deleted_clients,
+                                         self.fill_client_row)
+            self.update_client_combo()
+        
+        if changes.all_devices or changes.devices or changes.deleted_devices:
+            if changes.all_devices:
+                self.update_device_table()
+                self.update_receipt_combo()
+                self.update_delivery_combo()
+            else:
+                devices = [d for d in map(self.service.get_device, changes.devices) if d]
+                if self.device_search.text().strip():
+                    self.update_device_table()
+                else:
+                    self.apply_table_changes(self.device_table, devices, changes.deleted_devices,
+                                             self.fill_device_row)
+                for device_id in changes.deleted_devices:
+                    self.set_combo_item(self.receipt_device, device_id, None)
+                    self.set_combo_item(self.delivery_device, device_id, None)
+                for device in devices:
+                    label = self.device_label(device)
+                    self.set_combo_item(self.receipt_device, device.id, label)
+                    self.set_combo_item(self.delivery_device, device.id,
+                                        label if device.status == READY else None)
+            self.update_repair_history()
+            self.update_board()
+    
+    @staticmethod
+    def apply_table_changes(table, records, deleted_ids, fill_row):
+        """Reemplaza las filas de ``records`` (por ID), agrega las nuevas y quita las borradas"""
+        rows = {}
+        for row in range(table.rowCount()):
+            item = table.item(row, 0)
+            if item is not None:
+                rows[int(item.text())] = row
+        
+        removed = sorted((rows[i] for i in deleted_ids if i in rows), reverse=True)
+        for row in removed:
+            table.removeRow(row)
+        if removed:
+            rows = {int(table.item(row, 0).text()): row for row in range(table.rowCount())}
+        
+        for record in records:
+            row = rows.get(record.id)
+            if row is None:
+                row = table.rowCount()
+                table.insertRow(row)
+            fill_row(row, record)
+    
+    @staticmethod
+    def set_combo_item(combo, data, label):
+        """Pone ``label`` en el elemento con ``data`` (lo agrega si falta); con None lo quita"""
+        index = combo.findData(data)
+        if label is None:
+            if index >= 0:
+                combo.removeItem(index)
+        elif index >= 0:
+            combo.setItemText(index, label)
+        else:
+            combo.addItem(label, data)
+    
+    @metrics.action('ui.load_client_data')
     def load_client_data(self, index):
         """Carga los datos del cliente seleccionado en la tabla"""
-        row = index.row()
-        clients = self.load_clients()
-        
-        if row < len(clients):
-            client = clients[row]
-            self.client_name.setText(client['name'])
-            self.client_phone.setText(client['phone'])
-            self.client_email.setText(client['email'])
-            self.client_address.setPlainText(client['address'])
-            self.client_nit.setText(client['nit'])
+        # La tabla puede estar filtrada: se identifica el cliente por su ID
+        client_id = int(self.client_table.item(index.row(), 0).text())
+        client = self.service.get_client(client_id)
+        
+        if client:
+            self.client_name.setText(client.name)
+            self.client_phone.setText(client.phone)
+            self.client_email.setText(client.email)
+            self.client_address.setPlainText(client.address)
+            self.client_nit.setText(client.nit)
     
+    @metrics.action('ui.load_device_data')
     def load_device_data(self, index):
         """Carga los datos del equipo seleccionado en la tabla"""
-        row = index.row()
-        devices = self.load_devices()
+        # La tabla puede estar filtrada: se identifica el equipo por su ID
+        device_id = int(self.device_table.item(index.row(), 0).text())
+        device = self.service.get_device(device_id)
         
-        if row < len(devices):
-            device = devices[row]
-            
+        if device:
             # Buscar el cliente correspondiente
-            clients = self.load_clients()
-            client = next((c for c in clients if c['id'] == device['client_id']), None)
+            client = self.service.get_client(device.client_id)
             
             if client:
-                self.device_client.setCurrentText(client['name'])
+                self.device_client.select_client(client.id)
             
-            self.device_type.setCurrentText(device['type'])
-            self.device_brand.setText(device['brand'])
-            self.device_model.setText(device['model'])
-            self.device_serial.setText(device['serial'])
-            self.device_issues.setPlainText(device['issues'])
-            self.device_cost.setValue(device['cost'])
-            self.device_advance.setValue(device['advance'])
+            self.device_type.setCurrentText(device.type)
+            self.device_brand.setText(device.brand)
+            self.device_model.setText(device.model)
+            self.device_serial.setText(device.serial)
+            self.device_issues.setPlainText(device.issues)
+            self.device_cost.setValue(float(device.cost))
+            self.device_advance.setValue(float(device.advance))
             
             # Cargar imágenes si existen
-            self.image_paths = device['images']
+            self.image_paths = list(device.images)
             self.update_image_preview()
     
+    def format_history_entry(self, device):
+        """Línea de historial de un ingreso previo"""
+        received = device.date_received.strftime("%Y-%m-%d") if device.date_received else ""
+        line = f"#{device.id} - {received} - {device.issues[:60]} - ${device.cost:.2f}"
+        if device.factura_num:
+            line += f" - Factura N° {device.factura_num}"
+        else:
+            line += f" - {device.status}"
+        return line
+    
+    @metrics.action('ui.update_repair_history')
+    def update_repair_history(self):
+        """Muestra los ingresos previos del equipo según su serie, o marca y modelo del cliente"""
+        serial = self.device_serial.text().strip()
+        lines = []
+        previous = []
+        
+        if serial:
+            previous = self.service.devices_by_serial(serial)
+            if previous:
+                lines.append(f"<b>Reingreso: {len(previous)} ingreso(s) previo(s) con esta serie</b>")
+        else:
+            # Sin serie, buscar el mismo modelo entre los equipos del cliente
+            client_id = self.device_client.selected_client_id()
+            brand = self.device_brand.text().strip()
+            model = self.device_model.text().strip()
+            if client_id and brand and model:
+                previous = self.service.client_devices_by_model(client_id, brand, model)
+            if previous:
+                lines.append(f"<b>Posible reingreso: el cliente ya trajo {len(previous)} equipo(s) "
+                             f"{html.escape(brand)} {html.escape(model)}</b>")
+        
+        # Mostrar los ingresos más recientes primero
+        for device in reversed(previous[-5:]):
+            lines.append(html.escape(self.format_history_entry(device)))
+        
+        self.device_history.setText("<br>".join(lines))
+        self.device_history.setVisible(bool(lines))
+    
     def load_images(self):
         """Carga imágenes del equipo"""
         options = QFileDialog.Options()
@@ -599,42 +1239,24 @@ class MainWindow(QMainWindow):
     
     def add_client(self):
         """Agrega un nuevo cliente a la base de datos con validación"""
-        name = self.client_name.text().strip()
-        phone = self.client_phone.text().strip()
-        email = self.client_email.text().strip()
-        address = self.client_address.toPlainText().strip()
-        nit = self.client_nit.text().strip()
-        
-        if not name:
-            QMessageBox.warning(self, "Error", "El nombre del cliente es obligatorio")
-            return
-        
-        clients = self.load_clients()
-        
-        # Generar ID único
-        new_id = max([c.get('id', 0) for c in clients], default=0) + 1
-        
-        # Crear cliente con estructura completa
         new_client = {
-            'id': new_id,
-            'name': name,
-            'phone': phone,
-            'email': email,
-            'address': address,
-            'nit': nit,
-            'balance': 0.0  # Inicializar saldo
+            'name': self.client_name.text().strip(),
+            'phone': self.client_phone.text().strip(),
+            'email': self.client_email.text().strip(),
+            'address': self.client_address.toPlainText().strip(),
+            'nit': self.client_nit.text().strip()
         }
         
-        clients.append(new_client)
-        
         try:
-            with open(CLIENTS_FILE, 'w') as f:
-                json.dump(clients, f, indent=4)
-            
-            self.update_client_table()
-            self.update_client_combo()
-            self.clear_client_form()
+            with metrics.timed('ui.add_client'):
+                self.service.add_client(new_client)
+                
+                self.update_client_table()
+                self.update_client_combo()
+                self.clear_client_form()
             QMessageBox.information(self, "Éxito", "Cliente agregado correctamente")
+        except ServiceError as e:
+            QMessageBox.warning(self, "Error", str(e))
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo guardar el cliente: {str(e)}")
     
@@ -647,16 +1269,6 @@ class MainWindow(QMainWindow):
         
         client_id = int(self.client_table.item(selected_row, 0).text())
         
-        # Verificar si el cliente tiene equipos asociados
-        devices = self.load_devices()
-        client_devices = [d for d in devices if d.get('client_id') == client_id]
-        
-        if client_devices:
-            QMessageBox.warning(self, "Error", 
-                              "No se puede eliminar el cliente porque tiene equipos registrados. "
-                              "Primero elimine o transfiera los equipos.")
-            return
-        
         # Confirmar eliminación
         reply = QMessageBox.question(
             self, 'Confirmar',
@@ -664,97 +1276,99 @@ class MainWindow(QMainWindow):
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            clients = self.load_clients()
-            clients = [c for c in clients if c.get('id') != client_id]
-            
             try:
-                with open(CLIENTS_FILE, 'w') as f:
-                    json.dump(clients, f, indent=4)
-                
-                self.update_client_table()
-                self.update_client_combo()
-                self.clear_client_form()
+                # El servicio rechaza clientes con equipos registrados
+                with metrics.timed('ui.delete_client'):
+                    self.service.delete_client(client_id)
+                    
+                    self.update_client_table()
+                    self.update_client_combo()
+                    self.clear_client_form()
                 QMessageBox.information(self, "Éxito", "Cliente eliminado correctamente")
+            except ServiceError as e:
+                QMessageBox.warning(self, "Error", str(e))
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"No se pudo eliminar el cliente: {str(e)}")
     
-    def add_device(self):
-        """Agrega un nuevo equipo a la base de datos con validación"""
-        client_id = self.device_client.currentData()
-        device_type = self.device_type.currentText()
-        brand = self.device_brand.text().strip()
-        model = self.device_model.text().strip()
-        serial = self.device_serial.text().strip()
-        issues = self.device_issues.toPlainText().strip()
-        cost = self.device_cost.value()
-        advance = self.device_advance.value()
-        
-        if not client_id:
-            QMessageBox.warning(self, "Error", "Seleccione un cliente")
-            return
-        
-        if not brand or not model:
-            QMessageBox.warning(self, "Error", "Marca y modelo son obligatorios")
+    @metrics.action('ui.client_history')
+    def show_client_history(self):
+        """Abre el historial del cliente seleccionado: equipos, facturas, pagos y saldo"""
+        selected_row = self.client_table.currentRow()
+        if selected_row == -1:
+            QMessageBox.warning(self, "Advertencia", "Seleccione un cliente para ver su historial")
             return
         
-        devices = self.load_devices()
-        clients = self.load_clients()
-        
-        # Obtener nombre del cliente
-        client = next((c for c in clients if c['id'] == client_id), None)
-        if not client:
+        client = self.service.get_client(int(self.client_table.item(selected_row, 0).text()))
+        if client is None:
             QMessageBox.warning(self, "Error", "Cliente no encontrado")
             return
-        
-        # Generar ID único
-        new_id = max([d.get('id', 0) for d in devices], default=0) + 1
-        
-        # Guardar imágenes en directorio
-        saved_images = []
-        for i, img_path in enumerate(self.image_paths[:3]):  # Máximo 3 imágenes
-            if os.path.exists(img_path):
-                ext = os.path.splitext(img_path)[1]
-                new_path = os.path.join(IMAGES_DIR, f"device_{new_id}_{i}{ext}")
-                shutil.copy(img_path, new_path)
-                saved_images.append(new_path)
-        
-        # Crear dispositivo con estructura completa
+        try:
+            dialog = ClientHistoryDialog(self.service, client, self)
+        except ServiceError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        dialog.show()
+    
+    def add_device(self):
+        """Agrega un nuevo equipo a la base de datos con validación"""
         new_device = {
-            'id': new_id,
-            'client_id': client_id,
-            'client_name': client['name'],
-            'type': device_type,
-            'brand': brand,
-            'model': model,
-            'serial': serial,
-            'issues': issues,
-            'cost': float(cost),
-            'advance': float(advance),
-            'status': "En reparación",
-            'date_received': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'date_delivered': "",
-            'images': saved_images,
-            'factura_num': 0
+            'client_id': self.device_client.selected_client_id(),
+            'type': self.device_type.currentText(),
+            'brand': self.device_brand.text().strip(),
+            'model': self.device_model.text().strip(),
+            'serial': self.device_serial.text().strip(),
+            'issues': self.device_issues.toPlainText().strip(),
+            'cost': float(self.device_cost.value()),
+            'advance': float(self.device_advance.value())
         }
         
         try:
-            with open(DEVICES_FILE, 'w') as f:
-                devices.append(new_device)
-                json.dump(devices, f, indent=4)
-            
-            # Actualizar saldo del cliente
-            client['balance'] = client.get('balance', 0) + (cost - advance)
-            with open(CLIENTS_FILE, 'w') as f:
-                json.dump(clients, f, indent=4)
-            
-            self.update_device_table()
-            self.update_receipt_combo()
-            self.update_delivery_combo()
-            self.clear_device_form()
-            QMessageBox.information(self, "Éxito", "Equipo agregado correctamente")
+            with metrics.timed('ui.add_device'):
+                photo_paths = [p for p in self.image_paths[:MAX_DEVICE_IMAGES] if os.path.exists(p)]
+                device = self.service.add_device(new_device)
+                if photo_paths:
+                    self.photo_ingest.submit(device.id, photo_paths, self.photos_ingested.emit)
+                
+                self.update_client_table()
+                self.update_device_table()
+                self.update_receipt_combo()
+                self.update_delivery_combo()
+                self.update_board()
+                self.clear_device_form()
+            message = "Equipo agregado correctamente"
+            if photo_paths:
+                message += ". Las fotos se agregan apenas terminen de procesarse."
+            QMessageBox.information(self, "Éxito", message)
+        except ServiceError as e:
+            QMessageBox.warning(self, "Error", str(e))
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo guardar el equipo: {str(e)}")
     
+    def on_photos_ingested(self, device, errors):
+        """Muestra en la tabla las fotos que PhotoIngest terminó de guardar"""
+        if device is not None:
+            if self.device_search.text().strip():
+                self.update_device_table()
+            else:
+                self.apply_table_changes(self.device_table, [device], (), self.fill_device_row)
+        if errors:
+            QMessageBox.warning(self, "Fotos", "No se pudieron guardar algunas fotos:\n" + "\n".join(errors))
+    
+    def closeEvent(self, event):
+        # Terminar de guardar las fotos en proceso antes de salir
+        self.photo_ingest.shutdown(wait=True)
+        if self.backup_scheduler is not None:
+            # Un backup a medio hacer se cancela; el anterior sigue siendo válido
+            self.backup_scheduler.stop()
+        if not isinstance(self.service, RemoteService):
+            # Registros e índices ya armados para que el próximo arranque sea inmediato;
+            # si no se puede guardar, el próximo arranque relee los JSON
+            try:
+                self.service.save_snapshot()
+            except OSError:
+                pass
+        super().closeEvent(event)
+    
     def generate_receipt(self):
         """Genera un recibo PDF para el equipo seleccionado con mejor formato"""
         try:
@@ -763,136 +1377,21 @@ class MainWindow(QMainWindow):
                 QMessageBox.warning(self, "Error", "Seleccione un equipo primero")
                 return
             
-            devices = self.load_devices()
-            device = next((d for d in devices if d['id'] == device_id), None)
+            device = self.service.get_device(device_id)
             
             if not device:
                 QMessageBox.warning(self, "Error", "Equipo no encontrado")
                 return
 
-            clients = self.load_clients()
-            client = next((c for c in clients if c['id'] == device['client_id']), None)
+            client = self.service.get_client(device.client_id)
             
             if not client:
                 QMessageBox.warning(self, "Error", "Cliente no encontrado")
                 return
 
-            # Crear PDF con mejor formato
-            pdf = PDF()
-            pdf.add_page()
-            pdf.set_auto_page_break(auto=True, margin=15)
-            
-            # Encabezado con logo y datos
-            pdf.set_font('Arial', 'B', 16)
-            
-            # Logo a la izquierda
-            if os.path.exists(LOGO_PATH):
-                try:
-                    pdf.image(LOGO_PATH, x=10, y=8, w=30)
-                except Exception as e:
-                    print(f"Error al cargar logo: {str(e)}")
-            
-            # Título centrado
-            pdf.cell(0, 10, "RECIBO DE REPARACIÓN", 0, 1, 'C')
-            
-            # QR a la derecha
-            try:
-                qr_data = f"https://pay.link.com/?amount={device['cost'] - device['advance']}"
-                img = qrcode.make(qr_data)
-                qr_temp_path = os.path.join(BASE_DIR, "qr_temp.png")
-                img.save(qr_temp_path)
-                pdf.image(qr_temp_path, x=160, y=10, w=30)
-                os.remove(qr_temp_path)
-            except Exception as e:
-                print(f"Error generando QR: {str(e)}")
-            
-            pdf.ln(20)  # Espacio después del encabezado
-            
-            # Información del cliente
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Cliente:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, client['name'], 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Teléfono:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, client['phone'], 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Fecha:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, datetime.now().strftime("%d/%m/%Y %H:%M"), 0, 1)
-            
-            pdf.ln(10)
-            
-            # Detalles del equipo
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, "Detalles del Equipo", 0, 1)
-            pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-            pdf.ln(5)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Tipo:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, device['type'], 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Marca:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, device['brand'], 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Modelo:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, device['model'], 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "N° Serie:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, device['serial'], 0, 1)
-            
-            pdf.ln(5)
-            
-            # Problemas reportados
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(0, 10, "Problemas reportados:", 0, 1)
-            pdf.set_font('Arial', '', 12)
-            pdf.multi_cell(0, 10, device['issues'])
-            
-            pdf.ln(10)
-            
-            # Resumen financiero
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, "Resumen Financiero", 0, 1)
-            pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-            pdf.ln(5)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(100, 10, "Concepto", 1)
-            pdf.cell(0, 10, "Monto", 1, 1)
-            
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(100, 10, "Costo total de reparación", 1)
-            pdf.cell(0, 10, f"${device['cost']:.2f}", 1, 1)
-            
-            pdf.cell(100, 10, "Anticipo recibido", 1)
-            pdf.cell(0, 10, f"${device['advance']:.2f}", 1, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(100, 10, "Saldo pendiente", 1)
-            pdf.cell(0, 10, f"${device['cost'] - device['advance']:.2f}", 1, 1)
-            
-            pdf.ln(15)
-            
-            # Notas
-            pdf.set_font('Arial', 'I', 10)
-            pdf.multi_cell(0, 10, "Nota: Este recibo es válido como comprobante de entrega del equipo. "
-                                "El pago pendiente debe ser cancelado al retirar el equipo.")
-            
-            # Guardar PDF
-            output_path = os.path.join(OUTPUT_DIR, f"Recibo_{device_id}.pdf")
-            pdf.output(output_path)
+            with metrics.timed('ui.generate_receipt'):
+                # Si el equipo y el cliente no cambiaron se reutiliza el PDF ya generado
+                output_path = documents.cached_receipt(device, client)
             
             QMessageBox.information(self, "Éxito", f"Recibo generado en: {output_path}")
             webbrowser.open(output_path)
@@ -900,6 +1399,27 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error al generar recibo: {str(e)}")
     
+    def print_receipt_ticket(self):
+        """Imprime el ticket de recepción en la impresora térmica, sin PDF ni visor"""
+        device_id = self.receipt_device.currentData()
+        if not device_id:
+            QMessageBox.warning(self, "Error", "Seleccione un equipo primero")
+            return
+
+        device = self.service.get_device(device_id)
+        client = self.service.get_client(device.client_id) if device else None
+        if not client:
+            QMessageBox.warning(self, "Error", "Equipo o cliente no encontrado")
+            return
+
+        try:
+            with metrics.timed('ui.print_ticket'):
+                destination = thermal.print_receipt(device, client)
+            # Sin cuadro de diálogo: en el mostrador se imprime uno tras otro
+            self.statusBar().showMessage(f"Ticket del equipo {device_id} enviado a {destination}", 5000)
+        except thermal.PrinterError as e:
+            QMessageBox.warning(self, "Impresora", str(e))
+
     def deliver_device(self):
         """Marca un equipo como entregado y genera factura con numeración automática y QR"""
         device_id = self.delivery_device.currentData()
@@ -907,255 +1427,101 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Seleccione un equipo primero")
             return
         
-        devices = self.load_devices()
-        device = next((d for d in devices if d['id'] == device_id), None)
-        
-        if not device:
-            QMessageBox.warning(self, "Error", "Equipo no encontrado")
-            return
-        
-        clients = self.load_clients()
-        client = next((c for c in clients if c['id'] == device['client_id']), None)
-        
-        if not client:
-            QMessageBox.warning(self, "Error", "Cliente no encontrado")
-            return
-        
-        # Obtener el próximo número de factura
-        factura_num = self.get_next_factura_number()
-        
-        # Actualizar estado del equipo
-        device['status'] = "Entregado"
-        device['date_delivered'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        device['factura_num'] = factura_num
-        
         try:
-            with open(DEVICES_FILE, 'w') as f:
-                json.dump(devices, f, indent=4)
-            
-            # Generar factura mejorada
-            pdf = PDF()
-            pdf.add_page()
-            pdf.set_auto_page_break(auto=True, margin=15)
-            
-            # Encabezado con logo y número de factura
-            if os.path.exists(LOGO_PATH):
-                try:
-                    pdf.image(LOGO_PATH, x=10, y=8, w=30)
-                except Exception as e:
-                    print(f"Error al cargar logo: {str(e)}")
-            
-            pdf.set_font('Arial', 'B', 16)
-            pdf.cell(0, 10, f"FACTURA N° {factura_num}", 0, 1, 'C')
-            
-            # QR de pago
-            try:
-                qr_data = f"https://pay.link.com/?amount={device['cost'] - device['advance']}"
-                img = qrcode.make(qr_data)
-                qr_temp_path = os.path.join(BASE_DIR, "qr_temp.png")
-                img.save(qr_temp_path)
-                pdf.image(qr_temp_path, x=160, y=10, w=30)
-                os.remove(qr_temp_path)
-            except Exception as e:
-                print(f"Error generando QR: {str(e)}")
-            
-            pdf.ln(20)
-            
-            # Información de la factura
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(40, 10, "Fecha:", 0, 0)
-            pdf.cell(0, 10, datetime.now().strftime("%d/%m/%Y %H:%M"), 0, 1)
-            
-            pdf.ln(10)
-            
-            # Datos del cliente
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, "Datos del Cliente", 0, 1)
-            pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-            pdf.ln(5)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Nombre:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, client['name'], 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "NIT/CI:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, client['nit'], 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Dirección:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, client['address'], 0, 1)
-            
-            pdf.ln(10)
-            
-            # Detalles del servicio
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, "Detalles del Servicio", 0, 1)
-            pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-            pdf.ln(5)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Equipo:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, f"{device['type']} {device['brand']}", 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Modelo:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, device['model'], 0, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(40, 10, "Serie:", 0, 0)
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, device['serial'], 0, 1)
-            
-            pdf.ln(5)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(0, 10, "Descripción del servicio:", 0, 1)
-            pdf.set_font('Arial', '', 12)
-            pdf.multi_cell(0, 10, device['issues'])
-            
-            pdf.ln(10)
-            
-            # Resumen financiero
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, "Resumen Financiero", 0, 1)
-            pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-            pdf.ln(5)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(120, 10, "Concepto", 1)
-            pdf.cell(0, 10, "Monto", 1, 1)
-            
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(120, 10, "Reparación de equipo electrónico", 1)
-            pdf.cell(0, 10, f"${device['cost']:.2f}", 1, 1)
-            
-            pdf.cell(120, 10, "Anticipo recibido", 1)
-            pdf.cell(0, 10, f"${device['advance']:.2f}", 1, 1)
-            
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(120, 10, "Total a pagar", 1)
-            pdf.cell(0, 10, f"${device['cost'] - device['advance']:.2f}", 1, 1)
-            
-            pdf.ln(15)
-            
-            # Firmas
-            pdf.set_font('Arial', '', 10)
-            pdf.cell(90, 10, "_________________________", 0, 0, 'C')
-            pdf.cell(20, 10, "", 0, 0)
-            pdf.cell(90, 10, "_________________________", 0, 1, 'C')
-            pdf.cell(90, 5, "Firma del Cliente", 0, 0, 'C')
-            pdf.cell(20, 5, "", 0, 0)
-            pdf.cell(90, 5, "Firma del Técnico", 0, 1, 'C')
-            
-            # Guardar factura
-            factura_path = os.path.join(FACTURAS_DIR, f"Factura_{factura_num}.pdf")
-            pdf.output(factura_path)
-            
-            # Actualizar combos y tablas
-            self.update_delivery_combo()
-            self.update_device_table()
+            with metrics.timed('ui.deliver_device'):
+                # El servicio asigna el número de factura y guarda la entrega
+                device, client = self.service.deliver_device(device_id)
+                
+                factura_path = documents.cached_invoice(device, client)
+                
+                # Actualizar combos y tablas
+                self.update_delivery_combo()
+                self.update_board()
+                self.update_device_table()
             
             QMessageBox.information(self, "Éxito", f"Equipo marcado como entregado. Factura generada en: {factura_path}")
             webbrowser.open(factura_path)
             
+        except ServiceError as e:
+            QMessageBox.warning(self, "Error", str(e))
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo completar la entrega: {str(e)}")
     
-    def get_next_factura_number(self):
-        """Obtiene el próximo número de factura"""
-        # Buscar el último número de factura usado
-        devices = self.load_devices()
-        last_num = 0
-        
-        for device in devices:
-            if 'factura_num' in device and device['factura_num'] > last_num:
-                last_num = device['factura_num']
-        
-        # Si no hay facturas previas, empezar desde un número base
-        if last_num == 0:
-            last_num = 1000  # Número inicial
-        
-        return last_num + 1
-    
+    @metrics.action('ui.generate_report')
     def generate_report(self, report_type):
         """Genera reportes según el tipo especificado con validación"""
         try:
-            devices = self.load_devices()
-            
-            if report_type == "diario":
-                start_date = datetime.now().replace(hour=0, minute=0, second=0)
-                end_date = datetime.now().replace(hour=23, minute=59, second=59)
-            elif report_type == "semanal":
-                start_date = datetime.now() - timedelta(days=datetime.now().weekday())
-                start_date = start_date.replace(hour=0, minute=0, second=0)
-                end_date = start_date + timedelta(days=6)
-                end_date = end_date.replace(hour=23, minute=59, second=59)
-            elif report_type == "mensual":
-                start_date = datetime.now().replace(day=1, hour=0, minute=0, second=0)
-                end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-                end_date = end_date.replace(hour=23, minute=59, second=59)
-            else:  # personalizado
-                start_date = datetime(
-                    self.start_date.date().year(),
-                    self.start_date.date().month(),
-                    self.start_date.date().day(),
-                    0, 0, 0
-                )
-                end_date = datetime(
-                    self.end_date.date().year(),
-                    self.end_date.date().month(),
-                    self.end_date.date().day(),
-                    23, 59, 59
-                )
-            
-            # Filtrar dispositivos por fecha
-            filtered_devices = []
-            for device in devices:
-                try:
-                    date_received = datetime.strptime(device['date_received'], "%Y-%m-%d %H:%M:%S")
-                    if start_date <= date_received <= end_date:
-                        filtered_devices.append(device)
-                except (KeyError, ValueError):
-                    continue
+            start = self.start_date.date()
+            end = self.end_date.date()
+            report = self.service.report(
+                report_type,
+                datetime(start.year(), start.month(), start.day()),
+                datetime(end.year(), end.month(), end.day()))
+            self.report_text.setPlainText(report)
             
-            # Generar reporte
-            report = f"Reporte de {report_type.capitalize()}\n"
-            report += f"Del {start_date.strftime('%d/%m/%Y')} al {end_date.strftime('%d/%m/%Y')}\n"
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo generar el reporte: {str(e)}")
+    
+    @metrics.action('ui.generate_filter_report')
+    def generate_filter_report(self):
+        """Reporte de los equipos que cumplen los filtros elegidos"""
+        start = self.start_date.date()
+        end = self.end_date.date()
+        start = datetime(start.year(), start.month(), start.day())
+        end = datetime(end.year(), end.month(), end.day())
+        dates = self.filter_dates.currentData()
+        cost_min = self.filter_cost_min.value()
+        cost_max = self.filter_cost_max.value()
+        try:
+            device_filter = DeviceFilter(
+                type=self.filter_type.currentText(),
+                brand=self.filter_brand.text(),
+                model=self.filter_model.text(),
+                status=self.filter_status.currentData(),
+                client_id=self.filter_client.selected_client_id(),
+                cost_min=cost_min or None,
+                cost_max=cost_max or None,
+                received_from=start if dates == "received" else None,
+                received_to=end if dates == "received" else None,
+                delivered_from=start if dates == "delivered" else None,
+                delivered_to=end if dates == "delivered" else None)
+            self.report_text.setPlainText(self.service.filter_report(device_filter))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo generar el reporte: {str(e)}")
+    
+    @metrics.action('ui.generate_returns_report')
+    def generate_returns_report(self):
+        """Genera el reporte de las series que más reingresan al taller"""
+        try:
+            report = "Reporte de Reingresos\n"
             report += "="*50 + "\n\n"
             
-            # Resumen
-            total_devices = len(filtered_devices)
-            delivered = sum(1 for d in filtered_devices if d.get('status') == 'Entregado')
-            in_repair = sum(1 for d in filtered_devices if d.get('status') == 'En reparación')
-            total_income = sum(d.get('cost', 0) for d in filtered_devices)
-            
-            report += f"Total de equipos recibidos: {total_devices}\n"
-            report += f"Equipos entregados: {delivered}\n"
-            report += f"Equipos en reparación: {in_repair}\n"
-            report += f"Ingresos totales: ${total_income:.2f}\n\n"
+            repeats = self.service.most_returning()
+            if not repeats:
+                report += "No hay equipos con más de un ingreso.\n"
             
-            # Detalle por equipo
-            report += "Detalle por equipo:\n"
-            report += "-"*50 + "\n"
-            for device in filtered_devices:
-                report += f"ID: {device.get('id', '')} - Cliente: {device.get('client_name', '')}\n"
-                report += f"Equipo: {device.get('type', '')} {device.get('brand', '')} {device.get('model', '')}\n"
-                report += f"Problema: {device.get('issues', '')[:50]}...\n"
-                report += f"Costo: ${device.get('cost', 0):.2f} - Estado: {device.get('status', '')}\n"
-                report += f"Fecha recibido: {device.get('date_received', '')}\n"
-                if device.get('status') == 'Entregado':
-                    report += f"Fecha entregado: {device.get('date_delivered', '')}\n"
-                    report += f"N° Factura: {device.get('factura_num', '')}\n"
+            for serial, devices in repeats:
+                last = devices[-1]
+                report += f"Serie: {serial} - {len(devices)} ingresos\n"
+                report += f"Equipo: {last.type} {last.brand} {last.model} - Cliente: {last.client_name}\n"
+                for device in devices:
+                    report += f"  {self.format_history_entry(device)}\n"
                 report += "-"*50 + "\n"
             
             self.report_text.setPlainText(report)
-            
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo generar el reporte: {str(e)}")
+    
+    @metrics.action('ui.generate_turnaround_report')
+    def generate_turnaround_report(self):
+        """Muestra mediana, p90 y plazo cumplido por tipo, marca y mes de las fechas elegidas"""
+        try:
+            start = self.start_date.date()
+            end = self.end_date.date()
+            report = self.service.turnaround_report(
+                datetime(start.year(), start.month(), start.day()),
+                datetime(end.year(), end.month(), end.day()))
+            self.report_text.setPlainText(report)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo generar el reporte: {str(e)}")
     
@@ -1167,23 +1533,33 @@ class MainWindow(QMainWindow):
             return
         
         try:
-            pdf = PDF()
-            pdf.add_page()
-            pdf.set_font('Arial', '', 12)
-            
-            # Dividir el texto en líneas y agregar al PDF
-            for line in report_text.split('\n'):
-                pdf.cell(0, 10, line, 0, 1)
-            
-            # Guardar PDF
-            report_path = os.path.join(OUTPUT_DIR, f"Reporte_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
-            pdf.output(report_path)
+            report_path = documents.export_report_pdf(report_text)
             
             QMessageBox.information(self, "Éxito", f"Reporte exportado a: {report_path}")
             webbrowser.open(report_path)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo exportar el reporte: {str(e)}")
     
+    def export_invoice_book(self):
+        """Genera un solo PDF con todas las facturas de las fechas elegidas"""
+        start = self.start_date.date()
+        end = self.end_date.date()
+        start = datetime(start.year(), start.month(), start.day())
+        end = datetime(end.year(), end.month(), end.day())
+        try:
+            with metrics.timed('ui.export_invoice_book'):
+                invoices = self.service.invoices_between(start, end)
+                if not invoices:
+                    QMessageBox.warning(self, "Advertencia", "No hay facturas en esas fechas")
+                    return
+                book_path = documents.render_invoice_book(invoices, start, end)
+            
+            QMessageBox.information(self, "Éxito",
+                                    f"Libro con {len(invoices)} facturas guardado en: {book_path}")
+            webbrowser.open(book_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"No se pudo generar el libro de facturas: {str(e)}")
+    
     def send_receipt_email(self):
         """Envía el recibo por email con validación"""
         device_id = self.receipt_device.currentData()
@@ -1191,18 +1567,16 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Seleccione un equipo primero")
             return
         
-        devices = self.load_devices()
-        device = next((d for d in devices if d['id'] == device_id), None)
+        device = self.service.get_device(device_id)
         
         if not device:
             QMessageBox.warning(self, "Error", "Equipo no encontrado")
             return
         
         # Obtener datos del cliente
-        clients = self.load_clients()
-        client = next((c for c in clients if c['id'] == device['client_id']), None)
+        client = self.service.get_client(device.client_id)
         
-        if not client or not client.get('email'):
+        if not client or not client.email:
             QMessageBox.warning(self, "Error", "No hay email del cliente registrado")
             return
         
@@ -1210,36 +1584,35 @@ class MainWindow(QMainWindow):
             # Crear mensaje
             msg = MIMEMultipart()
             msg['From'] = EMAIL_CONFIG['email']
-            msg['To'] = client['email']
+            msg['To'] = client.email
             msg['Subject'] = f"Recibo de reparación #{device_id}"
             
             # Cuerpo del mensaje
             body = f"""
-            Estimado {client.get('name', 'Cliente')},
+            Estimado {client.name or 'Cliente'},
             
             Adjunto encontrará el recibo por la reparación de su equipo:
             
-            Equipo: {device.get('type', '')} {device.get('brand', '')}
-            Modelo: {device.get('model', '')}
-            Problema: {device.get('issues', '')}
-            Costo total: ${device.get('cost', 0):.2f}
-            Anticipo: ${device.get('advance', 0):.2f}
-            Saldo pendiente: ${device.get('cost', 0) - device.get('advance', 0):.2f}
+            Equipo: {device.type} {device.brand}
+            Modelo: {device.model}
+            Problema: {device.issues}
+            Costo total: ${device.cost:.2f}
+            Anticipo: ${device.advance:.2f}
+            Saldo pendiente: ${device.balance:.2f}
             
             Gracias por su preferencia.
             """
             msg.attach(MIMEText(body, 'plain'))
             
-            # Adjuntar recibo
-            receipt_path = os.path.join(OUTPUT_DIR, f"Recibo_{device_id}.pdf")
-            if os.path.exists(receipt_path):
-                with open(receipt_path, "rb") as attachment:
-                    part = MIMEApplication(attachment.read(), Name=os.path.basename(receipt_path))
-                part['Content-Disposition'] = f'attachment; filename="{os.path.basename(receipt_path)}"'
-                msg.attach(part)
+            # Adjuntar recibo (se regenera si los datos cambiaron desde la última vez)
+            receipt_path = documents.cached_receipt(device, client)
+            with open(receipt_path, "rb") as attachment:
+                part = MIMEApplication(attachment.read(), Name=os.path.basename(receipt_path))
+            part['Content-Disposition'] = f'attachment; filename="{os.path.basename(receipt_path)}"'
+            msg.attach(part)
             
             # Enviar email
-            with smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port']) as server:
+            with metrics.timed('smtp.send'), smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port']) as server:
                 server.starttls()
                 server.login(EMAIL_CONFIG['email'], EMAIL_CONFIG['password'])
                 server.send_message(msg)
@@ -1255,49 +1628,59 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Seleccione un equipo primero")
             return
         
-        devices = self.load_devices()
-        device = next((d for d in devices if d['id'] == device_id), None)
+        device = self.service.get_device(device_id)
         
         if not device:
             QMessageBox.warning(self, "Error", "Equipo no encontrado")
             return
         
         # Obtener datos del cliente
-        clients = self.load_clients()
-        client = next((c for c in clients if c['id'] == device['client_id']), None)
+        client = self.service.get_client(device.client_id)
         
-        if not client or not client.get('phone'):
+        if not client or not client.phone:
             QMessageBox.warning(self, "Error", "No hay teléfono del cliente registrado")
             return
         
         try:
-            phone = client['phone'].strip().replace('+', '').replace(' ', '')
-            message = f"Estimado {client.get('name', 'Cliente')}, aquí está su recibo de reparación. Gracias por su preferencia."
+            # WhatsApp Web no recibe adjuntos: se deja listo el recibo al día para arrastrarlo al chat
+            receipt_path = documents.cached_receipt(device, client)
+            phone = client.phone.strip().replace('+', '').replace(' ', '')
+            message = f"Estimado {client.name or 'Cliente'}, aquí está su recibo de reparación. Gracias por su preferencia."
             whatsapp_url = f"https://wa.me/{phone}?text={message}"
-            webbrowser.open(whatsapp_url)
+            with metrics.timed('ui.open_whatsapp'):
+                webbrowser.open(whatsapp_url)
+            QMessageBox.information(self, "WhatsApp", f"Adjunte en el chat el recibo: {receipt_path}")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo abrir WhatsApp: {str(e)}")
     
     def create_backup(self):
         """Crea una copia de seguridad de los datos"""
-        try:
-            import zipfile
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = os.path.join(BACKUP_DIR, f"backup_{timestamp}.zip")
-            
-            with zipfile.ZipFile(backup_file, 'w') as zipf:
-                for root, dirs, files in os.walk(DATABASE_DIR):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, DATABASE_DIR)
-                        zipf.write(file_path, arcname)
-            
-            QMessageBox.information(self, "Éxito", f"Backup creado en: {backup_file}")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"No se pudo crear el backup: {str(e)}")
+        if isinstance(self.service, RemoteService):
+            QMessageBox.warning(self, "Advertencia", "En modo cliente los backups se crean en el servidor")
+            return
+        
+        # Se arma en el hilo de backups; la ventana sigue respondiendo mientras tanto
+        self.backup_scheduler.request(self.backup_finished.emit)
+        self.statusBar().showMessage("Creando backup...")
+    
+    def on_backup_finished(self, backup_file, error):
+        """Avisa cómo terminó el backup pedido desde el menú"""
+        self.statusBar().clearMessage()
+        if error:
+            QMessageBox.critical(self, "Error", f"No se pudo crear el backup: {error}")
+        else:
+            QMessageBox.information(self, "Éxito", f"Backup creado y verificado en: {backup_file}")
+    
+    def show_backup_catalog(self):
+        """Muestra los backups hechos con su tamaño, duración y verificación"""
+        BackupCatalogDialog(self).exec_()
     
     def restore_backup(self):
         """Restaura los datos desde una copia de seguridad"""
+        if isinstance(self.service, RemoteService):
+            QMessageBox.warning(self, "Advertencia", "En modo cliente los backups se restauran en el servidor")
+            return
+        
         options = QFileDialog.Options()
         backup_file, _ = QFileDialog.getOpenFileName(
             self, "Seleccionar archivo de backup", 
@@ -1307,31 +1690,46 @@ class MainWindow(QMainWindow):
             return
         
         try:
-            import zipfile
-            # Eliminar archivos actuales
-            for filename in os.listdir(DATABASE_DIR):
-                file_path = os.path.join(DATABASE_DIR, filename)
-                try:
-                    if os.path.isfile(file_path):
-                        os.unlink(file_path)
-                except Exception as e:
-                    print(f"No se pudo eliminar {file_path}: {e}")
-            
-            # Extraer backup
-            with zipfile.ZipFile(backup_file, 'r') as zipf:
-                zipf.extractall(DATABASE_DIR)
-            
-            # Actualizar interfaces
-            self.update_client_table()
-            self.update_device_table()
-            self.update_client_combo()
-            self.update_receipt_combo()
-            self.update_delivery_combo()
+            with metrics.timed('ui.restore_backup'):
+                backups.restore_backup(backup_file)
+                
+                # Actualizar interfaces
+                self.service.reload()
+                self.update_client_table()
+                self.update_device_table()
+                self.update_client_combo()
+                self.update_receipt_combo()
+                self.update_delivery_combo()
+                self.update_board()
             
             QMessageBox.information(self, "Éxito", "Backup restaurado correctamente")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"No se pudo restaurar el backup: {str(e)}")
     
+    def import_data(self):
+        """Importa clientes o equipos desde una hoja de cálculo"""
+        if isinstance(self.service, RemoteService):
+            QMessageBox.warning(self, "Advertencia", "En modo cliente la importación se hace en el servidor")
+            return
+        
+        dialog = ImportDialog(self.service, self)
+        dialog.exec_()
+        
+        # Actualizar interfaces
+        self.update_client_table()
+        self.update_device_table()
+        self.update_client_combo()
+        self.update_receipt_combo()
+        self.update_delivery_combo()
+        self.update_board()
+    
+    def show_diagnostics(self):
+        """Muestra los tiempos de las operaciones (no modal, para seguir usando la ventana)"""
+        if getattr(self, 'diagnostics_dialog', None) is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self)
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+    
     def show_about(self):
         """Muestra el diálogo Acerca de"""
         dialog = AboutDialog()
@@ -1346,6 +1744,7 @@ if __name__ == "__main__":
         pass
     
     app = QApplication(sys.argv)
+    metrics.enable_log(METRICS_LOG)
     
     if not os.path.exists(LOGO_PATH):
         from PIL import Image, ImageDraw
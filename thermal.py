@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Tickets de recepción para impresoras térmicas ESC/POS (58 u 80 mm).
+
+Imprimir el recibo en PDF obliga a dibujar una hoja A4, generar el QR como
+imagen y abrir el visor. Para el mostrador alcanza con un ticket: aquí se
+arma directamente la secuencia de bytes ESC/POS, con los mismos datos del
+recibo PDF y el QR de pago dibujado por la propia impresora (comando
+``GS ( k``), y se manda a ``[Impresora] destino`` de settings.ini:
+
+- ``tcp://192.168.1.50:9100``: impresora de red (puerto 9100 por defecto)
+- ``unix:///run/impresora.sock``: socket local de un servicio de impresión
+- cualquier otra cosa es un archivo: ``/dev/usb/lp0``, ``COM3``,
+  ``\\\\PC\\Termica`` o un ``.bin`` para probar sin impresora. Los tickets se
+  agregan al final, como en el rollo.
+
+No usa fpdf, qrcode ni Pillow.
+"""
+
+import os
+import socket
+import textwrap
+
+import metrics
+import storage
+from records import PAYMENT_URL
+
+# Caracteres por línea con la fuente A (12x24 puntos)
+COLUMNS = {58: 32, 80: 48}
+DEFAULT_WIDTH = 80
+DEFAULT_PORT = 9100
+SEND_TIMEOUT = 5
+
+# Página de códigos PC850 (multilingüe): tiene las letras acentuadas, la ñ y el °
+CODEPAGE = 2
+ENCODING = 'cp850'
+
+ESC = b'\x1b'
+GS = b'\x1d'
+INIT = ESC + b'@'
+ALIGN_LEFT = ESC + b'a\x00'
+ALIGN_CENTER = ESC + b'a\x01'
+BOLD_ON = ESC + b'E\x01'
+BOLD_OFF = ESC + b'E\x00'
+# Doble alto y negrita; ESC ! también pisa la negrita de ESC E
+TITLE = ESC + b'!\x18'
+NORMAL_SIZE = ESC + b'!\x00'
+# Avanza el papel lo necesario y corta (corte parcial)
+FEED_AND_CUT = GS + b'V\x42\x03'
+
+
+class PrinterError(Exception):
+    """No hay impresora configurada o no se le pudo mandar el ticket"""
+
+
+class PrinterOptions:
+    """Ajustes de ``[Impresora]`` en settings.ini"""
+
+    __slots__ = ('destination', 'width')
+
+    def __init__(self, destination='', width=DEFAULT_WIDTH):
+        self.destination = destination
+        self.width = width if width in COLUMNS else DEFAULT_WIDTH
+
+    @classmethod
+    def from_settings(cls):
+        settings = storage.load_settings()
+        return cls(destination=settings.get('Impresora', 'destino', fallback='').strip(),
+                   width=settings.getint('Impresora', 'ancho', fallback=DEFAULT_WIDTH))
+
+
+def _text(value):
+    return str(value).encode(ENCODING, errors='replace')
+
+
+def _line(text=''):
+    return _text(text) + b'\n'
+
+
+def _wrapped(text, columns, indent=''):
+    """Párrafos de ``text`` cortados en palabras para que entren en el ancho"""
+    lines = []
+    for paragraph in str(text).splitlines() or ['']:
+        lines.extend(textwrap.wrap(paragraph, columns, initial_indent=indent,
+                                   subsequent_indent=indent) or [''])
+    return b''.join(_line(line) for line in lines)
+
+
+def _field(label, value, columns):
+    return _wrapped(f"{label} {value}", columns)
+
+
+def _amount(label, value, columns):
+    """``label`` a la izquierda y el monto alineado a la derecha"""
+    amount = f"${value:.2f}"
+    return _line(label[:columns - len(amount) - 1].ljust(columns - len(amount)) + amount)
+
+
+def qr_code(data, module_size=6):
+    """Comandos ``GS ( k`` para que la impresora dibuje el QR (modelo 2, corrección M)"""
+    payload = data.encode('ascii', errors='replace')
+    size = len(payload) + 3
+
+    def command(function, parameters):
+        length = len(parameters) + 2
+        return GS + b'(k' + bytes((length & 0xFF, length >> 8, 49, function)) + parameters
+
+    return (command(65, b'\x32\x00')                   # modelo 2
+            + command(67, bytes((module_size,)))       # tamaño del módulo en puntos
+            + command(69, b'\x31')                     # corrección de errores M
+            + GS + b'(k' + bytes((size & 0xFF, size >> 8, 49, 80, 48)) + payload
+            + command(81, b'\x30'))                    # imprimir lo guardado
+
+
+def render_receipt(device, client, width=DEFAULT_WIDTH):
+    """Bytes ESC/POS del ticket de recepción de un equipo"""
+    columns = COLUMNS.get(width, COLUMNS[DEFAULT_WIDTH])
+    rule = _line('-' * columns)
+    received = device.date_received.strftime("%d/%m/%Y %H:%M") if device.date_received else ''
+
+    out = [INIT, ESC + b't' + bytes((CODEPAGE,)),
+           ALIGN_CENTER, BOLD_ON, _line("CONTROL DE REPARACIONES"),
+           TITLE, _line("RECIBO DE REPARACIÓN"), NORMAL_SIZE, BOLD_OFF,
+           _line(f"Equipo N° {device.id}"), ALIGN_LEFT, rule,
+           _field("Cliente:", client.name, columns),
+           _field("Teléfono:", client.phone, columns),
+           _field("Fecha:", received, columns),
+           rule, BOLD_ON, _line("Detalles del Equipo"), BOLD_OFF,
+           _field("Tipo:", device.type, columns),
+           _field("Marca:", device.brand, columns),
+           _field("Modelo:", device.model, columns),
+           _field("N° Serie:", device.serial, columns),
+           _line("Problemas reportados:"),
+           _wrapped(device.issues, columns, indent='  '),
+           rule, BOLD_ON, _line("Resumen Financiero"), BOLD_OFF,
+           _amount("Costo total de reparación", device.cost, columns),
+           _amount("Anticipo recibido", device.advance, columns),
+           BOLD_ON, _amount("Saldo pendiente", device.balance, columns), BOLD_OFF,
+           rule, ALIGN_CENTER,
+           qr_code(PAYMENT_URL.format(device.balance), 6 if width == 58 else 8),
+           ALIGN_LEFT,
+           _wrapped("Nota: Este recibo es válido como comprobante de entrega del equipo. "
+                    "El pago pendiente debe ser cancelado al retirar el equipo.", columns),
+           FEED_AND_CUT]
+    return b''.join(out)
+
+
+def send(data, destination, timeout=SEND_TIMEOUT):
+    """Manda ``data`` a la impresora; PrinterError si no se puede"""
+    if not destination:
+        raise PrinterError("No hay impresora térmica configurada ([Impresora] destino en settings.ini)")
+    try:
+        if destination.startswith('tcp://'):
+            host, _, port = destination[len('tcp://'):].rstrip('/').partition(':')
+            with socket.create_connection((host, int(port or DEFAULT_PORT)), timeout) as connection:
+                connection.sendall(data)
+        elif destination.startswith('unix://'):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.settimeout(timeout)
+                connection.connect(destination[len('unix://'):])
+                connection.sendall(data)
+        else:
+            with open(os.path.expanduser(destination), 'ab') as f:
+                f.write(data)
+    except (OSError, ValueError, AttributeError) as e:
+        # AttributeError: unix:// en un sistema sin AF_UNIX
+        raise PrinterError(f"No se pudo imprimir en {destination}: {e}")
+
+
+@metrics.timed('escpos.receipt')
+def print_receipt(device, client, options=None):
+    """Imprime el ticket de recepción; devuelve el destino usado"""
+    options = options or PrinterOptions.from_settings()
+    send(render_receipt(device, client, options.width), options.destination)
+    return options.destination
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Tiempos de reparación (del ingreso a la entrega) agregados por mes, tipo y marca.
+
+Calcular medianas recorriendo todo el historial se vuelve lento con los
+años, así que cada entrega suma su tiempo a histogramas guardados en
+database/tiempos.json: uno por mes de entrega y, dentro de cada mes, uno por
+tipo de equipo y otro por marca. El reporte de un periodo solo junta los
+histogramas de sus meses. Cada mes guarda además sus equipos más lentos, y
+cada tipo o marca el más lento.
+
+Los histogramas usan intervalos logarítmicos (20 por década, unos 12% de
+ancho, como los de metrics): la mediana y el p90 son aproximados, con ese
+margen. ``last_factura`` tiene la factura más alta ya contada de cada
+sucursal (ver storage.BRANCH_BLOCK); los equipos entregados con un número
+mayor en su bloque todavía no se sumaron.
+"""
+
+import heapq
+import math
+
+import storage
+
+BUCKETS_PER_DECADE = 20
+MIN_HOURS = 0.1
+# Equipos más lentos que se guardan por mes y por cada tipo o marca de un mes
+SLOWEST_KEPT = 10
+GROUP_SLOWEST_KEPT = 1
+TARGET_DAYS = 3
+
+NO_TYPE = "(sin tipo)"
+NO_BRAND = "(sin marca)"
+
+
+def target_days():
+    """Plazo de entrega comprometido, de ``[Tiempos] objetivo_dias`` en settings.ini"""
+    return storage.load_settings().getfloat('Tiempos', 'objetivo_dias', fallback=TARGET_DAYS)
+
+
+def turnaround_hours(device):
+    """Horas entre el ingreso y la entrega, o None si el equipo no se entregó"""
+    if device.date_received is None or device.date_delivered is None:
+        return None
+    return max((device.date_delivered - device.date_received).total_seconds() / 3600, 0.0)
+
+
+def month_key(date):
+    return f"{date.year:04d}-{date.month:02d}"
+
+
+def type_key(device):
+    return ' '.join(device.type.split()) or NO_TYPE
+
+
+def brand_key(device):
+    # "samsung" y "Samsung " son la misma marca
+    return ' '.join(device.brand.split()).upper() or NO_BRAND
+
+
+def device_label(device):
+    return f"{device.type} {device.brand} {device.model} - {device.client_name}"
+
+
+class Sketch:
+    """Histograma de horas con cantidad, total, máximo y los equipos más lentos"""
+
+    __slots__ = ('count', 'total', 'max', 'buckets', 'slowest', 'keep')
+
+    def __init__(self, keep=SLOWEST_KEPT):
+        self.keep = keep
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+        self.slowest = []     # [horas, id, descripción], de mayor a menor
+
+    @staticmethod
+    def bucket(hours):
+        if hours <= MIN_HOURS:
+            return 0
+        return int(math.log10(hours / MIN_HOURS) * BUCKETS_PER_DECADE)
+
+    @staticmethod
+    def bucket_value(bucket):
+        """Centro geométrico del intervalo"""
+        return MIN_HOURS * 10 ** ((bucket + 0.5) / BUCKETS_PER_DECADE)
+
+    def add(self, hours, device_id, label):
+        self.count += 1
+        self.total += hours
+        self.max = max(self.max, hours)
+        bucket = self.bucket(hours)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        if len(self.slowest) < self.keep or hours > self.slowest[-1][0]:
+            self._keep_slowest(self.slowest + [[hours, device_id, label]])
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self._keep_slowest(self.slowest + other.slowest)
+
+    def _keep_slowest(self, entries):
+        self.slowest = heapq.nlargest(self.keep, entries, key=lambda e: (e[0], e[1]))
+
+    def percentile(self, p):
+        """Horas por debajo de las cuales queda el ``p``% de los equipos"""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.bucket_value(bucket), self.max)
+        return self.max
+
+    def fraction_within(self, hours):
+        """Proporción aproximada de equipos entregados en ``hours`` horas o menos"""
+        if not self.count:
+            return 0.0
+        limit = self.bucket(hours)
+        return sum(n for b, n in self.buckets.items() if b <= limit) / self.count
+
+    def to_dict(self):
+        return {'n': self.count, 'sum': round(self.total, 3), 'max': round(self.max, 3),
+                'b': {str(b): n for b, n in sorted(self.buckets.items())},
+                'lentos': self.slowest}
+
+    @classmethod
+    def from_dict(cls, data, keep=SLOWEST_KEPT):
+        sketch = cls(keep)
+        sketch.count = int(data.get('n', 0))
+        sketch.total = float(data.get('sum', 0.0))
+        sketch.max = float(data.get('max', 0.0))
+        sketch.buckets = {int(b): int(n) for b, n in data.get('b', {}).items()}
+        sketch.slowest = [list(e) for e in data.get('lentos', [])]
+        return sketch
+
+
+class TurnaroundStats:
+    """Histogramas de tiempos por mes de entrega: ``months[AAAA-MM]`` tiene
+    'total', 'tipo' {tipo: Sketch} y 'marca' {marca: Sketch}"""
+
+    def __init__(self):
+        self.months = {}
+        self.last_factura = {}    # sucursal -> factura más alta contada
+
+    @classmethod
+    def build(cls, devices):
+        """Estadísticas calculadas desde cero con todos los equipos"""
+        stats = cls()
+        for device in devices:
+            stats.add(device)
+        return stats
+
+    def add(self, device):
+        """Suma un equipo entregado; devuelve False si no tiene las dos fechas"""
+        hours = turnaround_hours(device)
+        if hours is None:
+            return False
+        month = self.months.get(month_key(device.date_delivered))
+        if month is None:
+            month = self.months[month_key(device.date_delivered)] = {
+                'total': Sketch(), 'tipo': {}, 'marca': {}}
+        label = device_label(device)
+        month['total'].add(hours, device.id, label)
+        for group, key in (('tipo', type_key(device)), ('marca', brand_key(device))):
+            sketch = month[group].get(key)
+            if sketch is None:
+                sketch = month[group][key] = Sketch(GROUP_SLOWEST_KEPT)
+            sketch.add(hours, device.id, label)
+        branch = storage.branch_of(device.factura_num)
+        self.last_factura[branch] = max(self.last_factura.get(branch, 0), device.factura_num)
+        return True
+
+    def add_new(self, devices):
+        """Suma los equipos entregados con factura posterior a la última contada de su sucursal"""
+        last = self.last_factura
+        added = False
+        for device in devices:
+            if (device.status == "Entregado"
+                    and device.factura_num > last.get(storage.branch_of(device.factura_num), 0)):
+                added = self.add(device) or added
+        return added
+
+    def summary(self, start, end):
+        """Totales del periodo: (total, {tipo: Sketch}, {marca: Sketch}, {mes: Sketch}).
+
+        Se incluyen los meses completos entre ``start`` y ``end``.
+        """
+        first, last = month_key(start), month_key(end)
+        total = Sketch()
+        by_type, by_brand, by_month = {}, {}, {}
+        for key in sorted(self.months):
+            if not first <= key <= last:
+                continue
+            month = self.months[key]
+            total.merge(month['total'])
+            by_month.setdefault(key, Sketch()).merge(month['total'])
+            for group, result in (('tipo', by_type), ('marca', by_brand)):
+                for name, sketch in month[group].items():
+                    result.setdefault(name, Sketch(GROUP_SLOWEST_KEPT)).merge(sketch)
+        return total, by_type, by_brand, by_month
+
+    def to_dict(self):
+        return {'last_factura': {str(b): n for b, n in sorted(self.last_factura.items())},
+                'months': {key: {'total': month['total'].to_dict(),
+                                 'tipo': {k: s.to_dict() for k, s in month['tipo'].items()},
+                                 'marca': {k: s.to_dict() for k, s in month['marca'].items()}}
+                           for key, month in sorted(self.months.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        last = data.get('last_factura', {})
+        if not isinstance(last, dict):
+            # Versión anterior: un solo número, de antes de las sucursales
+            last = {0: last}
+        stats.last_factura = {int(b): int(n) for b, n in last.items()}
+        for key, month in data.get('months', {}).items():
+            stats.months[key] = {
+                'total': Sketch.from_dict(month.get('total', {})),
+                'tipo': {k: Sketch.from_dict(s, GROUP_SLOWEST_KEPT)
+                         for k, s in month.get('tipo', {}).items()},
+                'marca': {k: Sketch.from_dict(s, GROUP_SLOWEST_KEPT)
+                          for k, s in month.get('marca', {}).items()}}
+        return stats